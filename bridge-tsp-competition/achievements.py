@@ -1,117 +1,235 @@
-from core import get_supabase_client
-
-supabase = get_supabase_client()
-
-# Badge definitions: (badge_type, badge_label, description, check_function)
-BADGE_EMOJI = {
-    'first_trade': '🎯',
-    'streak_5': '🔥',
-    'streak_10': '💥',
-    'trades_50': '⚔️',
-    'trades_100': '🤖',
-    'profit_1000': '💰',
-    'win_rate_70': '🎯',
-    'low_dd_5': '🛡️',
-    'best_day': '🏆',
-}
-
-
-def _upsert_badge(participant_id: str, badge_type: str, badge_label: str, description: str):
-    """Insert a badge if it doesn't already exist (unique constraint handles duplicates)."""
+"""
+Achievements - badge catalog evaluated over the whole field
+
+Badges are declared in badges.json (type, label, emoji, conditions, minimum trades,
+optional top-N ranking) and evaluated after each sync cycle over a participant x
+metric matrix in one vectorized pass (see rule_engine). Evaluation is not edge
+triggered: anyone who currently meets a badge gets it, so a badge added to the
+catalog is awarded retroactively on the next cycle, or at once across the whole
+field with:
+
+    python achievements.py --backfill [--dry-run]
+"""
+import os
+import json
+import argparse
+import numpy as np
+from datetime import datetime
+import rule_engine
+from core import get_supabase_client, iter_rows
+from period_stats import current_rows, fetch_period_stats, period_start
+from tz_config import THAILAND_TZ
+
+BADGES_FILE = os.getenv("BADGES_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "badges.json"))
+
+# (participant_id, badge_type) pairs already in the achievements table, loaded once
+_awarded = None
+# (participant_id, badge_type) -> badge row earned this cycle, written by flush_achievements()
+_pending = {}
+
+_catalog_cache = {'mtime': None, 'compiled': None}
+
+
+def _load_catalog():
+    """Compile the badge catalog, reloading only when the file changes"""
     try:
-        supabase.table('achievements').upsert({
-            'participant_id': participant_id,
-            'badge_type': badge_type,
-            'badge_label': badge_label,
-            'description': description,
-        }, on_conflict='participant_id,badge_type').execute()
+        mtime = os.path.getmtime(BADGES_FILE)
+        if mtime != _catalog_cache['mtime']:
+            with open(BADGES_FILE, encoding='utf-8') as f:
+                badges = json.load(f).get('badges', [])
+            _catalog_cache['compiled'] = compile_catalog(badges)
+            _catalog_cache['mtime'] = mtime
+            print(f"[Achievements] Loaded {len(badges)} badges from {BADGES_FILE}")
     except Exception as e:
-        print(f"[Achievements] Error upserting badge '{badge_type}': {e}")
+        print(f"[Achievements] Error loading badge catalog: {e}")
+    return _catalog_cache['compiled']
+
+
+def compile_catalog(badges: list) -> dict:
+    """
+    Flatten badge conditions into parallel arrays: condition c tests
+    metric_idx[c] <op[c]> value[c] and belongs to badge membership[c].
+    min_trades becomes one more condition on total_trades.
+    """
+    conditions = []
+    for b, badge in enumerate(badges):
+        for cond in badge.get('conditions', []):
+            conditions.append((b, cond['metric'], cond.get('op', '>='), rule_engine.resolve_value(cond['value'])))
+        if badge.get('min_trades'):
+            conditions.append((b, 'total_trades', '>=', float(badge['min_trades'])))
+
+    metrics = []
+    for name in [c[1] for c in conditions] + [b['rank_by'] for b in badges if b.get('top')]:
+        if name not in metrics:
+            metrics.append(name)
+
+    membership = np.zeros((len(conditions), len(badges)), dtype=np.int64)
+    for c, cond in enumerate(conditions):
+        membership[c, cond[0]] = 1
+
+    top_idx = [b for b, badge in enumerate(badges) if badge.get('top')]
+    return {
+        'badges': badges,
+        'metrics': metrics,
+        'metric_idx': np.array([metrics.index(c[1]) for c in conditions], dtype=np.int64),
+        'op': np.array([rule_engine.OPS.index(c[2]) for c in conditions], dtype=np.int64),
+        'value': np.array([c[3] for c in conditions], dtype=float),
+        'membership': membership,
+        'n_conditions': membership.sum(axis=0),
+        'top_idx': np.array(top_idx, dtype=np.int64),
+        'top_n': np.array([int(badges[b]['top']) for b in top_idx], dtype=np.int64),
+        'rank_idx': np.array([metrics.index(badges[b]['rank_by']) for b in top_idx], dtype=np.int64),
+    }
+
+
+def evaluate_catalog(compiled: dict, rows: dict):
+    """
+    Evaluate every badge for every participant in one pass.
+
+    Args:
+        rows: participant_id -> metrics dict
+
+    Returns:
+        (participant ids, N x B bool matrix of badges currently earned)
+    """
+    pids, table = rule_engine.build_table(rows, compiled['metrics'])
+    n = len(pids)
+
+    cond = rule_engine.compare(table[:, compiled['metric_idx']], compiled['op'], compiled['value'])
+    earned = cond.astype(np.int64) @ compiled['membership'] == compiled['n_conditions']
+
+    # Top-N badges: rank the eligible participants by the badge's metric (ties keep field order)
+    top_idx = compiled['top_idx']
+    if n and len(top_idx):
+        scores = np.where(earned[:, top_idx], table[:, compiled['rank_idx']], -np.inf)
+        ranks = np.argsort(np.argsort(-scores, axis=0, kind='stable'), axis=0, kind='stable')
+        earned[:, top_idx] &= ranks < compiled['top_n']
+
+    return pids, earned
+
+
+def _field_metrics(stats_by_pid: dict, from_cache: bool = True) -> dict:
+    """Stats plus period metrics (day_profit, week_points) from today's rollups"""
+    today = datetime.now(THAILAND_TZ).date()
+    fetch = current_rows if from_cache else fetch_period_stats
+    day_rows = fetch('day', period_start('day', today))
+    week_rows = fetch('week', period_start('week', today))
+    return {
+        pid: {
+            **stats,
+            'day_profit': float(day_rows.get(pid, {}).get('profit') or 0),
+            'week_points': float(week_rows.get(pid, {}).get('points') or 0),
+        }
+        for pid, stats in stats_by_pid.items()
+    }
+
+
+def _load_awarded() -> set:
+    """Read every awarded (participant, badge) pair once; afterwards the set is kept up to date in memory."""
+    global _awarded
+    if _awarded is None:
+        rows = iter_rows('achievements', 'participant_id, badge_type', keys=('participant_id', 'badge_type'))
+        _awarded = {(row['participant_id'], row['badge_type']) for row in rows}
+        print(f"[Achievements] Loaded {len(_awarded)} awarded badges")
+    return _awarded
+
+
+def _has_badge(participant_id: str, badge_type: str) -> bool:
+    key = (participant_id, badge_type)
+    return key in _load_awarded() or key in _pending
 
 
-def check_achievements(participant_id: str, stats_data: dict):
-    """Check and award badges based on the latest stats_data dict from sync_participant."""
+def _upsert_badge(participant_id: str, badge_type: str, badge_label: str, description: str):
+    """Queue a badge for the next flush unless the participant already has it."""
+    if _has_badge(participant_id, badge_type):
+        return
+    _pending[(participant_id, badge_type)] = {
+        'participant_id': participant_id,
+        'badge_type': badge_type,
+        'badge_label': badge_label,
+        'description': description,
+    }
+
+
+def flush_achievements() -> list:
+    """
+    Write all badges earned this cycle in a single upsert. Call once per cycle after
+    check_badges.
+
+    Returns:
+        New badge events (badge row + emoji), for notifications.
+    """
+    if not _pending:
+        return []
+
+    supabase = get_supabase_client()
+    rows = list(_pending.values())
     try:
-        total_trades = stats_data.get('total_trades', 0)
-        profit = stats_data.get('profit', 0)
-        win_rate = stats_data.get('win_rate', 0)
-        max_drawdown = stats_data.get('max_drawdown', 0)
-        max_consecutive_wins = stats_data.get('max_consecutive_wins', 0)
-
-        # first_trade - Completed first trade
-        if total_trades >= 1:
-            _upsert_badge(participant_id, 'first_trade', 'First Blood',
-                          'Completed your first trade')
-
-        # streak_5 - 5 consecutive wins
-        if max_consecutive_wins >= 5:
-            _upsert_badge(participant_id, 'streak_5', 'Hot Streak',
-                          '5 consecutive winning trades')
-
-        # streak_10 - 10 consecutive wins
-        if max_consecutive_wins >= 10:
-            _upsert_badge(participant_id, 'streak_10', 'Unstoppable',
-                          '10 consecutive winning trades')
-
-        # trades_50 - 50+ total trades
-        if total_trades >= 50:
-            _upsert_badge(participant_id, 'trades_50', 'Veteran Trader',
-                          'Completed 50+ trades')
-
-        # trades_100 - 100+ total trades
-        if total_trades >= 100:
-            _upsert_badge(participant_id, 'trades_100', 'Trading Machine',
-                          'Completed 100+ trades')
-
-        # profit_1000 - $1000+ total profit
-        if profit >= 1000:
-            _upsert_badge(participant_id, 'profit_1000', 'Grand Profit',
-                          'Earned $1,000+ in total profit')
-
-        # win_rate_70 - 70%+ win rate with 20+ trades
-        if win_rate >= 70 and total_trades >= 20:
-            _upsert_badge(participant_id, 'win_rate_70', 'Sharpshooter',
-                          '70%+ win rate with 20+ trades')
-
-        # low_dd_5 - Max drawdown under 5% with 20+ trades
-        if 0 <= max_drawdown < 5 and total_trades >= 20:
-            _upsert_badge(participant_id, 'low_dd_5', 'Risk Master',
-                          'Max drawdown under 5% with 20+ trades')
-
-        # best_day - Best single-day profit in competition
-        _check_best_day(participant_id, stats_data)
-
-        print(f"[Achievements] Checked badges for participant {participant_id}")
-
+        supabase.table('achievements').upsert(rows, on_conflict='participant_id,badge_type').execute()
     except Exception as e:
-        print(f"[Achievements] Error checking achievements: {e}")
-
-
-def _check_best_day(participant_id: str, stats_data: dict):
-    """Award 'best_day' badge to the participant with the highest single-day profit."""
+        # Keep the queue; the next cycle retries
+        print(f"[Achievements] Error upserting {len(rows)} badge(s): {e}")
+        return []
+
+    _awarded.update(_pending)
+    _pending.clear()
+    print(f"[Achievements] Awarded {len(rows)} new badge(s)")
+    compiled = _catalog_cache['compiled'] or {'badges': []}
+    emoji = {badge['type']: badge.get('emoji', '🏅') for badge in compiled['badges']}
+    return [{**row, 'emoji': emoji.get(row['badge_type'], '🏅')} for row in rows]
+
+
+def check_badges(stats_by_pid: dict, from_cache: bool = True) -> int:
+    """
+    Queue every catalog badge the field currently meets (see flush_achievements).
+
+    Args:
+        stats_by_pid: participant_id -> stats_data (this cycle's in-memory stats)
+        from_cache: read today's rollups from period_stats' write cache instead of Supabase
+
+    Returns:
+        Number of badges newly queued
+    """
+    if not stats_by_pid:
+        return 0
     try:
-        best_trade = stats_data.get('best_trade', 0)
-        if best_trade <= 0:
-            return
-
-        # Get today's date
-        today = stats_data.get('date')
-        if not today:
-            return
-
-        # Find the best single-day profit across ALL participants for today
-        result = supabase.table('daily_stats') \
-            .select('participant_id, profit') \
-            .eq('date', today) \
-            .order('profit', desc=True) \
-            .limit(1) \
-            .execute()
-
-        if result.data and len(result.data) > 0:
-            top = result.data[0]
-            if top['participant_id'] == participant_id and top['profit'] > 0:
-                _upsert_badge(participant_id, 'best_day', 'Day Champion',
-                              'Best single-day profit in the competition')
+        compiled = _load_catalog()
+        if not compiled or not compiled['badges']:
+            return 0
+
+        pids, earned = evaluate_catalog(compiled, _field_metrics(stats_by_pid, from_cache))
+        queued = len(_pending)
+        for i, b in zip(*np.nonzero(earned)):
+            badge = compiled['badges'][b]
+            _upsert_badge(pids[i], badge['type'], badge['label'], badge['description'])
+        return len(_pending) - queued
 
     except Exception as e:
-        print(f"[Achievements] Error checking best_day: {e}")
+        print(f"[Achievements] Error checking badges: {e}")
+        return 0
+
+
+def backfill(dry_run: bool = False):
+    """Evaluate the catalog over every participant's latest stats and award what is missing"""
+    stats_by_pid = {row['participant_id']: row for row in iter_rows('latest_daily_stats', '*', keys=('participant_id',))}
+    queued = check_badges(stats_by_pid, from_cache=False)
+
+    if dry_run:
+        for (pid, badge_type) in sorted(_pending):
+            print(f"  would award {badge_type} to {pid}")
+        print(f"[Achievements] Backfill dry run: {queued} badge(s) across {len(stats_by_pid)} participants")
+        return
+
+    events = flush_achievements()
+    print(f"[Achievements] Backfill awarded {len(events)} badge(s) across {len(stats_by_pid)} participants")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Badge catalog tools")
+    parser.add_argument('--backfill', action='store_true', help="award catalog badges across the whole field")
+    parser.add_argument('--dry-run', action='store_true', help="list badges that would be awarded")
+    args = parser.parse_args()
+    if args.backfill:
+        backfill(dry_run=args.dry_run)
+    else:
+        parser.print_help()
@@ -0,0 +1,164 @@
+"""
+Alert delivery pipeline for Smart Alerts.
+
+Sits between alert detection (smart_alerts) and Telegram:
+1. Dedup    - identical events (type, participant, message) within ALERT_DEDUP_MINUTES are dropped
+2. Coalesce - alerts queue per recipient (group chat or participant chat); repeated
+              state alerts of the same type for the same trader collapse to the latest
+3. Digest   - a recipient gets at most one message per ALERT_DIGEST_MINUTES, holding
+              everything queued since their last message
+4. Cap      - no chat receives more than ALERT_MAX_MESSAGES_PER_HOUR messages, counting
+              every part of a split digest; alerts that did not fit wait in the
+              queue for the next digest
+
+Participant chat IDs are looked up in one query per flush. Queues and send history
+are checkpointed with the alert state so a restart neither drops nor repeats alerts.
+"""
+import os
+import time
+from datetime import datetime
+from core import get_supabase_client, send_telegram_message, save_checkpoint, load_checkpoint
+from tz_config import THAILAND_TZ
+
+DEDUP_MINUTES = float(os.getenv("ALERT_DEDUP_MINUTES", "30"))
+DIGEST_MINUTES = float(os.getenv("ALERT_DIGEST_MINUTES", "15"))
+MAX_MESSAGES_PER_HOUR = int(os.getenv("ALERT_MAX_MESSAGES_PER_HOUR", "6"))
+MAX_MESSAGE_LENGTH = 4000
+
+BROADCAST = 'broadcast'  # Recipient key for the group chat (TELEGRAM_CHAT_ID)
+PIPELINE_CHECKPOINT = 'alert_pipeline'
+
+_pipeline_state = {
+    'recent': {},     # dedup key -> time first seen
+    'pending': {},    # recipient -> [alerts] waiting for the next digest
+    'last_sent': {},  # recipient -> time of last message
+    'sent_log': {},   # recipient -> [send times within the last hour]
+}
+_state_loaded = False
+
+
+def _dedup_key(alert) -> str:
+    return f"{alert['type']}|{alert.get('participant_id')}|{alert['message']}"
+
+
+def _collapse_key(alert):
+    """State alerts collapse to the latest per (type, participant); one-off events never collapse"""
+    if not alert.get('collapse', True):
+        return None
+    return (alert['type'], alert.get('participant_id'))
+
+
+def _enqueue(recipient, alert):
+    queue = _pipeline_state['pending'].setdefault(recipient, [])
+    key = _collapse_key(alert)
+    if key is not None:
+        queue[:] = [a for a in queue if _collapse_key(a) != key]
+    queue.append(alert)
+
+
+def _send_budget(recipient, now) -> int:
+    """Messages the recipient may get now: 0 inside the digest interval, else what the hourly cap leaves"""
+    log = [t for t in _pipeline_state['sent_log'].get(recipient, []) if now - t < 3600]
+    _pipeline_state['sent_log'][recipient] = log
+    last = _pipeline_state['last_sent'].get(recipient)
+    if last is not None and now - last < DIGEST_MINUTES * 60:
+        return 0
+    return max(MAX_MESSAGES_PER_HOUR - len(log), 0)
+
+
+def _render(header, alerts, time_str):
+    """Render a digest, split into Telegram-sized messages: [(text, number of alerts in it)]"""
+    footer = f"\n{'─' * 20}\n⏰ {time_str}"
+    messages = []
+    lines = [header]
+    for alert in alerts:
+        line = f"{alert['icon']} {alert['message']}"
+        if len(lines) > 1 and len("\n".join(lines + [line])) + len(footer) > MAX_MESSAGE_LENGTH:
+            messages.append(("\n".join(lines) + footer, len(lines) - 1))
+            lines = [header]
+        lines.append(line)
+    messages.append(("\n".join(lines) + footer, len(lines) - 1))
+    return messages
+
+
+def _chat_ids(participant_ids) -> dict:
+    """participant_id -> telegram_chat_id for linked participants (single query)"""
+    if not participant_ids:
+        return {}
+    try:
+        res = get_supabase_client().table('participants') \
+            .select('id, telegram_chat_id') \
+            .in_('id', list(participant_ids)) \
+            .execute()
+        return {row['id']: row['telegram_chat_id'] for row in res.data or [] if row.get('telegram_chat_id')}
+    except Exception as e:
+        print(f"[Alert Pipeline] Error fetching chat IDs: {e}")
+        return {}
+
+
+def dispatch(alerts: list):
+    """Queue new alerts and send any digests that are due. Call once per cycle, even with no alerts."""
+    global _state_loaded
+    if not _state_loaded:
+        saved = load_checkpoint(PIPELINE_CHECKPOINT)
+        if saved:
+            _pipeline_state.update({k: saved.get(k, {}) for k in _pipeline_state})
+        _state_loaded = True
+
+    now = time.time()
+    recent = _pipeline_state['recent']
+    for key in [k for k, t in recent.items() if now - t >= DEDUP_MINUTES * 60]:
+        del recent[key]
+
+    queued = 0
+    for alert in alerts:
+        key = _dedup_key(alert)
+        if key in recent:
+            continue
+        recent[key] = now
+        queued += 1
+        if not alert.get('personal_only'):
+            _enqueue(BROADCAST, alert)
+        if alert.get('participant_id'):
+            _enqueue(alert['participant_id'], alert)
+
+    budgets = {r: _send_budget(r, now) for r, queue in _pipeline_state['pending'].items() if queue}
+    due = [r for r, budget in budgets.items() if budget > 0]
+    if due:
+        time_str = datetime.now(THAILAND_TZ).strftime('%H:%M ICT')
+        chat_ids = _chat_ids([r for r in due if r != BROADCAST])
+        sent = 0
+        digests = 0
+
+        for recipient in due:
+            queue = _pipeline_state['pending'][recipient]
+            if recipient == BROADCAST:
+                messages = _render("🔔 <b>Smart Alert</b>\n", queue, time_str)
+                chat_id = None
+            else:
+                chat_id = chat_ids.get(recipient)
+                if not chat_id:
+                    queue.clear()  # Participant has not linked Telegram
+                    continue
+                messages = _render("🔔 <b>แจ้งเตือนส่วนตัว</b>\n", queue, time_str)
+
+            # Each part counts against the hourly cap; what does not fit stays queued
+            delivered = 0
+            for message, count in messages[:budgets[recipient]]:
+                send_telegram_message(message, parse_mode="HTML", chat_id=chat_id)
+                _pipeline_state['sent_log'].setdefault(recipient, []).append(now)
+                delivered += count
+            _pipeline_state['last_sent'][recipient] = now
+            sent += delivered
+            digests += 1
+            del queue[:delivered]
+
+        if digests:
+            print(f"[Alert Pipeline] Sent {sent} alert(s) in {digests} digest(s)")
+
+    held = sum(len(q) for q in _pipeline_state['pending'].values())
+    if queued or held:
+        print(f"[Alert Pipeline] {queued} new alert(s) queued, {held} held for later digests")
+
+    _pipeline_state['pending'] = {r: q for r, q in _pipeline_state['pending'].items() if q}
+    save_checkpoint(PIPELINE_CHECKPOINT, _pipeline_state)
@@ -3,6 +3,7 @@
 # dependencies = [
 #     "supabase",
 #     "python-dotenv",
+#     "numpy",
 # ]
 # ///
 """
@@ -11,112 +12,135 @@ Backfill historical daily_stats.profit from trades table.
 After fixing the net PNL calculation (adding commission + swap),
 the trades table will have correct profit values after re-running the bridge.
 This script recalculates cumulative profit for each historical daily_stats row
-based on trades closed up to that date.
+based on trades closed up to the end of that Thailand day.
+
+Cumulative profit comes from a prefix sum over the participant's trades (sorted by
+close time) and one bisect per daily_stats row. Changed rows are written back with
+one bulk upsert per participant; participants run in a thread pool. Finished
+participants are recorded in the 'backfill_net_profit' checkpoint, so a re-run
+after a crash skips them (--fresh starts over).
 
 Usage:
     1. Run the bridge first (to upsert trades with correct net profit)
-    2. Then run: uv run backfill_net_profit.py
+    2. Then run: uv run backfill_net_profit.py [--dry-run] [--workers 4] [--fresh]
 """
 
-import os
-from datetime import datetime, timedelta
-from dotenv import load_dotenv
-from supabase import create_client
-
-load_dotenv()
-supabase = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"))
-
-def backfill():
+import argparse
+import threading
+from bisect import bisect_left
+from itertools import accumulate
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from core import get_supabase_client, save_checkpoint, load_checkpoint, iter_rows
+from tz_config import thai_day_end
+
+CHECKPOINT_NAME = 'backfill_net_profit'
+
+_checkpoint_lock = threading.Lock()
+
+
+def _epoch(iso: str) -> float:
+    dt = datetime.fromisoformat(iso.replace('Z', '+00:00'))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def cumulative_profits(trades: list, dates: list) -> list:
+    """
+    Profit of all trades closed before the end of each Thailand day.
+
+    Args:
+        trades: [{'profit', 'close_time'}] in any order
+        dates: 'YYYY-MM-DD' strings
+    """
+    pairs = sorted((_epoch(t['close_time']), t['profit'] or 0) for t in trades)
+    close_times = [t for t, _ in pairs]
+    prefix = [0.0, *accumulate(p for _, p in pairs)]
+    return [round(prefix[bisect_left(close_times, thai_day_end(d))], 2) for d in dates]
+
+
+def backfill_participant(p: dict, dry_run: bool) -> list:
+    """Recompute one participant's daily_stats.profit. Returns log lines."""
+    supabase = get_supabase_client()
+    pid = p['id']
+    log = [f"\n--- {p['nickname']} ---"]
+
+    trades = list(iter_rows('trades', 'profit, close_time',
+                            where=lambda q: q.eq('participant_id', pid).filter('close_time', 'not.is', 'null'),
+                            keys=('close_time', 'position_id')))
+    if not trades:
+        log.append("  No trades found, skipping")
+        return log
+
+    # Full rows: an upsert inserts the whole tuple first, so NOT NULL columns must be present
+    stats_rows = list(iter_rows('daily_stats', '*', where=lambda q: q.eq('participant_id', pid), keys=('date',)))
+    if not stats_rows:
+        log.append("  No daily_stats found, skipping")
+        return log
+
+    new_profits = cumulative_profits(trades, [row['date'] for row in stats_rows])
+    updates = []
+    for row, new_profit in zip(stats_rows, new_profits):
+        if abs(new_profit - (row['profit'] or 0)) > 0.01:
+            log.append(f"    {row['date']}: {row['profit']} -> {new_profit}")
+            updates.append({**row, 'profit': new_profit})
+
+    if not updates:
+        log.append(f"  All {len(stats_rows)} rows already correct")
+        return log
+
+    if dry_run:
+        log.insert(1, f"  Would update {len(updates)}/{len(stats_rows)} rows (dry run)")
+        return log
+
+    supabase.table('daily_stats').upsert(updates, on_conflict='participant_id,date').execute()
+    log.insert(1, f"  Updated {len(updates)}/{len(stats_rows)} rows")
+    return log
+
+
+def backfill(dry_run: bool = False, workers: int = 4, fresh: bool = False):
     # Get all participants
-    participants = supabase.table('participants').select('id, nickname').execute().data
+    participants = list(iter_rows('participants', 'id, nickname'))
     if not participants:
         print("No participants found")
         return
 
-    for p in participants:
-        pid = p['id']
-        nickname = p['nickname']
-        print(f"\n--- {nickname} ---")
-
-        # Get all trades for this participant (sorted by close_time)
-        trades = []
-        offset = 0
-        batch_size = 1000
-        while True:
-            batch = supabase.table('trades') \
-                .select('profit, close_time') \
-                .eq('participant_id', pid) \
-                .filter('close_time', 'not.is', 'null') \
-                .order('close_time', desc=False) \
-                .range(offset, offset + batch_size - 1) \
-                .execute().data
-            if not batch:
-                break
-            trades.extend(batch)
-            if len(batch) < batch_size:
-                break
-            offset += batch_size
-
-        if not trades:
-            print(f"  No trades found, skipping")
-            continue
-
-        # Get all daily_stats rows for this participant
-        stats_rows = []
-        offset = 0
-        while True:
-            batch = supabase.table('daily_stats') \
-                .select('date, profit') \
-                .eq('participant_id', pid) \
-                .order('date', desc=False) \
-                .range(offset, offset + batch_size - 1) \
-                .execute().data
-            if not batch:
-                break
-            stats_rows.extend(batch)
-            if len(batch) < batch_size:
-                break
-            offset += batch_size
-
-        if not stats_rows:
-            print(f"  No daily_stats found, skipping")
-            continue
-
-        # For each daily_stats date, sum all trades closed on or before that date (Thai time)
-        updates = []
-        for row in stats_rows:
-            date_str = row['date']  # e.g. "2026-03-15"
-            # End of day in Thai time = start of next day
-            end_of_day = datetime.fromisoformat(date_str) + timedelta(days=1)
-            end_of_day_str = end_of_day.isoformat()
-
-            cumulative_profit = sum(
-                t['profit'] for t in trades
-                if t['close_time'] < end_of_day_str
-            )
-            cumulative_profit = round(cumulative_profit, 2)
-
-            if abs(cumulative_profit - (row['profit'] or 0)) > 0.01:
-                updates.append({
-                    'date': date_str,
-                    'old_profit': row['profit'],
-                    'new_profit': cumulative_profit
-                })
-
-        if not updates:
-            print(f"  All {len(stats_rows)} rows already correct")
-            continue
-
-        print(f"  Updating {len(updates)}/{len(stats_rows)} rows")
-        for u in updates:
-            supabase.table('daily_stats') \
-                .update({'profit': u['new_profit']}) \
-                .eq('participant_id', pid) \
-                .eq('date', u['date']) \
-                .execute()
-            print(f"    {u['date']}: {u['old_profit']} -> {u['new_profit']}")
+    done = set() if fresh else set((load_checkpoint(CHECKPOINT_NAME) or {}).get('done', []))
+    pending = [p for p in participants if p['id'] not in done]
+    if done:
+        print(f"Resuming: {len(participants) - len(pending)} participants already done")
+
+    failed = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(backfill_participant, p, dry_run): p for p in pending}
+        for future in as_completed(futures):
+            p = futures[future]
+            try:
+                print("\n".join(future.result()))
+            except Exception as e:
+                failed += 1
+                print(f"\n--- {p['nickname']} ---\n  Error: {e}")
+                continue
+            if not dry_run:
+                with _checkpoint_lock:
+                    done.add(p['id'])
+                    save_checkpoint(CHECKPOINT_NAME, {'done': sorted(done)})
+
+    if failed:
+        print(f"\nBackfill incomplete: {failed} participants failed, re-run to retry them")
+        return
 
+    if not dry_run:
+        # Finished: the next run starts from scratch
+        save_checkpoint(CHECKPOINT_NAME, {'done': []})
     print("\nBackfill complete!")
 
+
 if __name__ == '__main__':
-    backfill()
+    parser = argparse.ArgumentParser(description="Recompute cumulative daily_stats.profit from trades")
+    parser.add_argument('--dry-run', action='store_true', help='show changes without writing')
+    parser.add_argument('--workers', type=int, default=4, help='participants processed in parallel')
+    parser.add_argument('--fresh', action='store_true', help='ignore the checkpoint and redo every participant')
+    args = parser.parse_args()
+    backfill(dry_run=args.dry_run, workers=args.workers, fresh=args.fresh)
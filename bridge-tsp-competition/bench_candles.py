@@ -0,0 +1,92 @@
+"""
+Differential check and benchmark for market_data_service candle serialization.
+
+Builds synthetic MT5 rates arrays (same dtype as copy_rates_from_pos) at the
+BACKFILL_COUNTS sizes and compares rates_to_rows with the original per-row loop.
+
+Usage:
+    python bench_candles.py
+    python bench_candles.py --repeat 20
+"""
+
+import time
+import argparse
+import numpy as np
+from datetime import datetime, timezone
+from market_data_service import rates_to_rows, BACKFILL_COUNTS, MT5_SERVER_OFFSET_SECONDS
+
+# numpy dtype returned by MetaTrader5.copy_rates_*
+RATES_DTYPE = np.dtype([
+    ('time', '<i8'), ('open', '<f8'), ('high', '<f8'), ('low', '<f8'), ('close', '<f8'),
+    ('tick_volume', '<u8'), ('spread', '<i4'), ('real_volume', '<u8'),
+])
+
+
+def per_row_loop(rates, symbol: str, tf_name: str) -> list:
+    """The original serialization loop from sync_timeframe"""
+    market_data = []
+    for rate in rates:
+        dt = datetime.fromtimestamp(rate['time'] - MT5_SERVER_OFFSET_SECONDS, tz=timezone.utc)
+        market_data.append({
+            "symbol": symbol,
+            "timeframe": tf_name,
+            "time": dt.isoformat(),
+            "open": float(rate['open']),
+            "high": float(rate['high']),
+            "low": float(rate['low']),
+            "close": float(rate['close']),
+            "volume": int(rate['tick_volume'])
+        })
+    return market_data
+
+
+def random_rates(count: int, step_seconds: int, rng) -> np.ndarray:
+    rates = np.zeros(count, dtype=RATES_DTYPE)
+    start = 1767225600 - count * step_seconds  # ends at 2026-01-01
+    rates['time'] = start + np.arange(count) * step_seconds
+    close = 2600 + np.cumsum(rng.normal(0, 0.5, count))
+    rates['open'] = np.round(close + rng.normal(0, 0.2, count), 2)
+    rates['close'] = np.round(close, 2)
+    rates['high'] = np.maximum(rates['open'], rates['close']) + np.round(rng.random(count), 2)
+    rates['low'] = np.minimum(rates['open'], rates['close']) - np.round(rng.random(count), 2)
+    rates['tick_volume'] = rng.integers(1, 5000, count)
+    return rates
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    steps = {'M1': 60, 'M5': 300, 'M15': 900, 'H1': 3600, 'H4': 14400, 'D1': 86400}
+    total_fast = total_slow = 0.0
+
+    for tf_name, count in BACKFILL_COUNTS.items():
+        rates = random_rates(count, steps[tf_name], rng)
+
+        fast = rates_to_rows(rates, "XAUUSD", tf_name)
+        slow = per_row_loop(rates, "XAUUSD", tf_name)
+        assert fast == slow, tf_name
+
+        t0 = time.perf_counter()
+        for _ in range(args.repeat):
+            rates_to_rows(rates, "XAUUSD", tf_name)
+        fast_s = (time.perf_counter() - t0) / args.repeat
+
+        t0 = time.perf_counter()
+        for _ in range(args.repeat):
+            per_row_loop(rates, "XAUUSD", tf_name)
+        slow_s = (time.perf_counter() - t0) / args.repeat
+
+        total_fast += fast_s
+        total_slow += slow_s
+        print(f"{tf_name:>3} {count:>5} candles: vectorized {fast_s * 1000:6.1f} ms, "
+              f"per-row {slow_s * 1000:6.1f} ms ({slow_s / fast_s:.1f}x)")
+
+    print(f"Full backfill: vectorized {total_fast * 1000:.1f} ms, per-row {total_slow * 1000:.1f} ms "
+          f"({total_slow / total_fast:.1f}x), output identical")
+
+
+if __name__ == '__main__':
+    main()
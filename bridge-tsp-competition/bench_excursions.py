@@ -0,0 +1,76 @@
+"""
+Differential check and benchmark for trade_excursion.compute_excursions.
+
+Builds a synthetic year of M1 bars and random trades (minutes to days long),
+compares the vectorized excursions with a per-trade slice loop and times both.
+
+Usage:
+    python bench_excursions.py
+    python bench_excursions.py --trades 100000 --check 2000
+"""
+
+import time
+import argparse
+import numpy as np
+from trade_excursion import compute_excursions, M1_SECONDS
+
+
+def per_trade_loop(times, highs, lows, open_times, close_times, open_prices, is_buy):
+    """One searchsorted + slice min/max per trade"""
+    adverse = np.zeros(len(open_times))
+    favorable = np.zeros(len(open_times))
+    valid = np.zeros(len(open_times), dtype=bool)
+    for i in range(len(open_times)):
+        open_bar = open_times[i] // M1_SECONDS * M1_SECONDS
+        close_bar = max(close_times[i], open_times[i]) // M1_SECONDS * M1_SECONDS
+        lo = np.searchsorted(times, open_bar, side='left')
+        hi = np.searchsorted(times, close_bar, side='right')
+        if open_bar < times[0] or close_bar > times[-1] or hi <= lo:
+            continue
+        lowest, highest = lows[lo:hi].min(), highs[lo:hi].max()
+        if is_buy[i]:
+            adverse[i], favorable[i] = open_prices[i] - lowest, highest - open_prices[i]
+        else:
+            adverse[i], favorable[i] = highest - open_prices[i], open_prices[i] - lowest
+        valid[i] = True
+    return np.maximum(adverse, 0), np.maximum(favorable, 0), valid
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--trades', type=int, default=100000)
+    parser.add_argument('--check', type=int, default=2000, help='trades compared with the loop')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(7)
+    bars = 365 * 24 * 60
+    times = 1735689600 + np.arange(bars, dtype=np.int64) * M1_SECONDS
+    close = 2600 + np.cumsum(rng.normal(0, 0.3, bars))
+    highs = close + rng.random(bars)
+    lows = close - rng.random(bars)
+
+    # Some trades start before / end after the stored range to exercise coverage
+    open_times = rng.integers(times[0] - 86400, times[-1], args.trades)
+    close_times = open_times + rng.integers(0, 3 * 86400, args.trades)
+    open_prices = np.interp(open_times, times, close)
+    is_buy = rng.random(args.trades) < 0.5
+
+    t0 = time.perf_counter()
+    fast = compute_excursions(times, highs, lows, open_times, close_times, open_prices, is_buy)
+    fast_s = time.perf_counter() - t0
+
+    n = min(args.check, args.trades)
+    t0 = time.perf_counter()
+    slow = per_trade_loop(times, highs, lows, open_times[:n], close_times[:n], open_prices[:n], is_buy[:n])
+    slow_s = (time.perf_counter() - t0) / n * args.trades
+
+    assert np.array_equal(fast[2][:n], slow[2])
+    assert np.allclose(fast[0][:n], slow[0]) and np.allclose(fast[1][:n], slow[1])
+
+    print(f"{args.trades} trades over {bars} M1 bars ({int(fast[2].sum())} covered): "
+          f"vectorized {fast_s * 1000:.1f} ms, per-trade loop ~{slow_s * 1000:.0f} ms "
+          f"(extrapolated from {n}), output identical")
+
+
+if __name__ == '__main__':
+    main()
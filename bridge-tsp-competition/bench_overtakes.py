@@ -0,0 +1,86 @@
+"""
+Differential check and benchmark for smart_alerts overtake detection.
+
+Compares _find_overtakes (Fenwick sweep) with the original nested-loop scan on
+random rank shuffles, then times both at a large field size.
+
+Usage:
+    python bench_overtakes.py
+    python bench_overtakes.py --participants 10000 --rounds 200
+"""
+
+import time
+import random
+import argparse
+from smart_alerts import _find_overtakes
+
+
+def nested_loop_overtakes(prev, current_rankings) -> dict:
+    """The original O(n^2) scan from _check_rank_changes"""
+    overtakes = {}
+    for pid, new_rank in current_rankings.items():
+        old_rank = prev.get(pid)
+        if old_rank is None or new_rank >= old_rank:
+            continue
+        overtakes[pid] = [
+            other_pid for other_pid, other_new_rank in current_rankings.items()
+            if other_pid != pid and prev.get(other_pid) is not None
+            and prev[other_pid] < old_rank and other_new_rank > new_rank
+        ]
+    return overtakes
+
+
+def random_cycle(n: int, moves: int, churn: int = 0, reach: int = None):
+    """
+    Previous/current rankings where `moves` traders jump (at most `reach` places
+    if given) and `churn` traders join or leave
+    """
+    pids = [f"p{i}" for i in range(n)]
+    prev = {pid: rank + 1 for rank, pid in enumerate(pids)}
+
+    order = pids[:]
+    for _ in range(moves):
+        i = random.randrange(n)
+        j = random.randrange(n) if reach is None else min(n - 1, max(0, i + random.randint(-reach, reach)))
+        order.insert(j, order.pop(i))
+    for i in range(churn):
+        order.pop(random.randrange(len(order)))
+        order.insert(random.randint(0, len(order)), f"new{i}")
+
+    current = {pid: rank + 1 for rank, pid in enumerate(order)}
+    return prev, current
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--participants', type=int, default=10000)
+    parser.add_argument('--rounds', type=int, default=500)
+    args = parser.parse_args()
+
+    random.seed(42)
+    for _ in range(args.rounds):
+        n = random.randint(1, 60)
+        prev, current = random_cycle(n, random.randint(0, n), churn=random.randint(0, 3))
+        assert _find_overtakes(prev, current) == nested_loop_overtakes(prev, current), (prev, current)
+    print(f"Differential check: {args.rounds} random cycles match")
+
+    n = args.participants
+    for label, reach in (("local moves", 25), ("random jumps", None)):
+        prev, current = random_cycle(n, moves=n // 10, reach=reach)
+
+        t0 = time.perf_counter()
+        fast = _find_overtakes(prev, current)
+        fast_s = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        slow = nested_loop_overtakes(prev, current)
+        slow_s = time.perf_counter() - t0
+
+        assert fast == slow
+        pairs = sum(len(v) for v in fast.values())
+        print(f"n={n} {label}: {len(fast)} movers, {pairs} overtakes | "
+              f"Fenwick {fast_s * 1000:.1f} ms, nested loop {slow_s * 1000:.1f} ms "
+              f"({slow_s / fast_s:.0f}x)")
+
+if __name__ == '__main__':
+    main()
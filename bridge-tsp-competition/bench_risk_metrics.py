@@ -0,0 +1,110 @@
+"""
+Differential check for the incremental risk metrics in equity_service.
+
+Builds synthetic equity snapshots for a season longer than the snapshot retention,
+folds them cycle by cycle the way update_risk_metrics does (one-interval overlap,
+only RETENTION_DAYS readable), restarts half way through from the checkpoint, and
+compares every participant's risk columns with a one-shot computation over the
+same snapshots.
+
+Usage:
+    python bench_risk_metrics.py
+    python bench_risk_metrics.py --participants 50 --days 90
+"""
+
+import os
+import time
+import argparse
+import tempfile
+import importlib
+from datetime import datetime, timezone
+import numpy as np
+
+# Checkpoints go to a scratch directory, never the bridge's state
+os.environ['BRIDGE_STATE_DIR'] = tempfile.mkdtemp(prefix='risk_check_')
+os.environ['BRIDGE_STATE_SUPABASE'] = 'false'
+import equity_service  # noqa: E402
+
+INTERVAL = equity_service.SNAPSHOT_INTERVAL_MINUTES * 60
+
+
+def one_shot(equity: np.ndarray) -> dict:
+    """Risk columns straight from one participant's full equity series (time order, equity > 0)"""
+    periods = equity_service.RISK_PERIODS_PER_YEAR
+    r = equity[1:] / equity[:-1] - 1
+    peak = np.maximum.accumulate(equity)
+    dd_amount = peak - equity
+    dd_pct = dd_amount / peak * 100
+    mean = r.mean() if len(r) else 0.0
+    std = r.std() if len(r) else 0.0
+    downside = np.sqrt((np.minimum(r, 0) ** 2).mean()) if len(r) else 0.0
+    return {
+        'sharpe_ratio': mean / std * np.sqrt(periods) if len(r) >= 2 and std > 0 else 0.0,
+        'sortino_ratio': mean / downside * np.sqrt(periods) if len(r) >= 2 and downside > 0 else 0.0,
+        'calmar_ratio': mean * periods * 100 / dd_pct.max() if dd_pct.max() > 0 else 0.0,
+        'recovery_factor': (equity[-1] - equity[0]) / dd_amount.max() if dd_amount.max() > 0 else 0.0,
+        'ulcer_index': np.sqrt((dd_pct ** 2).mean()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--participants', type=int, default=20)
+    parser.add_argument('--days', type=int, default=75)
+    parser.add_argument('--cycle-minutes', type=int, default=60, help='snapshots folded per cycle')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(11)
+    start = int(datetime(2026, 1, 1, tzinfo=timezone.utc).timestamp())
+    steps = args.days * 86400 // INTERVAL
+    series = {}
+    rows = []
+    for p in range(args.participants):
+        pid = f"p{p}"
+        ts = start + np.arange(steps) * INTERVAL
+        equity = 10000 * np.exp(np.cumsum(rng.normal(0, 0.002, steps)))
+        present = rng.random(steps) > 0.05  # missed snapshots
+        equity[rng.random(steps) < 0.001] = 0  # unusable rows are skipped by both paths
+        series[pid] = equity[present & (equity > 0)]
+        rows += [{'participant_id': pid, 'equity': float(e),
+                  'timestamp': datetime.fromtimestamp(int(t), tz=timezone.utc).isoformat()}
+                 for t, e in zip(ts[present], equity[present])]
+    rows.sort(key=lambda r: r['timestamp'])
+    row_ts = np.array([datetime.fromisoformat(r['timestamp']).timestamp() for r in rows])
+
+    # Cycle by cycle, as update_risk_metrics fetches them (>= watermark - one interval),
+    # from a table that only keeps RETENTION_DAYS of snapshots
+    service = equity_service
+    service._risk_loaded = True
+    cycle = args.cycle_minutes * 60
+    restart_at = start + args.days * 86400 // 2
+    restarted = False
+    t0 = time.perf_counter()
+    for now in range(start + cycle, start + args.days * 86400 + cycle, cycle):
+        since = -np.inf if service._risk_watermark is None else service._risk_watermark - INTERVAL
+        kept = now - equity_service.RETENTION_DAYS * 86400
+        lo, hi = np.searchsorted(row_ts, max(since, kept), 'left'), np.searchsorted(row_ts, now, 'left')
+        if service.fold_risk_snapshots(rows[lo:hi]):
+            service._save_risk_state()
+        if not restarted and now >= restart_at:
+            service = importlib.reload(equity_service)  # fresh process state
+            service._restore_risk_state()
+            restarted = True
+    service._refresh_risk_metrics()
+    fold_s = time.perf_counter() - t0
+
+    worst = 0.0
+    for pid, equity in series.items():
+        expected = one_shot(equity)
+        got = service.get_risk_metrics(pid)
+        for col, value in expected.items():
+            diff = abs(got[col] - round(float(value), 4))
+            worst = max(worst, diff)
+            assert diff <= 1e-4 + 1e-6 * abs(value), (pid, col, got[col], value)
+
+    print(f"{len(rows)} snapshots, {args.participants} participants, restart at day {args.days // 2}: "
+          f"incremental {fold_s * 1000:.0f} ms, matches one-shot (max diff {worst:.1e})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+OHLCV resampling of MT5 M1 rates into higher timeframes.
+
+Bars are bucketed on MT5 server time (floor(time / bar_seconds)), which is how the
+broker aligns its own M5..D1 bars: H4 and D1 open at server midnight, not UTC
+midnight. Buckets without M1 bars (market closed) produce no bar.
+
+Aggregation is one reduceat per column over the bucket boundaries:
+open = first, high = max, low = min, close = last, volumes = sum, spread = min.
+"""
+
+import numpy as np
+
+
+def bucket_start(server_time, bar_seconds: int):
+    """Server-time start of the bar containing `server_time`"""
+    return server_time // bar_seconds * bar_seconds
+
+
+def resample_rates(m1: np.ndarray, bar_seconds: int) -> np.ndarray:
+    """
+    Aggregate time-sorted M1 rates (MT5 structured array) into `bar_seconds` bars.
+
+    Returns:
+        Structured array with the same dtype as `m1`, one row per non-empty bucket.
+        The first/last bucket is partial if `m1` does not cover it completely.
+    """
+    if m1 is None or len(m1) == 0:
+        return np.zeros(0, dtype=m1.dtype if m1 is not None else None)
+
+    buckets = bucket_start(m1['time'].astype(np.int64), bar_seconds)
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(buckets)) + 1))
+    ends = np.append(starts[1:], len(m1))
+
+    bars = np.zeros(len(starts), dtype=m1.dtype)
+    bars['time'] = buckets[starts]
+    bars['open'] = m1['open'][starts]
+    bars['high'] = np.maximum.reduceat(m1['high'], starts)
+    bars['low'] = np.minimum.reduceat(m1['low'], starts)
+    bars['close'] = m1['close'][ends - 1]
+    bars['tick_volume'] = np.add.reduceat(m1['tick_volume'], starts)
+    if 'spread' in m1.dtype.names:
+        bars['spread'] = np.minimum.reduceat(m1['spread'], starts)
+    if 'real_volume' in m1.dtype.names:
+        bars['real_volume'] = np.add.reduceat(m1['real_volume'], starts)
+    return bars
+
+
+def compare_bars(derived: np.ndarray, broker: np.ndarray, price_tolerance: float = 1e-6) -> dict:
+    """
+    Compare derived bars with the broker's bars on their common times.
+
+    Returns:
+        {'compared', 'missing' (broker bars not derived), 'extra' (derived bars the
+         broker does not have), 'price_mismatch', 'volume_mismatch', 'examples'}
+    """
+    common, d_idx, b_idx = np.intersect1d(derived['time'], broker['time'], return_indices=True)
+    d, b = derived[d_idx], broker[b_idx]
+
+    price_bad = np.zeros(len(common), dtype=bool)
+    for col in ('open', 'high', 'low', 'close'):
+        price_bad |= np.abs(d[col] - b[col]) > price_tolerance
+    volume_bad = d['tick_volume'] != b['tick_volume']
+
+    bad = np.flatnonzero(price_bad | volume_bad)
+    return {
+        'compared': len(common),
+        'missing': int(len(broker) - len(common)),
+        'extra': int(len(derived) - len(common)),
+        'price_mismatch': int(price_bad.sum()),
+        'volume_mismatch': int(volume_bad.sum()),
+        'examples': [(int(common[i]), d[i], b[i]) for i in bad[:5]],
+    }
@@ -0,0 +1,199 @@
+"""
+Local columnar candle store.
+
+One directory per symbol and timeframe, one raw little-endian file per column:
+
+    <CANDLE_STORE_DIR>/XAUUSD/M1/time.i8   (UTC epoch seconds, sorted, unique)
+                                 open.f8 high.f8 low.f8 close.f8 volume.i8
+
+Files are append-only in the normal case: the bridge appends new bars after each
+sync and rewrites the last bar in place while it is still forming. Bars that land
+before the end (gap repairs) trigger a merge that rewrites the columns atomically.
+
+Reads are zero-copy: columns are memory-mapped read-only and a time range is
+located with np.searchsorted on the time column, so slicing millions of bars costs
+two binary searches. Readers only see rows present in every column file, so a
+reader racing an append never sees a half-written bar.
+
+Usage:
+    from candle_store import read
+    bars = read("XAUUSD", "M1", start=1767225600, end=1767312000)
+    bars['close'].max()
+"""
+
+import os
+import numpy as np
+
+CANDLE_STORE_DIR = os.getenv(
+    "CANDLE_STORE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "candles")
+)
+
+COLUMNS = (
+    ('time', np.dtype('<i8')),
+    ('open', np.dtype('<f8')),
+    ('high', np.dtype('<f8')),
+    ('low', np.dtype('<f8')),
+    ('close', np.dtype('<f8')),
+    ('volume', np.dtype('<i8')),
+)
+
+# (symbol, timeframe, column) -> (file signature, memmap); remapped when the file changes
+_maps = {}
+
+
+def _dir(symbol: str, tf_name: str) -> str:
+    return os.path.join(CANDLE_STORE_DIR, symbol, tf_name)
+
+
+def _path(symbol: str, tf_name: str, column: str, dtype: np.dtype) -> str:
+    return os.path.join(_dir(symbol, tf_name), f"{column}.{dtype.kind}{dtype.itemsize}")
+
+
+def _rows(symbol: str, tf_name: str) -> int:
+    """Complete rows: the shortest column (appends write time last)"""
+    sizes = []
+    for column, dtype in COLUMNS:
+        path = _path(symbol, tf_name, column, dtype)
+        sizes.append(os.path.getsize(path) // dtype.itemsize if os.path.exists(path) else 0)
+    return min(sizes)
+
+
+def _column(symbol: str, tf_name: str, column: str, dtype: np.dtype, rows: int) -> np.ndarray:
+    """Read-only memmap of the first `rows` values of a column"""
+    if rows == 0:
+        return np.zeros(0, dtype=dtype)
+    path = _path(symbol, tf_name, column, dtype)
+    stat = os.stat(path)
+    signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    key = (symbol, tf_name, column)
+    cached = _maps.get(key)
+    if cached is None or cached[0] != signature:
+        cached = (signature, np.memmap(path, dtype=dtype, mode='r', shape=(stat.st_size // dtype.itemsize,)))
+        _maps[key] = cached
+    return cached[1][:rows]
+
+
+def read(symbol: str, tf_name: str, start: int = None, end: int = None) -> dict:
+    """
+    Bars with start <= time < end (UTC epoch seconds; None = unbounded).
+
+    Returns:
+        column -> read-only array view (memory-mapped, no copy). Empty arrays if
+        the symbol/timeframe is not stored.
+    """
+    rows = _rows(symbol, tf_name)
+    times = _column(symbol, tf_name, 'time', COLUMNS[0][1], rows)
+    lo = 0 if start is None else int(np.searchsorted(times, start, side='left'))
+    hi = rows if end is None else int(np.searchsorted(times, end, side='left'))
+    hi = max(lo, hi)
+    return {column: _column(symbol, tf_name, column, dtype, rows)[lo:hi] for column, dtype in COLUMNS}
+
+
+def first_time(symbol: str, tf_name: str):
+    """Time of the oldest stored bar, or None"""
+    times = read(symbol, tf_name)['time']
+    return int(times[0]) if len(times) else None
+
+
+def last_time(symbol: str, tf_name: str):
+    """Time of the newest stored bar, or None"""
+    times = read(symbol, tf_name)['time']
+    return int(times[-1]) if len(times) else None
+
+
+def stored() -> dict:
+    """symbol -> [timeframes] present in the store"""
+    result = {}
+    if not os.path.isdir(CANDLE_STORE_DIR):
+        return result
+    for symbol in sorted(os.listdir(CANDLE_STORE_DIR)):
+        symbol_dir = os.path.join(CANDLE_STORE_DIR, symbol)
+        if os.path.isdir(symbol_dir):
+            result[symbol] = sorted(os.listdir(symbol_dir))
+    return result
+
+
+def _append(symbol: str, tf_name: str, columns: dict, overwrite_from: int):
+    """
+    Write rows starting at row index `overwrite_from` (end of file = pure append).
+    Never shrinks a file, so it is safe while the columns are memory-mapped.
+    """
+    for column, dtype in COLUMNS[1:] + COLUMNS[:1]:  # time last: readers count complete rows by it
+        path = _path(symbol, tf_name, column, dtype)
+        with open(path, 'r+b' if os.path.exists(path) else 'wb') as f:
+            f.seek(overwrite_from * dtype.itemsize)
+            f.write(np.ascontiguousarray(columns[column], dtype=dtype).tobytes())
+
+
+def _rewrite(symbol: str, tf_name: str, columns: dict):
+    """Replace all columns (merge path); each file is swapped in atomically"""
+    # Unmap first: a mapped file cannot be replaced on Windows
+    for column, _ in COLUMNS:
+        _maps.pop((symbol, tf_name, column), None)
+    for column, dtype in COLUMNS:
+        path = _path(symbol, tf_name, column, dtype)
+        tmp = f"{path}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(np.ascontiguousarray(columns[column], dtype=dtype).tobytes())
+        os.replace(tmp, path)
+
+
+def write(symbol: str, tf_name: str, columns: dict) -> int:
+    """
+    Add bars (column -> array, time in UTC epoch seconds, sorted). Bars at or after
+    the last stored time are appended, replacing the last bar if it is re-sent;
+    earlier bars are merged, with the new values winning on equal times.
+
+    Returns:
+        Number of bars written
+    """
+    new_times = np.asarray(columns['time'], dtype=np.int64)
+    if not len(new_times):
+        return 0
+    os.makedirs(_dir(symbol, tf_name), exist_ok=True)
+
+    rows = _rows(symbol, tf_name)
+    times = _column(symbol, tf_name, 'time', COLUMNS[0][1], rows)
+
+    if rows == 0 or new_times[0] >= times[-1]:
+        overwrite_from = rows - 1 if rows and new_times[0] == times[-1] else rows
+        _append(symbol, tf_name, columns, overwrite_from)
+        return len(new_times)
+
+    # Merge: stable sort with new rows after old ones, keep the last row per time
+    old = read(symbol, tf_name)
+    merged = {column: np.concatenate([old[column], np.asarray(columns[column], dtype=dtype)])
+              for column, dtype in COLUMNS}
+    del old, times
+    order = np.argsort(merged['time'], kind='stable')
+    sorted_times = merged['time'][order]
+    keep = np.append(sorted_times[1:] != sorted_times[:-1], True)
+    _rewrite(symbol, tf_name, {column: values[order][keep] for column, values in merged.items()})
+    return len(new_times)
+
+
+def write_rates(symbol: str, tf_name: str, rates, server_offset_seconds: int) -> int:
+    """Add bars from an MT5 rates structured array (server time)"""
+    if rates is None or len(rates) == 0:
+        return 0
+    return write(symbol, tf_name, {
+        'time': rates['time'].astype(np.int64) - server_offset_seconds,
+        'open': rates['open'],
+        'high': rates['high'],
+        'low': rates['low'],
+        'close': rates['close'],
+        'volume': rates['tick_volume'].astype(np.int64),
+    })
+
+
+def trim(symbol: str, tf_name: str, before: int) -> int:
+    """Drop bars older than `before` (retention). Returns bars removed."""
+    bars = read(symbol, tf_name)
+    cut = int(np.searchsorted(bars['time'], before, side='left'))
+    if cut == 0:
+        return 0
+    kept = {column: np.array(values[cut:]) for column, values in bars.items()}
+    del bars
+    _rewrite(symbol, tf_name, kept)
+    return cut
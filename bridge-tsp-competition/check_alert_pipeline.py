@@ -0,0 +1,96 @@
+"""
+Behavior check for the alert pipeline's hourly message cap.
+
+Drives alert_pipeline.dispatch with a fake clock and a fake Telegram sender:
+1. a digest that splits into several messages, with the hourly budget nearly
+   used up, sends only what the budget allows and keeps the rest queued
+2. a random multi-day run of digests of mixed size never exceeds
+   ALERT_MAX_MESSAGES_PER_HOUR messages in any hour, and every alert is
+   delivered exactly once
+
+Usage:
+    python check_alert_pipeline.py
+"""
+
+import os
+import random
+import tempfile
+from types import SimpleNamespace
+
+# Checkpoints go to a scratch directory, never the bridge's state
+os.environ['BRIDGE_STATE_DIR'] = tempfile.mkdtemp(prefix='alert_check_')
+os.environ['BRIDGE_STATE_SUPABASE'] = 'false'
+import alert_pipeline  # noqa: E402
+
+clock = [1_800_000_000.0]
+outbox = []  # (time, text)
+alert_pipeline.time = SimpleNamespace(time=lambda: clock[0])
+alert_pipeline.send_telegram_message = lambda text, parse_mode=None, chat_id=None: outbox.append((clock[0], text))
+alert_pipeline.print = lambda *args, **kwargs: None
+
+
+def make_alerts(start: int, count: int, size: int = 1500) -> list:
+    """Broadcast one-off alerts; `size` characters each, so about 2 fit in one Telegram message"""
+    return [{'type': 'check', 'icon': '•', 'message': f"#{n} " + 'x' * size, 'collapse': False}
+            for n in range(start, start + count)]
+
+
+def reset():
+    for value in alert_pipeline._pipeline_state.values():
+        value.clear()
+    alert_pipeline._state_loaded = True
+    outbox.clear()
+
+
+def delivered_ids() -> list:
+    return [int(line.split('#')[1].split()[0]) for _, text in outbox for line in text.splitlines() if '#' in line]
+
+
+def check_split_digest_respects_budget():
+    reset()
+    cap = alert_pipeline.MAX_MESSAGES_PER_HOUR
+    state = alert_pipeline._pipeline_state
+    # cap - 1 messages already sent this hour, the last one past the digest interval
+    state['sent_log'][alert_pipeline.BROADCAST] = [clock[0] - 3000 + i for i in range(cap - 1)]
+    state['last_sent'][alert_pipeline.BROADCAST] = clock[0] - alert_pipeline.DIGEST_MINUTES * 60
+    alerts = make_alerts(0, 6)  # three messages' worth
+
+    alert_pipeline.dispatch(alerts)
+    assert len(outbox) == 1, f"sent {len(outbox)} messages with a budget of 1"
+    held = state['pending'][alert_pipeline.BROADCAST]
+    assert [a['message'] for a in held] == [a['message'] for a in alerts[len(delivered_ids()):]], "unsent alerts not kept"
+
+    clock[0] += 3600
+    alert_pipeline.dispatch([])
+    assert sorted(delivered_ids()) == list(range(6)), delivered_ids()
+    assert not state['pending'].get(alert_pipeline.BROADCAST)
+    print(f"split digest: 1 of 3 messages sent at budget 1, the rest {len(outbox) - 1} an hour later")
+
+
+def check_random_run_never_exceeds_cap():
+    reset()
+    rng = random.Random(3)
+    cap = alert_pipeline.MAX_MESSAGES_PER_HOUR
+    next_id = 0
+    for _ in range(3 * 24 * 12):  # three days of 5-minute cycles
+        count = rng.choice([0] * 12 + [1, 2, 5, 12])
+        alert_pipeline.dispatch(make_alerts(next_id, count, size=rng.choice([50, 1500])))
+        next_id += count
+        clock[0] += 300
+    for _ in range(7 * 24 * 12):  # quiet cycles until the backlog drains
+        if not alert_pipeline._pipeline_state['pending']:
+            break
+        alert_pipeline.dispatch([])
+        clock[0] += 300
+
+    times = [t for t, _ in outbox]
+    busiest = max(sum(1 for t in times if start <= t < start + 3600) for start in times)
+    assert busiest <= cap, f"{busiest} messages within an hour (cap {cap})"
+    ids = delivered_ids()
+    assert sorted(ids) == list(range(next_id)), "alerts lost or repeated"
+    print(f"random run: {next_id} alerts in {len(outbox)} messages, at most {busiest} in any hour (cap {cap})")
+
+
+if __name__ == '__main__':
+    check_split_digest_respects_budget()
+    check_random_run_never_exceeds_cap()
@@ -7,22 +7,11 @@
 # ///
 """Quick script to check participant data in Supabase."""
 
-import os
-from dotenv import load_dotenv
-from supabase import create_client
-
-load_dotenv()
+from core import get_supabase_client, iter_rows
 
 PARTICIPANT_ID = "f2a8a2ea-df5c-488f-b1ef-d5e0419b5583"
 
-url = os.getenv("SUPABASE_URL")
-key = os.getenv("SUPABASE_KEY")
-
-if not url or not key:
-    print("Error: SUPABASE_URL or SUPABASE_KEY not found in .env")
-    exit(1)
-
-supabase = create_client(url, key)
+supabase = get_supabase_client()
 
 # --- Latest daily_stats row ---
 print("=" * 60)
@@ -78,17 +67,20 @@ print("=" * 60)
 print("TOTAL PROFIT (all closed trades)")
 print("=" * 60)
 
-all_trades = (
-    supabase.table("trades")
-    .select("profit")
-    .eq("participant_id", PARTICIPANT_ID)
-    .filter("close_time", "not.is", "null")
-    .execute()
+all_trades = iter_rows(
+    "trades", "profit",
+    where=lambda q: q.eq("participant_id", PARTICIPANT_ID).filter("close_time", "not.is", "null"),
+    keys=("position_id",),
 )
 
-if all_trades.data:
-    grand_total = sum(float(t.get("profit", 0) or 0) for t in all_trades.data)
-    print(f"  Closed trades count: {len(all_trades.data)}")
+closed_count = 0
+grand_total = 0.0
+for t in all_trades:
+    closed_count += 1
+    grand_total += float(t.get("profit", 0) or 0)
+
+if closed_count:
+    print(f"  Closed trades count: {closed_count}")
     print(f"  Total profit: {grand_total:.2f}")
 else:
     print("  No closed trades found.")
@@ -1,10 +1,15 @@
 import os
-import MetaTrader5 as mt5
-from supabase import create_client, Client
+import json
+import time
+from datetime import datetime, timezone, timedelta
+from typing import TYPE_CHECKING
 from dotenv import load_dotenv
-import requests
+from concurrent.futures import ThreadPoolExecutor
 
-# Load environment variables
+if TYPE_CHECKING:
+    from supabase import Client
+
+# Load environment variables (module constants below and in other modules read them at import)
 load_dotenv()
 
 def load_env():
@@ -13,8 +18,11 @@ def load_env():
 
 _supabase_client = None
 
-def get_supabase_client() -> Client:
-    """Return singleton Supabase client (reused across all modules)"""
+def get_supabase_client() -> "Client":
+    """
+    Return singleton Supabase client (reused across all modules).
+    Created on first call, so importing a module neither connects nor needs credentials.
+    """
     global _supabase_client
     if _supabase_client is not None:
         return _supabase_client
@@ -26,11 +34,204 @@ def get_supabase_client() -> Client:
         print("Error: SUPABASE_URL or SUPABASE_KEY not found in .env")
         exit(1)
 
-    _supabase_client = create_client(url, key)
+    from supabase import create_client
+    from http_transport import use_pooled_transport
+
+    # All modules share one pooled, metered HTTP transport (http_transport)
+    _supabase_client = use_pooled_transport(create_client(url, key))
     return _supabase_client
 
+# Partition maintenance (see migrations/010_time_partitioning.sql)
+PARTITION_MAINTENANCE_HOURS = float(os.getenv("PARTITION_MAINTENANCE_HOURS", "6"))
+PARTITION_PRECREATE_DAYS = int(os.getenv("PARTITION_PRECREATE_DAYS", "7"))
+
+_partition_last_run = {}  # parent table -> monotonic time of last maintenance
+
+
+def maintain_time_partitions(parent: str, interval_days: int, retention_days: int = None, force: bool = False):
+    """
+    Pre-create upcoming range partitions of `parent` and drop those past retention.
+    Runs at most once every PARTITION_MAINTENANCE_HOURS per table unless forced.
+
+    Returns:
+        (created, dropped) partition counts, or None if skipped/failed
+    """
+    last = _partition_last_run.get(parent)
+    if not force and last is not None and time.monotonic() - last < PARTITION_MAINTENANCE_HOURS * 3600:
+        return None
+
+    supabase = get_supabase_client()
+    now = datetime.now(timezone.utc)
+    try:
+        created = supabase.rpc('ensure_time_partitions', {
+            'p_parent': parent,
+            'p_interval': f'{interval_days} days',
+            'p_from': now.isoformat(),
+            'p_to': (now + timedelta(days=PARTITION_PRECREATE_DAYS)).isoformat(),
+        }).execute().data or 0
+
+        dropped = 0
+        if retention_days is not None:
+            dropped = supabase.rpc('drop_time_partitions', {
+                'p_parent': parent,
+                'p_cutoff': (now - timedelta(days=retention_days)).isoformat(),
+            }).execute().data or 0
+
+        _partition_last_run[parent] = time.monotonic()
+        return created, dropped
+    except Exception as e:
+        print(f"Error maintaining partitions for {parent}: {e}")
+        return None
+
+
+# Local checkpoints for state that must survive bridge restarts
+STATE_DIR = os.getenv("BRIDGE_STATE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "state"))
+STATE_SUPABASE = os.getenv("BRIDGE_STATE_SUPABASE", "false").lower() in ("1", "true", "yes")
+
+
+def save_checkpoint(name: str, state: dict) -> bool:
+    """
+    Atomically write `state` as compact JSON to STATE_DIR/<name>.json
+    (temp file + fsync + rename), and mirror it to the bridge_state table
+    when BRIDGE_STATE_SUPABASE is enabled.
+    """
+    payload = json.dumps(state, separators=(',', ':'), default=str)
+    path = os.path.join(STATE_DIR, f"{name}.json")
+    ok = True
+
+    try:
+        os.makedirs(STATE_DIR, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"Failed to write checkpoint '{name}': {e}")
+        ok = False
+
+    if STATE_SUPABASE:
+        try:
+            get_supabase_client().table('bridge_state').upsert({
+                'key': name,
+                'state': json.loads(payload),
+                'updated_at': datetime.now(timezone.utc).isoformat(),
+            }, on_conflict='key').execute()
+        except Exception as e:
+            print(f"Failed to mirror checkpoint '{name}' to Supabase: {e}")
+
+    return ok
+
+
+def load_checkpoint(name: str):
+    """Load a checkpoint from the local file, falling back to bridge_state. Returns None if absent."""
+    path = os.path.join(STATE_DIR, f"{name}.json")
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"Failed to read checkpoint '{name}': {e}")
+
+    if STATE_SUPABASE:
+        try:
+            res = get_supabase_client().table('bridge_state').select('state').eq('key', name).limit(1).execute()
+            if res.data:
+                return res.data[0]['state']
+        except Exception as e:
+            print(f"Failed to load checkpoint '{name}' from Supabase: {e}")
+
+    return None
+
+
+
+# Streaming reads (see iter_rows). The page size must not exceed the PostgREST
+# max-rows setting (1000 on Supabase), or a capped page would look like the last one.
+READ_PAGE_SIZE = int(os.getenv("SUPABASE_READ_PAGE_SIZE", "1000"))
+READ_PREFETCH = os.getenv("SUPABASE_READ_PREFETCH", "true").lower() in ("1", "true", "yes")
+
+
+def filter_literal(value) -> str:
+    """Value for a PostgREST logic-tree filter (or=...); strings are quoted"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return repr(value)
+    return '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def _after(query, keys: tuple, last: dict, desc: bool):
+    """Restrict `query` to rows after `last` in (keys) order: the keyset condition"""
+    op = 'lt' if desc else 'gt'
+    if len(keys) == 1:
+        return getattr(query, op)(keys[0], last[keys[0]])
+    # (k1 > v1) or (k1 = v1 and k2 > v2) or ...
+    clauses = []
+    for i, key in enumerate(keys):
+        terms = [f"{k}.eq.{filter_literal(last[k])}" for k in keys[:i]]
+        terms.append(f"{key}.{op}.{filter_literal(last[key])}")
+        clauses.append(terms[0] if len(terms) == 1 else f"and({','.join(terms)})")
+    # postgrest-py 0.13 has no or_() builder method; the query param is the same thing
+    query.params = query.params.add('or', f"({','.join(clauses)})")
+    return query
+
+
+def iter_rows(table: str, columns: str = '*', where=None, keys=('id',), desc: bool = False,
+              page_size: int = None, prefetch: bool = None):
+    """
+    Yield every row of a select, page by page, with keyset pagination.
+
+    Each page is ordered by `keys` and starts after the last row of the previous
+    one (WHERE keys > last), so every page is an index range scan on an index
+    covering the keys, unlike OFFSET paging which rescans all skipped rows. The
+    keys must be non-null and unique within the filtered rows, e.g.
+    ('timestamp',) for one participant's equity_snapshots, or
+    ('close_time', 'position_id') for trades.
+
+    Args:
+        table: table or view name
+        columns: select list; missing key columns are added
+        where: function(query) -> query applying the filters (eq/gte/in_ ...)
+        keys: ordering / keyset columns
+        desc: walk the keys in descending order
+        page_size: rows per request (default READ_PAGE_SIZE)
+        prefetch: request the next page while the caller consumes the current one
+                  (default READ_PREFETCH)
+    """
+    keys = tuple(keys)
+    page_size = page_size or READ_PAGE_SIZE
+    prefetch = READ_PREFETCH if prefetch is None else prefetch
+    if columns != '*':
+        listed = {c.strip() for c in columns.split(',')}
+        columns = ', '.join([columns] + [k for k in keys if k not in listed])
+
+    def fetch(last):
+        query = get_supabase_client().table(table).select(columns)
+        if where is not None:
+            query = where(query)
+        if last is not None:
+            query = _after(query, keys, last, desc)
+        for key in keys:
+            query = query.order(key, desc=desc)
+        return query.limit(page_size).execute().data or []
+
+    pool = ThreadPoolExecutor(max_workers=1) if prefetch else None
+    try:
+        page = fetch(None)
+        while page:
+            more = len(page) >= page_size
+            upcoming = pool.submit(fetch, page[-1]) if (more and pool) else None
+            yield from page
+            if not more:
+                return
+            page = upcoming.result() if upcoming else fetch(page[-1])
+    finally:
+        if pool:
+            pool.shutdown(wait=True, cancel_futures=True)
+
 def init_mt5() -> bool:
     """Initialize MetaTrader 5 connection"""
+    import MetaTrader5 as mt5  # Windows-only: imported when the bridge actually connects
     mt5_path = os.getenv("MT5_PATH")
     
     if mt5_path:
@@ -60,6 +261,7 @@ def send_telegram_message(message: str, parse_mode: str = None, chat_id: str = N
         data["parse_mode"] = parse_mode
 
     try:
+        import requests
         requests.post(url, data=data, timeout=10)
     except Exception as e:
         print(f"Failed to send Telegram message: {e}")
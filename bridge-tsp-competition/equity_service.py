@@ -4,23 +4,26 @@ Equity Snapshot Service - MyFxBook-style equity data recording
 Features:
 - Records equity snapshots every 5 minutes
 - Calculates floating P/L and margin level
-- Implements 30-day retention policy for detailed snapshots
+- Implements 30-day retention policy for detailed snapshots (partition drops)
+- Maintains risk-adjusted metrics (Sharpe, Sortino, Calmar, recovery, ulcer)
+  for all participants incrementally from snapshot returns; the accumulators
+  are checkpointed, so the metrics cover the whole season across restarts
+  rather than only the snapshots retention still keeps
 """
 
 import os
+import numpy as np
 from datetime import datetime, timezone, timedelta
-from core import get_supabase_client, load_env
+from core import get_supabase_client, maintain_time_partitions, iter_rows, save_checkpoint, load_checkpoint
 from tz_config import THAILAND_TZ
 
-# Load environment variables
-load_env()
-
 # Configuration
 SNAPSHOT_INTERVAL_MINUTES = 5  # Record snapshot every 5 minutes
 RETENTION_DAYS = 30  # Keep detailed snapshots for 30 days
-
-# Initialize Supabase client
-supabase = get_supabase_client()
+SNAPSHOT_PARTITION_DAYS = 1  # equity_snapshots is range-partitioned by day
+RISK_PERIODS_PER_YEAR = 252 * 24 * 60 // SNAPSHOT_INTERVAL_MINUTES  # Annualization factor for snapshot returns
+RISK_PAGE_SIZE = 1000  # Rows per request when bulk-fetching snapshots
+RISK_CHECKPOINT = 'risk_metrics'
 
 
 def should_record_snapshot(participant_id: str) -> bool:
@@ -28,6 +31,7 @@ def should_record_snapshot(participant_id: str) -> bool:
     Check if enough time has passed since last snapshot (5 minutes).
     Returns True if we should record a new snapshot.
     """
+    supabase = get_supabase_client()
     try:
         # Get latest snapshot for this participant
         response = supabase.table('equity_snapshots') \
@@ -62,6 +66,7 @@ def record_equity_snapshot(participant_id: str, account_info) -> bool:
     Returns:
         True if successful, False otherwise
     """
+    supabase = get_supabase_client()
     try:
         # Calculate floating P/L
         floating_pl = account_info.equity - account_info.balance
@@ -99,6 +104,7 @@ def get_previous_day_equity(participant_id: str) -> float:
     Get the equity from the end of the previous day.
     Used to calculate equity growth percentage.
     """
+    supabase = get_supabase_client()
     try:
         yesterday = (datetime.now(THAILAND_TZ) - timedelta(days=1)).date()
         
@@ -146,26 +152,15 @@ def calculate_equity_growth(participant_id: str, current_equity: float) -> float
     return round(growth, 2)
 
 
-def cleanup_old_snapshots():
+def cleanup_old_snapshots(force: bool = False):
     """
-    Delete snapshots older than RETENTION_DAYS.
-    Called periodically to manage database size.
+    Drop daily snapshot partitions older than RETENTION_DAYS and pre-create
+    upcoming ones. Called every cycle; the work itself runs on the
+    partition maintenance schedule in core (force: run now, e.g. at startup).
     """
-    try:
-        cutoff = datetime.now(timezone.utc) - timedelta(days=RETENTION_DAYS)
-        
-        result = supabase.table('equity_snapshots') \
-            .delete() \
-            .lt('timestamp', cutoff.isoformat()) \
-            .execute()
-        
-        if result.data:
-            count = len(result.data)
-            if count > 0:
-                print(f"🗑️ Cleaned up {count} old equity snapshots (>{RETENTION_DAYS} days)")
-        
-    except Exception as e:
-        print(f"❌ Error cleaning up old snapshots: {e}")
+    result = maintain_time_partitions('equity_snapshots', SNAPSHOT_PARTITION_DAYS, RETENTION_DAYS, force=force)
+    if result and result[1] > 0:
+        print(f"🗑️ Dropped {result[1]} equity snapshot partition(s) (>{RETENTION_DAYS} days)")
 
 
 def get_equity_curve(participant_id: str, days: int = 30) -> list:
@@ -182,14 +177,11 @@ def get_equity_curve(participant_id: str, days: int = 30) -> list:
     try:
         since = datetime.now(timezone.utc) - timedelta(days=days)
         
-        response = supabase.table('equity_snapshots') \
-            .select('timestamp, balance, equity, floating_pl') \
-            .eq('participant_id', participant_id) \
-            .gte('timestamp', since.isoformat()) \
-            .order('timestamp', desc=False) \
-            .execute()
-        
-        return response.data or []
+        return list(iter_rows(
+            'equity_snapshots', 'timestamp, balance, equity, floating_pl',
+            where=lambda q: q.eq('participant_id', participant_id).gte('timestamp', since.isoformat()),
+            keys=('timestamp',),
+        ))
         
     except Exception as e:
         print(f"Error fetching equity curve: {e}")
@@ -204,16 +196,8 @@ def calculate_equity_metrics(participant_id: str, fallback_dd: float = 0.0) -> d
     Returns:
         dict with 'max_drawdown' (percentage) and 'peak_equity' (float)
     """
+    supabase = get_supabase_client()
     try:
-        # Single query: get all equity snapshots + stored peak from daily_stats
-        response = supabase.table('equity_snapshots') \
-            .select('equity, timestamp') \
-            .eq('participant_id', participant_id) \
-            .order('timestamp', desc=False) \
-            .execute()
-
-        snapshots = response.data or []
-
         # Get stored peak_equity from daily_stats (single query)
         peak_response = supabase.table('daily_stats') \
             .select('peak_equity') \
@@ -227,17 +211,19 @@ def calculate_equity_metrics(participant_id: str, fallback_dd: float = 0.0) -> d
         if peak_response.data and peak_response.data[0].get('peak_equity'):
             stored_peak = float(peak_response.data[0]['peak_equity'])
 
-        if len(snapshots) < 2:
-            print(f"⚠️ Max DD: Insufficient equity data ({len(snapshots)} snapshots), using fallback")
-            return {'max_drawdown': fallback_dd, 'peak_equity': stored_peak}
-
-        # Calculate both metrics in a single pass
-        running_peak = max(float(snapshots[0]['equity']), stored_peak)
-        overall_peak = running_peak
+        # Stream all equity snapshots and calculate both metrics in a single pass
+        snapshots = iter_rows(
+            'equity_snapshots', 'equity, timestamp',
+            where=lambda q: q.eq('participant_id', participant_id),
+            keys=('timestamp',),
+        )
+        count = 0
+        running_peak = overall_peak = stored_peak
         max_dd = 0.0
 
         for snap in snapshots:
             eq = float(snap['equity'])
+            count += 1
             if eq > running_peak:
                 running_peak = eq
             if running_peak > overall_peak:
@@ -247,6 +233,10 @@ def calculate_equity_metrics(participant_id: str, fallback_dd: float = 0.0) -> d
                 if dd > max_dd:
                     max_dd = dd
 
+        if count < 2:
+            print(f"⚠️ Max DD: Insufficient equity data ({count} snapshots), using fallback")
+            return {'max_drawdown': fallback_dd, 'peak_equity': stored_peak}
+
         return {
             'max_drawdown': round(max_dd, 2),
             'peak_equity': overall_peak
@@ -283,3 +273,215 @@ def calculate_total_lots(positions: dict) -> float:
         if lot > 0:
             total += lot
     return round(total, 2)
+
+
+# Incremental risk accumulators, one slot per participant (row index in _risk_index)
+_RISK_FIELDS = (
+    'first_equity', 'last_equity', 'last_ts', 'peak', 'max_dd_pct', 'max_dd_amount',
+    'n_returns', 'sum_r', 'sum_r2', 'sum_down2', 'n_points', 'sum_dd2',
+)
+_risk_index = {}  # participant_id -> row
+_risk_state = {name: np.zeros(0) for name in _RISK_FIELDS}
+_risk_watermark = None  # Latest snapshot timestamp (epoch seconds) seen so far
+_risk_metrics = {}  # participant_id -> daily_stats risk columns
+_risk_loaded = False
+
+
+def _grow_risk_state(size: int):
+    """Extend accumulator arrays to hold `size` participants."""
+    current = len(_risk_state['last_ts'])
+    if size <= current:
+        return
+    extra = size - current
+    for name in _RISK_FIELDS:
+        fill = np.nan if name in ('first_equity', 'last_equity') else 0.0
+        if name == 'last_ts':
+            fill = -1.0
+        _risk_state[name] = np.concatenate([_risk_state[name], np.full(extra, fill)])
+
+
+def _fetch_snapshots_since(since_ts) -> list:
+    """Bulk-fetch snapshots for all participants at or after `since_ts` (epoch seconds)."""
+    def where(query):
+        if since_ts is None:
+            return query
+        return query.gte('timestamp', datetime.fromtimestamp(since_ts, tz=timezone.utc).isoformat())
+
+    return list(iter_rows('equity_snapshots', 'participant_id, timestamp, equity', where=where,
+                          keys=('timestamp', 'participant_id'), page_size=RISK_PAGE_SIZE))
+
+
+def _restore_risk_state():
+    """
+    Load the accumulators checkpointed with the last folded snapshot timestamp, so
+    a restart resumes the season instead of rebuilding from the retention window
+    """
+    global _risk_loaded, _risk_watermark
+    _risk_loaded = True
+
+    saved = load_checkpoint(RISK_CHECKPOINT)
+    if not saved or saved.get('watermark') is None:
+        print(f"[Risk] No checkpoint - building from the snapshots still kept ({RETENTION_DAYS} days)")
+        return
+
+    _risk_index.clear()
+    _risk_index.update({pid: row for row, pid in enumerate(saved['participants'])})
+    for name in _RISK_FIELDS:
+        _risk_state[name] = np.array(saved['state'][name], dtype=float)  # None -> nan
+    _risk_watermark = saved['watermark']
+    _refresh_risk_metrics()
+
+    age_days = (datetime.now(timezone.utc).timestamp() - _risk_watermark) / 86400
+    if age_days > RETENTION_DAYS:
+        print(f"[Risk] Checkpoint is {age_days:.0f} days old: snapshots older than {RETENTION_DAYS} days "
+              f"were dropped in between and are missing from the metrics")
+    print(f"[Risk] Restored accumulators for {len(_risk_index)} participants")
+
+
+def _save_risk_state():
+    state = {name: [None if np.isnan(v) else float(v) for v in values] for name, values in _risk_state.items()}
+    save_checkpoint(RISK_CHECKPOINT, {
+        'watermark': _risk_watermark,
+        'participants': sorted(_risk_index, key=_risk_index.get),
+        'state': state,
+    })
+
+
+def update_risk_metrics() -> dict:
+    """
+    Fold new equity snapshots for all participants into the risk accumulators.
+
+    Only snapshots newer than the last seen timestamp are fetched (one bulk
+    query per cycle, with a one-interval overlap to catch late writers), and
+    the per-participant sums are updated with vectorized NumPy operations, so
+    the cost per cycle depends on the number of new snapshots rather than the
+    season length. The accumulators are checkpointed after every fold.
+
+    Returns:
+        dict of participant_id -> risk columns for daily_stats
+    """
+    if not _risk_loaded:
+        _restore_risk_state()
+
+    try:
+        since = None
+        if _risk_watermark is not None:
+            since = _risk_watermark - SNAPSHOT_INTERVAL_MINUTES * 60
+        if fold_risk_snapshots(_fetch_snapshots_since(since)):
+            _refresh_risk_metrics()
+            _save_risk_state()
+    except Exception as e:
+        print(f"❌ Error updating risk metrics: {e}")
+
+    return _risk_metrics
+
+
+def fold_risk_snapshots(rows: list) -> int:
+    """
+    Fold snapshot rows ({'participant_id', 'timestamp', 'equity'}, any order) into
+    the accumulators. Rows at or before a participant's last folded timestamp are
+    skipped. Returns the number of snapshots folded.
+    """
+    global _risk_watermark
+    if not rows:
+        return 0
+
+    for row in rows:
+        if row['participant_id'] not in _risk_index:
+            _risk_index[row['participant_id']] = len(_risk_index)
+    _grow_risk_state(len(_risk_index))
+
+    idx = np.fromiter((_risk_index[r['participant_id']] for r in rows), dtype=np.int64, count=len(rows))
+    ts = np.array([r['timestamp'][:19] for r in rows], dtype='datetime64[s]').astype(np.int64).astype(float)
+    eq = np.fromiter((float(r['equity'] or 0) for r in rows), dtype=float, count=len(rows))
+
+    # Drop rows already folded in (overlap window) and unusable equity values
+    keep = (ts > _risk_state['last_ts'][idx]) & (eq > 0)
+    idx, ts, eq = idx[keep], ts[keep], eq[keep]
+    if len(idx) == 0:
+        return 0
+
+    order = np.lexsort((ts, idx))
+    idx, ts, eq = idx[order], ts[order], eq[order]
+
+    starts = np.flatnonzero(np.r_[True, idx[1:] != idx[:-1]])
+    ends = np.r_[starts[1:], len(idx)] - 1
+    groups = idx[starts]
+    group_no = np.cumsum(np.r_[False, idx[1:] != idx[:-1]])
+
+    # Returns against the previous snapshot (carried over from state at group starts)
+    prev = np.r_[np.nan, eq[:-1]]
+    prev[starts] = _risk_state['last_equity'][groups]
+    valid = np.isfinite(prev) & (prev > 0)
+    r = np.where(valid, eq / np.where(valid, prev, 1.0) - 1.0, 0.0)
+    down = np.minimum(r, 0.0)
+
+    # Segmented running peak seeded with each participant's stored peak
+    scale = max(float(eq.max()), float(_risk_state['peak'].max(initial=0.0))) * 2 + 1
+    offset = group_no * scale
+    running_peak = np.maximum.accumulate(eq + offset) - offset
+    running_peak = np.maximum(running_peak, _risk_state['peak'][idx])
+    dd_amount = running_peak - eq
+    dd_pct = dd_amount / running_peak * 100
+
+    size = len(_risk_index)
+    st = _risk_state
+    st['n_returns'] += np.bincount(idx, weights=valid.astype(float), minlength=size)
+    st['sum_r'] += np.bincount(idx, weights=r, minlength=size)
+    st['sum_r2'] += np.bincount(idx, weights=r * r, minlength=size)
+    st['sum_down2'] += np.bincount(idx, weights=down * down, minlength=size)
+    st['n_points'] += np.bincount(idx, minlength=size)
+    st['sum_dd2'] += np.bincount(idx, weights=dd_pct * dd_pct, minlength=size)
+
+    st['max_dd_pct'][groups] = np.maximum(st['max_dd_pct'][groups], np.maximum.reduceat(dd_pct, starts))
+    st['max_dd_amount'][groups] = np.maximum(st['max_dd_amount'][groups], np.maximum.reduceat(dd_amount, starts))
+    st['peak'][groups] = running_peak[ends]
+    fresh = np.isnan(st['first_equity'][groups])
+    st['first_equity'][groups[fresh]] = eq[starts[fresh]]
+    st['last_equity'][groups] = eq[ends]
+    st['last_ts'][groups] = ts[ends]
+
+    _risk_watermark = float(ts.max()) if _risk_watermark is None else max(_risk_watermark, float(ts.max()))
+    return len(idx)
+
+
+def _refresh_risk_metrics():
+    """Recompute ratio columns for all participants from the accumulators."""
+    st = _risk_state
+    with np.errstate(divide='ignore', invalid='ignore'):
+        n = st['n_returns']
+        mean = np.where(n > 0, st['sum_r'] / n, 0.0)
+        std = np.sqrt(np.maximum(np.where(n > 0, st['sum_r2'] / n, 0.0) - mean * mean, 0.0))
+        downside = np.sqrt(np.where(n > 0, st['sum_down2'] / n, 0.0))
+        annualizer = np.sqrt(RISK_PERIODS_PER_YEAR)
+
+        sharpe = np.where((n >= 2) & (std > 0), mean / std * annualizer, 0.0)
+        sortino = np.where((n >= 2) & (downside > 0), mean / downside * annualizer, 0.0)
+        calmar = np.where(st['max_dd_pct'] > 0, mean * RISK_PERIODS_PER_YEAR * 100 / st['max_dd_pct'], 0.0)
+        net = np.nan_to_num(st['last_equity'] - st['first_equity'])
+        recovery = np.where(st['max_dd_amount'] > 0, net / st['max_dd_amount'], 0.0)
+        ulcer = np.sqrt(np.where(st['n_points'] > 0, st['sum_dd2'] / st['n_points'], 0.0))
+
+    columns = {
+        'sharpe_ratio': sharpe,
+        'sortino_ratio': sortino,
+        'calmar_ratio': calmar,
+        'recovery_factor': recovery,
+        'ulcer_index': ulcer,
+    }
+    for col, values in columns.items():
+        columns[col] = np.round(np.nan_to_num(values, nan=0.0, posinf=0.0, neginf=0.0), 4)
+
+    for pid, row in _risk_index.items():
+        _risk_metrics[pid] = {col: float(values[row]) for col, values in columns.items()}
+
+
+def get_risk_metrics(participant_id: str) -> dict:
+    """Latest risk columns for a participant (zeros until snapshots are available)."""
+    return _risk_metrics.get(participant_id, {
+        'sharpe_ratio': 0.0,
+        'sortino_ratio': 0.0,
+        'calmar_ratio': 0.0,
+        'recovery_factor': 0.0,
+        'ulcer_index': 0.0,
+    })
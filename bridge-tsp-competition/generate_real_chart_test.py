@@ -1,6 +1,8 @@
 import os
 import json
+import numpy as np
 from datetime import datetime
+import candle_store
 from dotenv import load_dotenv
 from supabase import create_client, Client
 
@@ -16,6 +18,8 @@ if not url or not key:
 
 supabase: Client = create_client(url, key)
 
+CHART_TIMEFRAME = os.environ.get("CHART_TIMEFRAME", "M5")
+
 def generate_test_file():
     print("Fetching latest trade...")
     # Fetch latest trade
@@ -31,19 +35,31 @@ def generate_test_file():
     symbol = trade['symbol'].replace('.s', '')
     print(f"Fetching market data for {symbol}...")
     
-    candles_response = supabase.table('market_data') \
-        .select('*') \
-        .eq('symbol', symbol) \
-        .order('time', desc=True) \
-        .limit(1000) \
-        .execute()
-
-    if not candles_response.data:
-        print("No market data found.")
-        return
-
-    # Reverse to get chronological order
-    candles = candles_response.data[::-1]
+    # Local candle store first (written by the bridge on every sync), Supabase as fallback
+    bars = candle_store.read(symbol, CHART_TIMEFRAME)
+    if len(bars['time']):
+        last = slice(-1000, None)
+        times = np.char.add(np.datetime_as_string(bars['time'][last].astype('datetime64[s]')), 'Z').tolist()
+        candles = [
+            {"time": t, "open": o, "high": h, "low": l, "close": c}
+            for t, o, h, l, c in zip(times, *(bars[col][last].tolist() for col in ('open', 'high', 'low', 'close')))
+        ]
+        print(f"Read {len(candles)} {CHART_TIMEFRAME} candles from local store.")
+    else:
+        candles_response = supabase.table('market_data') \
+            .select('*') \
+            .eq('symbol', symbol) \
+            .eq('timeframe', CHART_TIMEFRAME) \
+            .order('time', desc=True) \
+            .limit(1000) \
+            .execute()
+
+        if not candles_response.data:
+            print("No market data found.")
+            return
+
+        # Reverse to get chronological order
+        candles = candles_response.data[::-1]
     print(f"Fetched {len(candles)} candles.")
 
     # Prepare data for HTML
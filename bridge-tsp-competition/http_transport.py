@@ -0,0 +1,202 @@
+"""
+Pooled HTTP transport for the Supabase (PostgREST) client
+
+One httpx connection pool shared by every module through core.get_supabase_client():
+- persistent keep-alive connections (SUPABASE_MAX_CONNECTIONS), HTTP/2 when the h2
+  package is installed (SUPABASE_HTTP2)
+- connect / read / write / pool timeouts on every call (SUPABASE_TIMEOUT seconds for
+  reads), so one slow response fails that call instead of blocking the cycle
+- at most SUPABASE_MAX_CONCURRENCY requests in flight across all threads (backfill
+  pools, read prefetch); waiting longer than the pool timeout raises httpx.PoolTimeout
+- per-endpoint latency histograms (time to response headers), so time spent waiting
+  on Supabase can be told apart from the bridge's own compute
+
+Endpoints are "<METHOD> <table>" (or "<METHOD> rpc/<function>").
+"""
+
+import os
+import time
+import threading
+import importlib.util
+import httpx
+
+HTTP2 = os.getenv("SUPABASE_HTTP2", "true").lower() in ("1", "true", "yes") \
+    and importlib.util.find_spec("h2") is not None
+MAX_CONNECTIONS = int(os.getenv("SUPABASE_MAX_CONNECTIONS", "10"))
+MAX_CONCURRENCY = int(os.getenv("SUPABASE_MAX_CONCURRENCY", "8"))
+KEEPALIVE_SECONDS = float(os.getenv("SUPABASE_KEEPALIVE_SECONDS", "60"))
+CONNECT_RETRIES = int(os.getenv("SUPABASE_CONNECT_RETRIES", "2"))
+TIMEOUT = httpx.Timeout(
+    float(os.getenv("SUPABASE_TIMEOUT", "30")),
+    connect=float(os.getenv("SUPABASE_CONNECT_TIMEOUT", "5")),
+    pool=float(os.getenv("SUPABASE_POOL_TIMEOUT", "30")),
+)
+LATENCY_REPORT_MINUTES = float(os.getenv("SUPABASE_LATENCY_REPORT_MINUTES", "15"))
+
+# Histogram bucket upper bounds (ms); the last bucket is everything slower
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+_lock = threading.Lock()
+# endpoint -> {'counts': [per bucket], 'errors', 'seconds', 'max_ms'}
+_latency = {}
+_remote_seconds = 0.0
+_last_report = time.monotonic()
+
+
+def endpoint_name(request: httpx.Request) -> str:
+    path = request.url.path
+    marker = '/rest/v1/'
+    if marker in path:
+        path = path.split(marker, 1)[1]
+    return f"{request.method} {path.strip('/') or '/'}"
+
+
+def _record(endpoint: str, seconds: float, error: bool):
+    global _remote_seconds
+    ms = seconds * 1000
+    bucket = next((i for i, bound in enumerate(LATENCY_BUCKETS_MS) if ms <= bound), len(LATENCY_BUCKETS_MS))
+    with _lock:
+        entry = _latency.get(endpoint)
+        if entry is None:
+            entry = _latency[endpoint] = {
+                'counts': [0] * (len(LATENCY_BUCKETS_MS) + 1), 'errors': 0, 'seconds': 0.0, 'max_ms': 0.0,
+            }
+        entry['counts'][bucket] += 1
+        entry['seconds'] += seconds
+        entry['max_ms'] = max(entry['max_ms'], ms)
+        if error:
+            entry['errors'] += 1
+        _remote_seconds += seconds
+
+
+class MeteredTransport(httpx.BaseTransport):
+    """Wraps the pooled transport with the concurrency bound and latency recording"""
+
+    def __init__(self, inner: httpx.BaseTransport, max_concurrency: int, acquire_timeout: float):
+        self._inner = inner
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._acquire_timeout = acquire_timeout
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        endpoint = endpoint_name(request)
+        if not self._slots.acquire(timeout=self._acquire_timeout):
+            _record(endpoint, 0.0, error=True)
+            raise httpx.PoolTimeout(f"No request slot within {self._acquire_timeout}s ({endpoint})", request=request)
+        start = time.perf_counter()
+        try:
+            response = self._inner.handle_request(request)
+        except Exception:
+            _record(endpoint, time.perf_counter() - start, error=True)
+            raise
+        finally:
+            self._slots.release()
+        _record(endpoint, time.perf_counter() - start, error=response.status_code >= 500)
+        return response
+
+    def close(self):
+        # Shared by every session: a session closing must not close the pool
+        pass
+
+    def close_pool(self):
+        self._inner.close()
+
+
+def create_transport() -> MeteredTransport:
+    pooled = httpx.HTTPTransport(
+        http2=HTTP2,
+        retries=CONNECT_RETRIES,
+        limits=httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_SECONDS,
+        ),
+    )
+    return MeteredTransport(pooled, MAX_CONCURRENCY, TIMEOUT.pool)
+
+
+_transport = None
+
+
+def shared_transport() -> MeteredTransport:
+    """The process-wide transport (created on first use)"""
+    global _transport
+    if _transport is None:
+        _transport = create_transport()
+    return _transport
+
+
+def use_pooled_transport(client):
+    """
+    Route a supabase Client's PostgREST calls through the shared transport. The
+    PostgREST sub-client is rebuilt by supabase on auth changes, so its factory is
+    replaced too.
+    """
+    from postgrest import SyncPostgrestClient
+    from postgrest.utils import SyncClient
+
+    class PooledPostgrestClient(SyncPostgrestClient):
+        def create_session(self, base_url, headers, timeout, *args, **kwargs):
+            return SyncClient(base_url=base_url, headers=headers, timeout=TIMEOUT,
+                              transport=shared_transport(), follow_redirects=True)
+
+    def init_postgrest_client(rest_url, headers, schema, timeout=None, *args, **kwargs):
+        return PooledPostgrestClient(rest_url, headers=headers, schema=schema)
+
+    client._init_postgrest_client = init_postgrest_client
+    client._postgrest = None  # rebuilt on next access with the pooled session
+    return client
+
+
+def remote_seconds() -> float:
+    """Total seconds spent waiting on Supabase since start (compare deltas per cycle)"""
+    return _remote_seconds
+
+
+def latency_report(reset: bool = False) -> list:
+    """
+    Per-endpoint latency summary, slowest total first:
+    [{'endpoint', 'count', 'errors', 'seconds', 'p50_ms', 'p95_ms', 'max_ms'}]
+    Percentiles are histogram bucket upper bounds.
+    """
+    with _lock:
+        snapshot = {k: {**v, 'counts': list(v['counts'])} for k, v in _latency.items()}
+        if reset:
+            _latency.clear()
+
+    def percentile(counts, q):
+        target = q * sum(counts)
+        seen = 0
+        for i, n in enumerate(counts):
+            seen += n
+            if seen >= target and n:
+                return LATENCY_BUCKETS_MS[i] if i < len(LATENCY_BUCKETS_MS) else float('inf')
+        return 0
+
+    report = []
+    for endpoint, entry in snapshot.items():
+        report.append({
+            'endpoint': endpoint,
+            'count': sum(entry['counts']),
+            'errors': entry['errors'],
+            'seconds': round(entry['seconds'], 3),
+            'p50_ms': percentile(entry['counts'], 0.5),
+            'p95_ms': percentile(entry['counts'], 0.95),
+            'max_ms': round(entry['max_ms'], 1),
+        })
+    report.sort(key=lambda r: r['seconds'], reverse=True)
+    return report
+
+
+def log_latency_report(force: bool = False, top: int = 10):
+    """Print and reset the histograms every LATENCY_REPORT_MINUTES"""
+    global _last_report
+    if not force and time.monotonic() - _last_report < LATENCY_REPORT_MINUTES * 60:
+        return
+    _last_report = time.monotonic()
+    report = latency_report(reset=True)
+    if not report:
+        return
+    print(f"[HTTP] Supabase latency by endpoint (last {LATENCY_REPORT_MINUTES:g} min, HTTP/2={'on' if HTTP2 else 'off'}):")
+    for row in report[:top]:
+        print(f"  {row['endpoint']:<40} n={row['count']:<5} err={row['errors']:<3} total={row['seconds']:.2f}s "
+              f"p50<={row['p50_ms']}ms p95<={row['p95_ms']}ms max={row['max_ms']}ms")
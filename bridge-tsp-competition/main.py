@@ -1,11 +1,9 @@
 import os
 import gc
 import time
-import MetaTrader5 as mt5
 from datetime import datetime, timezone, timedelta
-from collections import Counter
 import csv
-from core import init_mt5, get_supabase_client, load_env, send_telegram_message
+from core import init_mt5, get_supabase_client, send_telegram_message, iter_rows
 from tz_config import THAILAND_TZ
 from equity_service import (
     should_record_snapshot,
@@ -13,27 +11,25 @@ from equity_service import (
     calculate_equity_growth,
     calculate_total_lots,
     cleanup_old_snapshots,
-    calculate_equity_metrics
+    calculate_equity_metrics,
+    update_risk_metrics,
+    get_risk_metrics
 )
 from smart_alerts import check_alerts
-from weekly_report import check_weekly_report
-from achievements import check_achievements
-from market_data_service import sync_market_data
-
-# Load environment variables
-load_env()
+from report_engine import check_reports
+from achievements import check_badges, flush_achievements
+from period_stats import update_period_stats
+from market_data_service import sync_market_data, cleanup_old_data
+from trade_excursion import add_excursions
+from trade_stats import TradeStats, position_points
 
 MT5_SERVER_OFFSET_SECONDS = 10800
-POSITION_TYPE_BUY = getattr(mt5, 'POSITION_TYPE_BUY', mt5.ORDER_TYPE_BUY)
 
 SYNC_INTERVAL = int(os.getenv("SYNC_INTERVAL", "300"))  # Default 5 minutes
 
 # Competition start date (configurable via env, default 2026-01-01 for new season)
 HISTORY_START_DATE = os.getenv("HISTORY_START_DATE", "2026-01-01")
 
-# Initialize Supabase client (single instance reused throughout)
-supabase = get_supabase_client()
-
 # Global symbol cache - persists across participants and sync cycles
 _symbol_cache = {}
 
@@ -41,6 +37,9 @@ def mt5_timestamp_to_iso(timestamp):
     return datetime.fromtimestamp(timestamp - MT5_SERVER_OFFSET_SECONDS, tz=timezone.utc).isoformat()
 
 def sync_open_positions(participant, live_positions):
+    import MetaTrader5 as mt5
+    position_type_buy = getattr(mt5, 'POSITION_TYPE_BUY', mt5.ORDER_TYPE_BUY)
+    supabase = get_supabase_client()
     synced_at = datetime.now(timezone.utc).isoformat()
     current_position_ids = set()
     positions_data = []
@@ -58,7 +57,7 @@ def sync_open_positions(participant, live_positions):
             "participant_id": participant['id'],
             "position_id": position_id,
             "symbol": symbol,
-            "type": 'BUY' if getattr(position, 'type', None) == POSITION_TYPE_BUY else 'SELL',
+            "type": 'BUY' if getattr(position, 'type', None) == position_type_buy else 'SELL',
             "lot_size": float(getattr(position, 'volume', 0) or 0),
             "open_price": float(getattr(position, 'price_open', 0) or 0),
             "open_time": mt5_timestamp_to_iso(opened_at),
@@ -68,12 +67,10 @@ def sync_open_positions(participant, live_positions):
         })
 
     try:
-        existing_res = supabase.table('open_positions').select('position_id').eq('participant_id', participant['id']).execute()
-        existing_ids = {
-            int(row['position_id'])
-            for row in (existing_res.data or [])
-            if row.get('position_id') is not None
-        }
+        existing_rows = iter_rows('open_positions', 'position_id',
+                                  where=lambda q: q.eq('participant_id', participant['id']),
+                                  keys=('position_id',))
+        existing_ids = {int(row['position_id']) for row in existing_rows}
 
         if positions_data:
             supabase.table('open_positions').upsert(positions_data, on_conflict='participant_id,position_id').execute()
@@ -97,8 +94,13 @@ def sync_open_positions(participant, live_positions):
         print(f"Error syncing open positions: {e}")
 
 def sync_participant(participant):
-    """Sync a single participant's data from MT5 to Supabase."""
+    """
+    Sync a single participant's data from MT5 to Supabase.
+    Returns the daily_stats row that was written, or None if nothing was written.
+    """
     global _symbol_cache
+    import MetaTrader5 as mt5
+    supabase = get_supabase_client()
 
     print(f"Syncing participant: {participant['nickname']} ({participant['account_id']})")
 
@@ -222,22 +224,6 @@ def sync_participant(participant):
 
         # --- Phase 2: Calculate stats from FULLY CLOSED positions only ---
         # A position is fully closed if it has close deals AND is NOT in open_position_ids
-        gross_profit = 0
-        gross_loss = 0
-        total_profit = 0
-        wins = 0
-        losses = 0
-        total_trades = 0
-        total_points = 0
-        best_trade = -float('inf')
-        worst_trade = float('inf')
-        buy_trades = 0
-        buy_wins = 0
-        sell_trades = 0
-        sell_wins = 0
-        peak_profit = -float('inf')
-        current_profit_curve = 0
-        max_drawdown_val = 0
         symbols = []
 
         # Sort closed positions by close_time for accurate DD & consecutive calculation
@@ -249,33 +235,12 @@ def sync_participant(participant):
                 symbols.append(pos['symbol'])
 
         closed_positions.sort(key=lambda x: x[1]['close_time'])
+        trade_stats = TradeStats()
+        period_trades = []  # per-trade profit/points for the period_stats rollup
+        points_by_position = {}  # stored on trades rows so the replay reuses the same points
 
         for pid, pos in closed_positions:
-            trade_profit = pos['total_profit']
-            total_trades += 1
-            total_profit += trade_profit
-
-            if trade_profit > 0:
-                wins += 1
-                gross_profit += trade_profit
-            elif trade_profit < 0:
-                losses += 1
-                gross_loss += abs(trade_profit)
-
-            if trade_profit > best_trade:
-                best_trade = trade_profit
-            if trade_profit < worst_trade:
-                worst_trade = trade_profit
-
-            # Long/Short stats
-            if pos['type'] == 'BUY':
-                buy_trades += 1
-                if trade_profit > 0:
-                    buy_wins += 1
-            elif pos['type'] == 'SELL':
-                sell_trades += 1
-                if trade_profit > 0:
-                    sell_wins += 1
+            trade_points = 0
 
             # Weighted Points calculation from partials
             if pos['open_price'] > 0 and pos['original_lot'] > 0:
@@ -291,160 +256,34 @@ def sync_participant(participant):
                     sym_info = _symbol_cache[sym]
 
                     if sym_info and sym_info.point > 0:
-                        for partial in pos['partials']:
-                            if pos['type'] == 'BUY':
-                                p_diff = partial['close_price'] - pos['open_price']
-                            else:
-                                p_diff = pos['open_price'] - partial['close_price']
-
-                            raw_points = p_diff / sym_info.point
-                            # Weight by partial lot / original lot
-                            weighted_points = raw_points * (partial['lot'] / pos['original_lot'])
-                            total_points += weighted_points
-
-            # DD Calculation (ordered by close_time)
-            current_profit_curve += trade_profit
-            if current_profit_curve > peak_profit:
-                peak_profit = current_profit_curve
-
-            dd = peak_profit - current_profit_curve
-            if dd > max_drawdown_val:
-                max_drawdown_val = dd
+                        trade_points = position_points(pos, sym_info.point)
+            points_by_position[pid] = trade_points
+
+            trade_stats.add({
+                "profit": pos['total_profit'],
+                "points": trade_points,
+                "type": pos['type'],
+                "symbol": pos['symbol'],
+                "open_time": pos['open_time'] - MT5_SERVER_OFFSET_SECONDS if pos['open_time'] > 0 else 0,
+                "close_time": pos['close_time'] - MT5_SERVER_OFFSET_SECONDS,
+            })
+            period_trades.append({
+                "close_time": datetime.fromtimestamp(pos['close_time'] - MT5_SERVER_OFFSET_SECONDS, tz=timezone.utc),
+                "profit": pos['total_profit'],
+                "points": trade_points,
+                "symbol": pos['symbol'],
+                "type": pos['type'],
+            })
 
         still_open = sum(1 for pid in positions if pid in open_position_ids and positions[pid]['close_time'] > 0)
         if still_open > 0:
             print(f"  Skipped {still_open} partially-closed positions (still open)")
 
-        # Calculate aggregates
-        win_rate = (wins / total_trades * 100) if total_trades > 0 else 0
-        win_rate_buy = (buy_wins / buy_trades * 100) if buy_trades > 0 else 0
-        win_rate_sell = (sell_wins / sell_trades * 100) if sell_trades > 0 else 0
-
-        profit_factor = (gross_profit / gross_loss) if gross_loss > 0 else (gross_profit if gross_profit > 0 else 0)
-
-        # Max DD %
-        current_balance = account_info.balance
-        start_balance = current_balance - total_profit
-        peak_balance = start_balance + peak_profit
-
-        if peak_balance > 0:
-            closed_trade_dd = (max_drawdown_val / peak_balance * 100)
-        else:
-            closed_trade_dd = 0
-
+        closed_trade_dd = trade_stats.closed_trade_drawdown(account_info.balance)
         equity_metrics = calculate_equity_metrics(participant['id'], fallback_dd=closed_trade_dd)
         max_dd_percent = equity_metrics['max_drawdown']
         peak_equity = equity_metrics['peak_equity']
 
-        # Avg Win / Loss
-        avg_win = (gross_profit / wins) if wins > 0 else 0
-        avg_loss = -(gross_loss / losses) if losses > 0 else 0
-
-        # RR Ratio
-        rr_ratio = abs(avg_win / avg_loss) if avg_loss != 0 else 0
-
-        # Holding Time, Consecutive Stats, Session Stats - all from closed_positions
-        total_duration = 0
-        duration_count = 0
-        win_duration = 0
-        win_duration_count = 0
-        loss_duration = 0
-        loss_duration_count = 0
-
-        max_consecutive_wins = 0
-        max_consecutive_losses = 0
-        current_consecutive_wins = 0
-        current_consecutive_losses = 0
-
-        session_stats = {
-            'asian': {'profit': 0, 'wins': 0, 'total': 0},
-            'london': {'profit': 0, 'wins': 0, 'total': 0},
-            'newyork': {'profit': 0, 'wins': 0, 'total': 0}
-        }
-
-        for pid, pos in closed_positions:
-            trade_profit = pos['total_profit']
-
-            # Consecutive wins/losses (already sorted by close_time)
-            if trade_profit > 0:
-                current_consecutive_wins += 1
-                current_consecutive_losses = 0
-                if current_consecutive_wins > max_consecutive_wins:
-                    max_consecutive_wins = current_consecutive_wins
-            elif trade_profit < 0:
-                current_consecutive_losses += 1
-                current_consecutive_wins = 0
-                if current_consecutive_losses > max_consecutive_losses:
-                    max_consecutive_losses = current_consecutive_losses
-
-            # Session stats
-            if pos['open_time'] > 0:
-                open_hour = datetime.utcfromtimestamp(pos['open_time'] - 10800).hour
-                is_win = trade_profit > 0
-
-                if 0 <= open_hour < 8:
-                    session_stats['asian']['profit'] += trade_profit
-                    session_stats['asian']['total'] += 1
-                    if is_win: session_stats['asian']['wins'] += 1
-
-                if 7 <= open_hour < 16:
-                    session_stats['london']['profit'] += trade_profit
-                    session_stats['london']['total'] += 1
-                    if is_win: session_stats['london']['wins'] += 1
-
-                if 12 <= open_hour < 21:
-                    session_stats['newyork']['profit'] += trade_profit
-                    session_stats['newyork']['total'] += 1
-                    if is_win: session_stats['newyork']['wins'] += 1
-
-            # Holding time
-            if pos['open_time'] > 0 and pos['close_time'] > 0:
-                duration = pos['close_time'] - pos['open_time']
-                if duration >= 0:
-                    total_duration += duration
-                    duration_count += 1
-
-                    if trade_profit > 0:
-                        win_duration += duration
-                        win_duration_count += 1
-                    elif trade_profit < 0:
-                        loss_duration += duration
-                        loss_duration_count += 1
-
-        avg_holding_seconds = (total_duration / duration_count) if duration_count > 0 else 0
-        avg_win_holding_seconds = (win_duration / win_duration_count) if win_duration_count > 0 else 0
-        avg_loss_holding_seconds = (loss_duration / loss_duration_count) if loss_duration_count > 0 else 0
-
-        def format_duration(seconds):
-            m, s = divmod(seconds, 60)
-            h, m = divmod(m, 60)
-            d, h = divmod(h, 24)
-            if d > 0: return f"{int(d)}d {int(h)}h"
-            if h > 0: return f"{int(h)}h {int(m)}m"
-            return f"{int(m)}m {int(s)}s"
-
-        avg_holding_time_str = format_duration(avg_holding_seconds)
-        avg_holding_time_win_str = format_duration(avg_win_holding_seconds)
-        avg_holding_time_loss_str = format_duration(avg_loss_holding_seconds)
-
-        # Trading Style
-        avg_holding_minutes = avg_holding_seconds / 60
-        if avg_holding_minutes < 30:
-            trading_style = "Scalping"
-        elif avg_holding_minutes < 1440:
-            trading_style = "Intraday"
-        else:
-            trading_style = "Swing"
-
-        if duration_count == 0:
-            trading_style = "Unknown"
-
-        # Favorite Pair
-        favorite_pair = "-"
-        if symbols:
-            c = Counter(symbols)
-            favorite_pair = c.most_common(1)[0][0]
-
         # 4. Update Daily Stats in Supabase
         today = datetime.now(THAILAND_TZ).date().isoformat()
 
@@ -453,39 +292,16 @@ def sync_participant(participant):
             "date": today,
             "balance": account_info.balance,
             "equity": account_info.equity,
-            "profit": total_profit,
-            "points": int(total_points),
-            "win_rate": win_rate,
-            "total_trades": total_trades,
-            "profit_factor": round(profit_factor, 2),
-            "rr_ratio": round(rr_ratio, 2),
+            **trade_stats.stats(symbols),
             "max_drawdown": round(max_dd_percent, 2),
-            "avg_win": round(avg_win, 2),
-            "avg_loss": round(avg_loss, 2),
-            "trading_style": trading_style,
-            "favorite_pair": favorite_pair,
-            "avg_holding_time": avg_holding_time_str,
-            "best_trade": float(best_trade) if best_trade != -float('inf') else 0,
-            "worst_trade": float(worst_trade) if worst_trade != float('inf') else 0,
-            "win_rate_buy": round(win_rate_buy, 2),
-            "win_rate_sell": round(win_rate_sell, 2),
-            "avg_holding_time_win": avg_holding_time_win_str,
-            "avg_holding_time_loss": avg_holding_time_loss_str,
-            "max_consecutive_wins": max_consecutive_wins,
-            "max_consecutive_losses": max_consecutive_losses,
-            "session_asian_profit": round(session_stats['asian']['profit'], 2),
-            "session_london_profit": round(session_stats['london']['profit'], 2),
-            "session_newyork_profit": round(session_stats['newyork']['profit'], 2),
-            "session_asian_win_rate": round((session_stats['asian']['wins'] / session_stats['asian']['total'] * 100), 2) if session_stats['asian']['total'] > 0 else 0,
-            "session_london_win_rate": round((session_stats['london']['wins'] / session_stats['london']['total'] * 100), 2) if session_stats['london']['total'] > 0 else 0,
-            "session_newyork_win_rate": round((session_stats['newyork']['wins'] / session_stats['newyork']['total'] * 100), 2) if session_stats['newyork']['total'] > 0 else 0,
             "floating_pl": round(account_info.equity - account_info.balance, 2),
             "total_lots": calculate_total_lots(positions),
             "equity_growth_percent": calculate_equity_growth(participant['id'], account_info.equity),
-            "peak_equity": peak_equity
+            "peak_equity": peak_equity,
+            **get_risk_metrics(participant['id'])
         }
 
-        print(f"Stats for {participant['nickname']}: WinRate={win_rate:.1f}%, Trades={total_trades}")
+        print(f"Stats for {participant['nickname']}: WinRate={stats_data['win_rate']:.1f}%, Trades={stats_data['total_trades']}")
 
         # 5. Update Trades History in Supabase (fully closed positions only)
         trades_data = []
@@ -503,10 +319,12 @@ def sync_participant(participant):
                     "open_time": mt5_timestamp_to_iso(pos['open_time']),
                     "close_time": mt5_timestamp_to_iso(pos['close_time']),
                     "profit": float(pos['total_profit']),
+                    "points": float(points_by_position[pid]),
                     "position_id": pid
                 })
 
         if trades_data:
+            add_excursions(participant['id'], trades_data, positions, _symbol_cache)
             try:
                 supabase.table('trades').upsert(trades_data, on_conflict='participant_id,position_id').execute()
                 print(f"Synced {len(trades_data)} trades for {participant['nickname']}")
@@ -514,22 +332,24 @@ def sync_participant(participant):
                 print(f"Error syncing trades: {e}")
 
         # Upsert daily stats
+        stats_written = False
         try:
             supabase.table('daily_stats').upsert(stats_data, on_conflict='participant_id,date').execute()
+            stats_written = True
             print(f"Updated stats for {participant['nickname']}")
 
-            try:
-                check_achievements(participant['id'], stats_data)
-            except Exception as e:
-                print(f"[Achievements] Error for {participant['nickname']}: {e}")
+            update_period_stats(participant['id'], period_trades)
         except Exception as e:
             print(f"Error updating stats: {e}")
 
         # Free large data structures
-        del positions, order_map, trades_data, history_deals, closed_positions
+        del positions, order_map, trades_data, history_deals, closed_positions, period_trades
         if all_orders:
             del all_orders
 
+        # Hand the written stats to post-sync consumers (alerts) without a re-read
+        return stats_data if stats_written else None
+
 _csv_last_mtime = 0
 
 def sync_participants_from_csv(force=False):
@@ -546,6 +366,7 @@ def sync_participants_from_csv(force=False):
     _csv_last_mtime = current_mtime
 
     print(f"Syncing participants from {csv_file} to Supabase...")
+    supabase = get_supabase_client()
 
     try:
         with open(csv_file, mode='r', encoding='utf-8-sig') as f:
@@ -588,7 +409,16 @@ def sync_participants_from_csv(force=False):
 
 
 def main():
-    # 0. Sync Participants from CSV first (force on startup)
+    # Windows-only MT5 package and the HTTP stack load here, so importing main stays cheap
+    import MetaTrader5 as mt5
+    from http_transport import remote_seconds, log_latency_report
+
+    # 0. Partitions covering now must exist before the first snapshot/candle write: after
+    #    a stop longer than PARTITION_PRECREATE_DAYS those rows would land in DEFAULT
+    cleanup_old_snapshots(force=True)
+    cleanup_old_data(force=True)
+
+    # Sync Participants from CSV first (force on startup)
     sync_participants_from_csv(force=True)
 
     if not init_mt5():
@@ -599,16 +429,22 @@ def main():
 
     while True:
         start_time = time.time()
+        remote_start = remote_seconds()
         print(f"\n--- Sync Cycle Start: {datetime.now(THAILAND_TZ).strftime('%H:%M:%S')} ---")
+        cycle_stats = {}  # participant_id -> stats_data written this cycle
 
         try:
-            response = supabase.table('participants').select("*").execute()
-            participants = response.data
+            participants = list(iter_rows('participants', "*"))
+
+            # Risk-adjusted metrics for all participants from new equity snapshots
+            update_risk_metrics()
 
             for p in participants:
                 if p.get('account_id') and p.get('investor_password') and p.get('server'):
                     try:
-                        sync_participant(p)
+                        stats_data = sync_participant(p)
+                        if stats_data:
+                            cycle_stats[p['id']] = stats_data
                     except Exception as e:
                         print(f"[ERROR] Failed to sync {p['nickname']}: {e}")
                 else:
@@ -620,20 +456,24 @@ def main():
             send_telegram_message(f"⚠️ Bridge Error:\n{error_msg}")
 
         elapsed = time.time() - start_time
-        print(f"--- Sync Cycle Complete in {elapsed:.2f}s ---")
+        remote = remote_seconds() - remote_start
+        print(f"--- Sync Cycle Complete in {elapsed:.2f}s (Supabase {remote:.2f}s, local {elapsed - remote:.2f}s) ---")
 
         # Post-sync tasks
+        check_badges(cycle_stats)
+        new_badges = flush_achievements()
+
         try:
-            check_alerts()
+            check_alerts(cycle_stats, new_badges)
         except Exception as e:
             print(f"[Smart Alerts] Error: {e}")
 
         try:
-            check_weekly_report()
+            check_reports()
         except Exception as e:
-            print(f"[Weekly Report] Error: {e}")
+            print(f"[Reports] Error: {e}")
 
-        # Sync market data (XAUUSD candles)
+        # Sync market data (candles for gold and every traded symbol)
         try:
             sync_market_data()
         except Exception as e:
@@ -641,6 +481,7 @@ def main():
 
         cleanup_old_snapshots()
         sync_participants_from_csv()
+        log_latency_report()
 
         # Force garbage collection after each cycle
         gc.collect()
@@ -653,6 +494,7 @@ def main():
     mt5.shutdown()
 
 if __name__ == "__main__":
+    import MetaTrader5 as mt5
     try:
         main()
     except KeyboardInterrupt:
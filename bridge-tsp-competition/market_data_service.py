@@ -1,26 +1,26 @@
-import MetaTrader5 as mt5
+import os
+import re
+import argparse
+import numpy as np
+from itertools import repeat
 from datetime import datetime, timezone, timedelta
-from core import get_supabase_client, load_env
+from core import get_supabase_client, maintain_time_partitions, init_mt5, iter_rows
+from candle_resample import bucket_start, resample_rates, compare_bars
+import candle_store
 from tz_config import THAILAND_TZ
 
-# Load environment variables
-load_env()
-
-# Initialize Supabase client (singleton from core)
-supabase = get_supabase_client()
-
-# Timeframe configuration: (MT5 timeframe, retention days, candle count to fetch)
-# Candle counts are small for periodic sync (upsert handles duplicates)
+# Timeframe configuration: (MT5 timeframe constant name, retention days, bar length in seconds)
+# Each cycle fetches from the last stored candle (watermark) to now
 TIMEFRAMES = {
-    'M1': (mt5.TIMEFRAME_M1, 3, 60),        # last 1 hour
-    'M5': (mt5.TIMEFRAME_M5, 14, 60),       # last 5 hours
-    'M15': (mt5.TIMEFRAME_M15, 30, 60),     # last 15 hours
-    'H1': (mt5.TIMEFRAME_H1, 90, 48),       # last 2 days
-    'H4': (mt5.TIMEFRAME_H4, 180, 48),      # last 8 days
-    'D1': (mt5.TIMEFRAME_D1, None, 30),     # last 1 month
+    'M1': ('TIMEFRAME_M1', 3, 60),
+    'M5': ('TIMEFRAME_M5', 14, 300),
+    'M15': ('TIMEFRAME_M15', 30, 900),
+    'H1': ('TIMEFRAME_H1', 90, 3600),
+    'H4': ('TIMEFRAME_H4', 180, 14400),
+    'D1': ('TIMEFRAME_D1', None, 86400),
 }
 
-# Full backfill counts (used once on first run)
+# Full backfill counts (used when a timeframe has no stored candles; also caps catch-up after long outages)
 BACKFILL_COUNTS = {
     'M1': 4320,    # 3 days
     'M5': 4032,    # 14 days
@@ -30,96 +30,524 @@ BACKFILL_COUNTS = {
     'D1': 365,     # 1 year
 }
 
-_backfill_done = False
+# Range partition width per timeframe (see migrations/010_time_partitioning.sql)
+PARTITION_DAYS = {
+    'M1': 1,
+    'M5': 7,
+    'M15': 7,
+    'H1': 28,
+    'H4': 28,
+}
+
+# MT5 server time is UTC+3
+MT5_SERVER_OFFSET_SECONDS = 10800
+
+# Max rows per market_data upsert request (rows are fixed-size, ~150 bytes of JSON each)
+UPSERT_CHUNK_ROWS = 2000
+
+CANDLE_KEYS = ("symbol", "timeframe", "time", "open", "high", "low", "close", "volume")
+
+# Timeframes built locally from M1 (one MT5 call per cycle) once they have stored candles;
+# MARKET_DATA_DERIVE=false fetches every timeframe from MT5 instead
+DERIVE_FROM_M1 = os.getenv("MARKET_DATA_DERIVE", "true").lower() == "true"
+DERIVED_TIMEFRAMES = ('M5', 'M15', 'H1', 'H4', 'D1')
+
+# Stored candles are compared against the broker's bars this often to repair holes
+GAP_SCAN_HOURS = 6
+STORED_PAGE_SIZE = 1000
+
+# Tracked symbols: gold plus every symbol in trades / open_positions (traded_symbols view),
+# stored under a normalized name (broker suffixes like .s / m / c stripped)
+DEFAULT_SYMBOL = "XAUUSD"
+SYMBOL_ALIASES = {'GOLD': 'XAUUSD', 'SILVER': 'XAGUSD'}
+SYMBOL_REFRESH_MINUTES = 30
+BROKER_SUFFIXES = ('.s', 'm', 'c')
+
+# Per-symbol cadence (minutes between syncs); unlisted symbols use DEFAULT_SYMBOL_SETTINGS.
+# Every symbol keeps its timeframe's retention: rows only leave market_data when the
+# time partition holding them is dropped, never through per-symbol row deletes.
+SYMBOL_SETTINGS = {
+    'XAUUSD': {'interval_minutes': 0},
+}
+DEFAULT_SYMBOL_SETTINGS = {
+    'interval_minutes': int(os.getenv("MARKET_DATA_SYMBOL_INTERVAL_MINUTES", "15")),
+}
+RETENTION_TRIM_HOURS = 6  # Local candle store trim cadence
+
+# Every synced bar is also kept in the local memory-mapped store (candle_store) for
+# charts and analytics; it keeps more history than Supabase. The store is seeded from
+# MT5 over the backfill window on its own, since the sync starts at the Supabase watermark
+CANDLE_STORE_ENABLED = os.getenv("CANDLE_STORE_ENABLED", "true").lower() == "true"
+CANDLE_STORE_RETENTION_DAYS = int(os.getenv("CANDLE_STORE_RETENTION_DAYS", "365"))
+
+_SUFFIXED = re.compile(r'^([A-Z0-9]{3,})(?:\.[A-Za-z]+|[mc])$')
 
-def get_symbol():
-    """Try multiple symbol variants and return the first available one"""
-    symbols_to_try = ["XAUUSD", "XAUUSD.s", "GOLD"]
-    for s in symbols_to_try:
-        if mt5.symbol_select(s, True):
-            return s
+# (symbol, timeframe) -> time of the last stored candle (UTC epoch seconds), seeded from market_data
+_watermarks = {}
+# (symbol, timeframe) -> time of the last gap scan
+_last_gap_scan = {}
+# normalized symbol -> broker symbol, refreshed every SYMBOL_REFRESH_MINUTES
+_tracked = {'symbols': {}, 'refreshed_at': None}
+# normalized symbol -> time of its last sync
+_last_symbol_sync = {}
+_last_retention_trim = None
+# (symbol, timeframe) whose local store was seeded over the backfill window this run
+_store_seeded = set()
+
+
+def normalize_symbol(raw: str) -> str:
+    """Broker symbol -> stored name: XAUUSD.s / XAUUSDm / XAUUSDc / GOLD -> XAUUSD"""
+    name = raw.strip()
+    match = _SUFFIXED.match(name)
+    if match:
+        name = match.group(1)
+    name = name.upper()
+    return SYMBOL_ALIASES.get(name, name)
+
+
+def _symbol_settings(symbol: str) -> dict:
+    return SYMBOL_SETTINGS.get(symbol, DEFAULT_SYMBOL_SETTINGS)
+
+
+def resolve_broker_symbol(symbol: str, seen=()):
+    """First selectable broker name for a normalized symbol (names seen in trades first)"""
+    import MetaTrader5 as mt5
+    candidates = list(seen) + [symbol] + [symbol + suffix for suffix in BROKER_SUFFIXES]
+    candidates += [alias for alias, target in SYMBOL_ALIASES.items() if target == symbol]
+    for candidate in dict.fromkeys(candidates):
+        if mt5.symbol_select(candidate, True):
+            return candidate
     return None
 
-def sync_timeframe(symbol: str, tf_name: str, mt5_tf: int, count: int):
-    """Sync a specific timeframe to Supabase"""
-    rates = mt5.copy_rates_from_pos(symbol, mt5_tf, 0, count)
-    if rates is None:
-        print(f"  ❌ Failed to copy {tf_name} rates: {mt5.last_error()}")
-        return 0
-    
-    market_data = []
-    for rate in rates:
-        # Convert MT5 server time (UTC+3) to UTC
-        dt = datetime.fromtimestamp(rate['time'] - 10800, tz=timezone.utc)
-        
-        market_data.append({
-            "symbol": "XAUUSD",  # Normalized symbol
-            "timeframe": tf_name,
-            "time": dt.isoformat(),
-            "open": float(rate['open']),
-            "high": float(rate['high']),
-            "low": float(rate['low']),
-            "close": float(rate['close']),
-            "volume": int(rate['tick_volume'])
-        })
-    
-    if market_data:
+
+def get_tracked_symbols() -> dict:
+    """normalized symbol -> broker symbol for gold and every traded symbol"""
+    now = datetime.now(timezone.utc)
+    refreshed_at = _tracked['refreshed_at']
+    if refreshed_at and now - refreshed_at < timedelta(minutes=SYMBOL_REFRESH_MINUTES):
+        return _tracked['symbols']
+
+    seen = {DEFAULT_SYMBOL: []}
+    try:
+        rows = iter_rows('traded_symbols', 'symbol', where=lambda q: q.not_.is_('symbol', 'null'), keys=('symbol',))
+        for row in rows:
+            if row['symbol']:
+                seen.setdefault(normalize_symbol(row['symbol']), []).append(row['symbol'])
+    except Exception as e:
+        print(f"[Market Data] Error fetching traded symbols: {e}")
+
+    symbols = {}
+    for symbol, raw_names in seen.items():
+        broker_symbol = _tracked['symbols'].get(symbol) or resolve_broker_symbol(symbol, raw_names)
+        if broker_symbol:
+            symbols[symbol] = broker_symbol
+        else:
+            print(f"[Market Data] No broker symbol for {symbol} ({', '.join(raw_names) or 'no trades'})")
+
+    _tracked['symbols'] = symbols
+    _tracked['refreshed_at'] = now
+    return symbols
+
+
+def rates_to_rows(rates, symbol: str, tf_name: str) -> list:
+    """
+    Convert an MT5 rates structured array into market_data rows.
+
+    Times are shifted from server time to UTC and formatted as one datetime64
+    array operation; columns are converted with tolist() instead of per-row
+    field access.
+    """
+    if rates is None or len(rates) == 0:
+        return []
+
+    utc = (rates['time'].astype(np.int64) - MT5_SERVER_OFFSET_SECONDS).astype('datetime64[s]')
+    times = np.char.add(np.datetime_as_string(utc, unit='s'), '+00:00').tolist()
+
+    return [
+        dict(zip(CANDLE_KEYS, row))
+        for row in zip(
+            repeat(symbol), repeat(tf_name), times,
+            rates['open'].astype(float).tolist(),
+            rates['high'].astype(float).tolist(),
+            rates['low'].astype(float).tolist(),
+            rates['close'].astype(float).tolist(),
+            rates['tick_volume'].astype(np.int64).tolist(),
+        )
+    ]
+
+
+def upsert_batch(batch: list) -> int:
+    """
+    Upsert queued candles of every symbol and timeframe in UPSERT_CHUNK_ROWS-sized
+    requests, then advance the watermark of each (symbol, timeframe) whose rows were
+    all written; a failed chunk is retried from the old watermark next time.
+
+    Args:
+        batch: [((symbol, timeframe), rows, new watermark or None)]
+
+    Returns:
+        Rows written
+    """
+    supabase = get_supabase_client()
+    rows = []
+    spans = []
+    for key, key_rows, watermark in batch:
+        spans.append((key, len(rows), len(rows) + len(key_rows), watermark))
+        rows.extend(key_rows)
+
+    written = 0
+    failed = []
+    for start in range(0, len(rows), UPSERT_CHUNK_ROWS):
+        chunk = rows[start:start + UPSERT_CHUNK_ROWS]
         try:
             supabase.table('market_data').upsert(
-                market_data, 
+                chunk,
                 on_conflict='symbol,time,timeframe'
             ).execute()
-            return len(market_data)
+            written += len(chunk)
         except Exception as e:
-            print(f"  ❌ Error syncing {tf_name}: {e}")
-            return 0
-    return 0
+            failed.append((start, start + len(chunk)))
+            print(f"  ❌ Error upserting candles (rows {start}-{start + len(chunk) - 1}): {e}")
 
-def cleanup_old_data():
-    """Delete old data based on retention policy"""
-    now = datetime.now(timezone.utc)
-    
+    for key, first, last, watermark in spans:
+        if watermark is not None and last > first and not any(f0 < last and first < f1 for f0, f1 in failed):
+            _watermarks[key] = watermark
+    return written
+
+
+def _queue(batch: list, symbol: str, tf_name: str, rates, advance: bool = True) -> int:
+    """Queue rates for upsert and add them to the local store; the watermark moves to the last bar once written"""
+    if rates is None or len(rates) == 0:
+        return 0
+    if CANDLE_STORE_ENABLED:
+        try:
+            candle_store.write_rates(symbol, tf_name, rates, MT5_SERVER_OFFSET_SECONDS)
+        except Exception as e:
+            print(f"  ❌ Error writing {symbol} {tf_name} to local candle store: {e}")
+    watermark = int(rates['time'][-1]) - MT5_SERVER_OFFSET_SECONDS if advance else None
+    batch.append(((symbol, tf_name), rates_to_rows(rates, symbol, tf_name), watermark))
+    return len(rates)
+
+
+def _parse_utc(value: str) -> int:
+    return int(datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp())
+
+
+def _server_time(utc_seconds: int) -> datetime:
+    """MT5 range queries compare against server-time bar stamps"""
+    return datetime.fromtimestamp(utc_seconds + MT5_SERVER_OFFSET_SECONDS, tz=timezone.utc)
+
+
+def _load_watermark(symbol: str, tf_name: str):
+    """Time of the newest stored candle, or None if the timeframe has never been synced"""
+    supabase = get_supabase_client()
+    res = supabase.table('market_data') \
+        .select('time') \
+        .eq('symbol', symbol) \
+        .eq('timeframe', tf_name) \
+        .order('time', desc=True) \
+        .limit(1) \
+        .execute()
+    return _parse_utc(res.data[0]['time']) if res.data else None
+
+
+def _stored_times(symbol: str, tf_name: str, since: int) -> np.ndarray:
+    """Candle times (UTC epoch seconds) stored since `since`"""
+    since_iso = datetime.fromtimestamp(since, tz=timezone.utc).isoformat()
+    rows = iter_rows('market_data', 'time',
+                     where=lambda q: q.eq('symbol', symbol).eq('timeframe', tf_name).gte('time', since_iso),
+                     keys=('time',), page_size=STORED_PAGE_SIZE)
+    return np.array([_parse_utc(row['time']) for row in rows], dtype=np.int64)
+
+
+def _watermark(symbol: str, tf_name: str):
+    key = (symbol, tf_name)
+    if key not in _watermarks:
+        _watermarks[key] = _load_watermark(symbol, tf_name)
+    return _watermarks[key]
+
+
+def sync_timeframe(broker_symbol: str, symbol: str, tf_name: str, batch: list) -> int:
+    """
+    Queue new candles of one timeframe, starting at the last stored candle (re-sent,
+    since it may still have been forming). Returns candles queued.
+    """
+    import MetaTrader5 as mt5
+    tf_const, _, bar_seconds = TIMEFRAMES[tf_name]
+    mt5_tf = getattr(mt5, tf_const)
+    watermark = _watermark(symbol, tf_name)
+    window = BACKFILL_COUNTS[tf_name]
+
+    now = int(datetime.now(timezone.utc).timestamp())
+    if watermark is None:
+        print(f"  {symbol} {tf_name}: no stored candles, backfilling {window}")
+        rates = mt5.copy_rates_from_pos(broker_symbol, mt5_tf, 0, window)
+    else:
+        # Catch-up after an outage is capped at the backfill window
+        start = max(watermark, now - window * bar_seconds)
+        rates = mt5.copy_rates_range(broker_symbol, mt5_tf, _server_time(start), _server_time(now + bar_seconds))
+
+    if rates is None:
+        print(f"  ❌ Failed to copy {symbol} {tf_name} rates: {mt5.last_error()}")
+        return 0
+    return _queue(batch, symbol, tf_name, rates)
+
+
+def seed_store(broker_symbol: str, symbol: str, tf_name: str, since: int = None) -> int:
+    """
+    Fill the local candle store with the broker's bars from `since` (UTC epoch seconds;
+    default: the start of the BACKFILL_COUNTS window) up to its oldest stored bar,
+    or up to now if nothing is stored. Independent of the Supabase watermark, so a
+    store added to an existing deployment still gets the history.
+
+    Returns:
+        Bars written
+    """
+    import MetaTrader5 as mt5
+    tf_const, _, bar_seconds = TIMEFRAMES[tf_name]
+    now = int(datetime.now(timezone.utc).timestamp())
+    if since is None:
+        since = now - BACKFILL_COUNTS[tf_name] * bar_seconds
+    first = candle_store.first_time(symbol, tf_name)
+    until = now + bar_seconds if first is None else first - 1
+    if since >= until:
+        return 0
+
+    rates = mt5.copy_rates_range(broker_symbol, getattr(mt5, tf_const), _server_time(since), _server_time(until))
+    if rates is None:
+        print(f"  ❌ Failed to copy {symbol} {tf_name} rates for the local store: {mt5.last_error()}")
+        return 0
+    return candle_store.write_rates(symbol, tf_name, rates, MT5_SERVER_OFFSET_SECONDS)
+
+
+def repair_gaps(broker_symbol: str, symbol: str, tf_name: str, batch: list) -> int:
+    """
+    Compare stored candles with the broker's bars over the retention window and
+    queue the missing ones (holes from failed writes or partial MT5 responses).
+    Market closures are not gaps: only bars the broker has are expected.
+    """
+    import MetaTrader5 as mt5
+    tf_const, _, bar_seconds = TIMEFRAMES[tf_name]
+    mt5_tf = getattr(mt5, tf_const)
+    now = int(datetime.now(timezone.utc).timestamp())
+    since = now - BACKFILL_COUNTS[tf_name] * bar_seconds
+
+    rates = mt5.copy_rates_range(broker_symbol, mt5_tf, _server_time(since), _server_time(now + bar_seconds))
+    if rates is None or len(rates) == 0:
+        return 0
+
+    stored = _stored_times(symbol, tf_name, since)
+    if not len(stored):
+        return 0  # Nothing stored yet - the incremental sync backfills
+
+    # Holes are broker bars missing between/after stored candles, not before the oldest one
+    broker_times = rates['time'].astype(np.int64) - MT5_SERVER_OFFSET_SECONDS
+    missing = (broker_times >= stored[0]) & ~np.isin(broker_times, stored)
+    # The forming bar is the incremental sync's job
+    missing[-1] = False
+    if not missing.any():
+        return 0
+
+    print(f"  🩹 Repairing {int(missing.sum())} missing {symbol} {tf_name} candle(s)")
+    return _queue(batch, symbol, tf_name, rates[missing], advance=False)
+
+
+def sync_derived(broker_symbol: str, symbol: str, batch: list):
+    """
+    Queue new M1 candles and the derived timeframes rebuilt from them, with a single
+    MT5 call.
+
+    M1 is fetched from the start of the longest derived bar touched since the
+    watermarks, so every rebuilt bar is complete; only those touched bars are
+    queued. Derived timeframes without stored candles are left to the direct
+    sync (their backfill reaches further back than M1 history).
+
+    Returns:
+        Timeframes handled, or () if M1 has no watermark yet
+    """
+    import MetaTrader5 as mt5
+    m1_watermark = _watermark(symbol, 'M1')
+    if m1_watermark is None:
+        return ()
+
+    now = int(datetime.now(timezone.utc).timestamp())
+    # Catch-up through M1 is capped at the M1 window; older holes go to repair_gaps
+    floor = now - BACKFILL_COUNTS['M1'] * 60
+    m1_from = max(m1_watermark, floor)
+
+    derived = [tf for tf in DERIVED_TIMEFRAMES if _watermark(symbol, tf) is not None]
+    rebuild_from = {
+        tf: bucket_start(max(min(m1_from, _watermarks[(symbol, tf)]), floor) + MT5_SERVER_OFFSET_SECONDS,
+                         TIMEFRAMES[tf][2])
+        for tf in derived
+    }
+    fetch_from = min([m1_from + MT5_SERVER_OFFSET_SECONDS] + list(rebuild_from.values()))
+
+    handled = ('M1',) + tuple(derived)
+    rates = mt5.copy_rates_range(broker_symbol, mt5.TIMEFRAME_M1,
+                                 datetime.fromtimestamp(fetch_from, tz=timezone.utc), _server_time(now + 60))
+    if rates is None:
+        print(f"  ❌ Failed to copy {symbol} M1 rates: {mt5.last_error()}")
+        return handled
+
+    _queue(batch, symbol, 'M1', rates[rates['time'] >= m1_from + MT5_SERVER_OFFSET_SECONDS])
+    for tf_name in derived:
+        bars = resample_rates(rates, TIMEFRAMES[tf_name][2])
+        _queue(batch, symbol, tf_name, bars[bars['time'] >= rebuild_from[tf_name]])
+    return handled
+
+
+def validate_derived(broker_symbol: str, days: int = 3) -> bool:
+    """Compare bars derived from M1 with the broker's own bars over the last `days` days"""
+    import MetaTrader5 as mt5
+    now = int(datetime.now(timezone.utc).timestamp())
+    start = bucket_start(now - days * 86400 + MT5_SERVER_OFFSET_SECONDS, 86400)
+    date_from = datetime.fromtimestamp(start, tz=timezone.utc)
+    date_to = _server_time(now + 60)
+
+    m1 = mt5.copy_rates_range(broker_symbol, mt5.TIMEFRAME_M1, date_from, date_to)
+    if m1 is None or len(m1) == 0:
+        print(f"[Market Data] Validation failed: no M1 rates ({mt5.last_error()})")
+        return False
+
+    ok = True
+    for tf_name in DERIVED_TIMEFRAMES:
+        tf_const, _, bar_seconds = TIMEFRAMES[tf_name]
+        broker = mt5.copy_rates_range(broker_symbol, getattr(mt5, tf_const), date_from, date_to)
+        if broker is None:
+            print(f"  ❌ {tf_name}: failed to copy broker rates: {mt5.last_error()}")
+            ok = False
+            continue
+
+        # The forming bar differs by design until it closes
+        derived = resample_rates(m1, bar_seconds)[:-1]
+        report = compare_bars(derived, broker[:-1])
+        mismatches = report['price_mismatch'] + report['volume_mismatch'] + report['missing'] + report['extra']
+        ok &= mismatches == 0
+        print(f"  {'✅' if mismatches == 0 else '⚠️'} {tf_name}: {report['compared']} bars compared, "
+              f"{report['price_mismatch']} price / {report['volume_mismatch']} volume mismatches, "
+              f"{report['missing']} missing, {report['extra']} extra")
+        for server_time, d, b in report['examples']:
+            when = datetime.fromtimestamp(server_time - MT5_SERVER_OFFSET_SECONDS, tz=timezone.utc).isoformat()
+            print(f"      {when}: derived O{d['open']} H{d['high']} L{d['low']} C{d['close']} V{d['tick_volume']} | "
+                  f"broker O{b['open']} H{b['high']} L{b['low']} C{b['close']} V{b['tick_volume']}")
+    return ok
+
+
+def cleanup_old_data(force: bool = False):
+    """
+    Pre-create upcoming time partitions and drop those past each timeframe's
+    retention (on the core maintenance schedule; force: run now, e.g. at startup)
+    """
     for tf_name, (_, retention_days, _) in TIMEFRAMES.items():
         if retention_days is None:
-            continue  # No retention limit
-        
-        cutoff = now - timedelta(days=retention_days)
+            continue  # No retention limit (D1 is not time-partitioned)
+
+        result = maintain_time_partitions(f"market_data_{tf_name.lower()}", PARTITION_DAYS[tf_name], retention_days,
+                                          force=force)
+        if result and result[1] > 0:
+            print(f"  🗑️ Dropped {result[1]} old {tf_name} partition(s)")
+
+    # The local candle store keeps more history than Supabase; trim it now and then
+    global _last_retention_trim
+    if not CANDLE_STORE_ENABLED:
+        return
+    now = datetime.now(timezone.utc)
+    if _last_retention_trim and now - _last_retention_trim < timedelta(hours=RETENTION_TRIM_HOURS):
+        return
+    _last_retention_trim = now
+
+    store_cutoff = int((now - timedelta(days=CANDLE_STORE_RETENTION_DAYS)).timestamp())
+    for symbol, timeframes in candle_store.stored().items():
+        for tf_name in timeframes:
+            try:
+                candle_store.trim(symbol, tf_name, store_cutoff)
+            except Exception as e:
+                print(f"  ❌ Error trimming local {symbol} {tf_name}: {e}")
+
+
+def sync_symbol(broker_symbol: str, symbol: str, batch: list, now: datetime) -> int:
+    """Queue one symbol's new candles (all timeframes) and periodic gap repairs"""
+    queued = 0
+    handled = ()
+    if CANDLE_STORE_ENABLED:
+        for tf_name in TIMEFRAMES:
+            if (symbol, tf_name) in _store_seeded:
+                continue
+            try:
+                seeded = seed_store(broker_symbol, symbol, tf_name)
+                if seeded:
+                    print(f"  💾 Seeded local {symbol} {tf_name} store with {seeded} bar(s)")
+                _store_seeded.add((symbol, tf_name))
+            except Exception as e:
+                print(f"  ❌ Error seeding local {symbol} {tf_name} store: {e}")
+
+    if DERIVE_FROM_M1:
         try:
-            result = supabase.table('market_data').delete().eq(
-                'timeframe', tf_name
-            ).lt('time', cutoff.isoformat()).execute()
-            
-            # Check if any rows were deleted
-            if result.data and len(result.data) > 0:
-                print(f"  🗑️ Cleaned up {len(result.data)} old {tf_name} candles")
+            handled = sync_derived(broker_symbol, symbol, batch)
         except Exception as e:
-            print(f"  ❌ Error cleaning {tf_name}: {e}")
+            print(f"  ❌ Error deriving {symbol} timeframes from M1: {e}")
+
+    for tf_name in TIMEFRAMES:
+        try:
+            if tf_name not in handled:
+                queued += sync_timeframe(broker_symbol, symbol, tf_name, batch)
+
+            # Scan on the first cycle after a restart, then every GAP_SCAN_HOURS
+            key = (symbol, tf_name)
+            last_scan = _last_gap_scan.get(key)
+            if last_scan is None or now - last_scan >= timedelta(hours=GAP_SCAN_HOURS):
+                queued += repair_gaps(broker_symbol, symbol, tf_name, batch)
+                _last_gap_scan[key] = now
+        except Exception as e:
+            print(f"  ❌ Error syncing {symbol} {tf_name}: {e}")
+    return queued
 
-def sync_market_data():
-    """Sync all timeframes for XAUUSD. First call does full backfill, subsequent calls fetch recent only."""
-    global _backfill_done
 
-    symbol = get_symbol()
-    if not symbol:
-        print("[Market Data] Failed to select any gold symbol")
+def sync_market_data():
+    """
+    Sync candles for every tracked symbol from each (symbol, timeframe) watermark,
+    on each symbol's cadence, in one batch of size-bounded upserts.
+    """
+    symbols = get_tracked_symbols()
+    if not symbols:
+        print("[Market Data] No tradable symbols to sync")
         return
 
-    is_backfill = not _backfill_done
-    if is_backfill:
-        print(f"[Market Data] Backfilling {symbol} (first run)...")
-    else:
-        print(f"[Market Data] Syncing {symbol}...")
+    now = datetime.now(timezone.utc)
+    due = {
+        symbol: broker_symbol for symbol, broker_symbol in symbols.items()
+        if symbol not in _last_symbol_sync
+        or now - _last_symbol_sync[symbol] >= timedelta(minutes=_symbol_settings(symbol)['interval_minutes'])
+    }
+    if due:
+        print(f"[Market Data] Syncing {len(due)}/{len(symbols)} symbol(s): {', '.join(sorted(due))}")
 
-    total_candles = 0
-    for tf_name, (mt5_tf, _, count) in TIMEFRAMES.items():
-        # Use larger count for first-time backfill
-        fetch_count = BACKFILL_COUNTS[tf_name] if is_backfill else count
-        synced = sync_timeframe(symbol, tf_name, mt5_tf, fetch_count)
-        if synced > 0:
-            total_candles += synced
+        batch = []
+        for symbol, broker_symbol in due.items():
+            sync_symbol(broker_symbol, symbol, batch, now)
+            _last_symbol_sync[symbol] = now
 
-    print(f"[Market Data] {total_candles} candles synced")
-    _backfill_done = True
+        print(f"[Market Data] {upsert_batch(batch)} candles synced")
 
     # Cleanup old data once per cycle
     cleanup_old_data()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Market data tools")
+    parser.add_argument('--validate', action='store_true', help="compare bars derived from M1 with broker bars")
+    parser.add_argument('--symbol', default=DEFAULT_SYMBOL)
+    parser.add_argument('--days', type=int, default=3)
+    args = parser.parse_args()
+
+    if args.validate:
+        if not init_mt5():
+            raise SystemExit(1)
+        symbol = normalize_symbol(args.symbol)
+        broker_symbol = resolve_broker_symbol(symbol, [args.symbol])
+        if not broker_symbol:
+            raise SystemExit(f"Failed to select {args.symbol}")
+        print(f"[Market Data] Validating derived timeframes for {broker_symbol} over {args.days} day(s)")
+        raise SystemExit(0 if validate_derived(broker_symbol, args.days) else 1)
+    parser.print_help()
@@ -0,0 +1,11 @@
+-- Migration: Add risk-adjusted metrics to daily_stats
+-- Computed by the bridge from equity_snapshots returns (equity_service.update_risk_metrics)
+--
+-- Run this in Supabase SQL Editor
+
+ALTER TABLE public.daily_stats
+  ADD COLUMN IF NOT EXISTS sharpe_ratio numeric DEFAULT 0,
+  ADD COLUMN IF NOT EXISTS sortino_ratio numeric DEFAULT 0,
+  ADD COLUMN IF NOT EXISTS calmar_ratio numeric DEFAULT 0,
+  ADD COLUMN IF NOT EXISTS recovery_factor numeric DEFAULT 0,
+  ADD COLUMN IF NOT EXISTS ulcer_index numeric DEFAULT 0;
@@ -0,0 +1,203 @@
+-- Migration: Native time partitioning for equity_snapshots and market_data
+-- Retention becomes DETACH + DROP of whole partitions instead of large DELETEs.
+--
+--   equity_snapshots : RANGE (timestamp), 1-day partitions
+--   market_data      : LIST (timeframe) -> RANGE (time) per timeframe
+--                      M1 1-day, M5/M15 7-day, H1/H4 28-day partitions, D1 unpartitioned
+--
+-- The bridge calls ensure_time_partitions / drop_time_partitions via RPC
+-- (core.maintain_time_partitions). Existing rows are copied into the new tables,
+-- so run this in a quiet period with the bridge stopped.
+--
+-- Run this in Supabase SQL Editor
+
+BEGIN;
+
+-- ============================================
+-- 1. Partition maintenance functions
+-- ============================================
+CREATE OR REPLACE FUNCTION public.ensure_time_partitions(
+  p_parent text,
+  p_interval interval,
+  p_from timestamptz,
+  p_to timestamptz
+) RETURNS integer
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+  v_start timestamptz := date_bin(p_interval, p_from, timestamptz '2000-01-03 00:00:00+00');
+  v_name text;
+  v_created integer := 0;
+BEGIN
+  WHILE v_start < p_to LOOP
+    v_name := p_parent || '_' || to_char(v_start AT TIME ZONE 'UTC', 'YYYYMMDD');
+    IF to_regclass('public.' || quote_ident(v_name)) IS NULL THEN
+      EXECUTE format(
+        'CREATE TABLE public.%I PARTITION OF public.%I FOR VALUES FROM (%L) TO (%L)',
+        v_name, p_parent, v_start, v_start + p_interval
+      );
+      v_created := v_created + 1;
+    END IF;
+    v_start := v_start + p_interval;
+  END LOOP;
+  RETURN v_created;
+END $$;
+
+CREATE OR REPLACE FUNCTION public.drop_time_partitions(
+  p_parent text,
+  p_cutoff timestamptz
+) RETURNS integer
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+  r record;
+  v_dropped integer := 0;
+BEGIN
+  FOR r IN
+    SELECT c.relname,
+           (regexp_match(pg_get_expr(c.relpartbound, c.oid), 'TO \(''([^'']+)''\)'))[1]::timestamptz AS upper_bound
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = ('public.' || quote_ident(p_parent))::regclass
+  LOOP
+    -- Only partitions whose whole range is past the cutoff (DEFAULT has no bound)
+    IF r.upper_bound IS NOT NULL AND r.upper_bound <= p_cutoff THEN
+      EXECUTE format('ALTER TABLE public.%I DETACH PARTITION public.%I', p_parent, r.relname);
+      EXECUTE format('DROP TABLE public.%I', r.relname);
+      v_dropped := v_dropped + 1;
+    END IF;
+  END LOOP;
+  RETURN v_dropped;
+END $$;
+
+REVOKE ALL ON FUNCTION public.ensure_time_partitions(text, interval, timestamptz, timestamptz) FROM PUBLIC, anon, authenticated;
+REVOKE ALL ON FUNCTION public.drop_time_partitions(text, timestamptz) FROM PUBLIC, anon, authenticated;
+
+-- Move constraint and index names out of the way so the new tables can reuse them
+CREATE OR REPLACE FUNCTION pg_temp.rename_to_legacy(p_table text) RETURNS void
+LANGUAGE plpgsql AS $$
+DECLARE
+  r record;
+BEGIN
+  EXECUTE format('ALTER TABLE public.%I RENAME TO %I', p_table, p_table || '_legacy');
+  FOR r IN
+    SELECT conname FROM pg_constraint
+    WHERE conrelid = ('public.' || quote_ident(p_table || '_legacy'))::regclass
+      AND contype IN ('p', 'u')
+  LOOP
+    EXECUTE format('ALTER TABLE public.%I RENAME CONSTRAINT %I TO %I',
+                   p_table || '_legacy', r.conname, left(r.conname, 55) || '_legacy');
+  END LOOP;
+  FOR r IN
+    SELECT c.relname FROM pg_index x
+    JOIN pg_class c ON c.oid = x.indexrelid
+    WHERE x.indrelid = ('public.' || quote_ident(p_table || '_legacy'))::regclass
+      AND NOT EXISTS (SELECT 1 FROM pg_constraint k WHERE k.conindid = x.indexrelid)
+  LOOP
+    EXECUTE format('ALTER INDEX public.%I RENAME TO %I', r.relname, left(r.relname, 55) || '_legacy');
+  END LOOP;
+END $$;
+
+-- ============================================
+-- 2. equity_snapshots -> daily range partitions
+-- ============================================
+SELECT pg_temp.rename_to_legacy('equity_snapshots');
+
+CREATE TABLE public.equity_snapshots (
+  id uuid DEFAULT uuid_generate_v4() NOT NULL,
+  participant_id uuid REFERENCES public.participants(id) ON DELETE CASCADE NOT NULL,
+  timestamp timestamp with time zone NOT NULL,
+  balance numeric NOT NULL,
+  equity numeric NOT NULL,
+  floating_pl numeric DEFAULT 0,
+  margin_level numeric,
+  created_at timestamp with time zone DEFAULT timezone('utc'::text, now()) NOT NULL,
+  PRIMARY KEY (id, timestamp),
+  UNIQUE (participant_id, timestamp)
+) PARTITION BY RANGE (timestamp);
+
+CREATE TABLE public.equity_snapshots_default PARTITION OF public.equity_snapshots DEFAULT;
+
+SELECT public.ensure_time_partitions(
+  'equity_snapshots', interval '1 day',
+  (SELECT coalesce(min(timestamp), now()) FROM public.equity_snapshots_legacy),
+  now() + interval '7 days'
+);
+
+INSERT INTO public.equity_snapshots
+  SELECT id, participant_id, timestamp, balance, equity, floating_pl, margin_level, created_at
+  FROM public.equity_snapshots_legacy;
+
+DROP TABLE public.equity_snapshots_legacy;
+
+CREATE INDEX IF NOT EXISTS idx_equity_snapshots_participant_time
+  ON public.equity_snapshots (participant_id, timestamp DESC);
+CREATE INDEX IF NOT EXISTS idx_equity_snapshots_timestamp
+  ON public.equity_snapshots (timestamp);
+CREATE INDEX IF NOT EXISTS idx_equity_snapshots_participant_equity
+  ON public.equity_snapshots (participant_id, equity DESC);
+
+ALTER TABLE public.equity_snapshots ENABLE ROW LEVEL SECURITY;
+CREATE POLICY "Allow public read access on equity_snapshots"
+  ON public.equity_snapshots FOR SELECT USING (true);
+
+-- ============================================
+-- 3. market_data -> LIST (timeframe) -> RANGE (time)
+-- ============================================
+SELECT pg_temp.rename_to_legacy('market_data');
+
+CREATE TABLE public.market_data (
+  symbol text NOT NULL,
+  time timestamp with time zone NOT NULL,
+  open numeric NOT NULL,
+  high numeric NOT NULL,
+  low numeric NOT NULL,
+  close numeric NOT NULL,
+  volume bigint,
+  timeframe text NOT NULL DEFAULT 'M15',
+  PRIMARY KEY (symbol, time, timeframe)
+) PARTITION BY LIST (timeframe);
+
+CREATE TABLE public.market_data_m1 PARTITION OF public.market_data FOR VALUES IN ('M1') PARTITION BY RANGE (time);
+CREATE TABLE public.market_data_m5 PARTITION OF public.market_data FOR VALUES IN ('M5') PARTITION BY RANGE (time);
+CREATE TABLE public.market_data_m15 PARTITION OF public.market_data FOR VALUES IN ('M15') PARTITION BY RANGE (time);
+CREATE TABLE public.market_data_h1 PARTITION OF public.market_data FOR VALUES IN ('H1') PARTITION BY RANGE (time);
+CREATE TABLE public.market_data_h4 PARTITION OF public.market_data FOR VALUES IN ('H4') PARTITION BY RANGE (time);
+CREATE TABLE public.market_data_d1 PARTITION OF public.market_data FOR VALUES IN ('D1');
+CREATE TABLE public.market_data_other PARTITION OF public.market_data DEFAULT;
+
+CREATE TABLE public.market_data_m1_default PARTITION OF public.market_data_m1 DEFAULT;
+CREATE TABLE public.market_data_m5_default PARTITION OF public.market_data_m5 DEFAULT;
+CREATE TABLE public.market_data_m15_default PARTITION OF public.market_data_m15 DEFAULT;
+CREATE TABLE public.market_data_h1_default PARTITION OF public.market_data_h1 DEFAULT;
+CREATE TABLE public.market_data_h4_default PARTITION OF public.market_data_h4 DEFAULT;
+
+SELECT public.ensure_time_partitions(p.parent, p.step,
+         coalesce((SELECT min(time) FROM public.market_data_legacy WHERE timeframe = p.tf), now()),
+         now() + interval '7 days')
+FROM (VALUES
+  ('market_data_m1', 'M1', interval '1 day'),
+  ('market_data_m5', 'M5', interval '7 days'),
+  ('market_data_m15', 'M15', interval '7 days'),
+  ('market_data_h1', 'H1', interval '28 days'),
+  ('market_data_h4', 'H4', interval '28 days')
+) AS p(parent, tf, step);
+
+INSERT INTO public.market_data (symbol, time, open, high, low, close, volume, timeframe)
+  SELECT symbol, time, open, high, low, close, volume, coalesce(timeframe, 'M15')
+  FROM public.market_data_legacy;
+
+DROP TABLE public.market_data_legacy;
+
+CREATE INDEX IF NOT EXISTS idx_market_data_symbol_timeframe
+  ON public.market_data (symbol, timeframe, time DESC);
+
+ALTER TABLE public.market_data ENABLE ROW LEVEL SECURITY;
+CREATE POLICY "Allow public read access on market_data"
+  ON public.market_data FOR SELECT USING (true);
+
+COMMIT;
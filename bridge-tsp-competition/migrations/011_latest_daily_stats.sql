@@ -0,0 +1,27 @@
+-- Migration: Latest daily_stats row per participant
+-- Used by smart_alerts.check_alerts and report_engine so they read one row per
+-- participant instead of the whole daily_stats table (which PostgREST truncates).
+-- Both are served by idx_daily_stats_participant_date (participant_id, date DESC).
+--
+-- Run this in Supabase SQL Editor
+
+CREATE OR REPLACE VIEW public.latest_daily_stats
+WITH (security_invoker = true) AS
+  SELECT DISTINCT ON (participant_id) *
+  FROM public.daily_stats
+  ORDER BY participant_id, date DESC;
+
+-- Latest row per participant on or before a given date (e.g. standings a week ago)
+CREATE OR REPLACE FUNCTION public.daily_stats_as_of(p_date date)
+RETURNS SETOF public.daily_stats
+LANGUAGE sql
+STABLE
+AS $$
+  SELECT DISTINCT ON (participant_id) *
+  FROM public.daily_stats
+  WHERE date <= p_date
+  ORDER BY participant_id, date DESC;
+$$;
+
+GRANT SELECT ON public.latest_daily_stats TO anon, authenticated, service_role;
+GRANT EXECUTE ON FUNCTION public.daily_stats_as_of(date) TO anon, authenticated, service_role;
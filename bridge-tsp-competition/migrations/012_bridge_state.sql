@@ -0,0 +1,13 @@
+-- Migration: Bridge state checkpoints
+-- Optional mirror of the bridge's local state files (alert engine state, report
+-- scheduling), enabled with BRIDGE_STATE_SUPABASE=true. Service role only.
+--
+-- Run this in Supabase SQL Editor
+
+CREATE TABLE IF NOT EXISTS public.bridge_state (
+    key text PRIMARY KEY,
+    state jsonb NOT NULL,
+    updated_at timestamptz DEFAULT timezone('utc'::text, now()) NOT NULL
+);
+
+ALTER TABLE public.bridge_state ENABLE ROW LEVEL SECURITY;
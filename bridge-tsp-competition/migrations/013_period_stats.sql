@@ -0,0 +1,30 @@
+-- Migration: Period rollups per participant (day / ISO week / month)
+-- Maintained by the bridge on every sync (period_stats.update_period_stats) and
+-- read by the reports with one row per participant.
+--
+-- Run this in Supabase SQL Editor
+
+CREATE TABLE IF NOT EXISTS public.period_stats (
+    participant_id uuid REFERENCES public.participants(id) ON DELETE CASCADE NOT NULL,
+    period_type text NOT NULL CHECK (period_type IN ('day', 'week', 'month')),
+    period_start date NOT NULL,
+    points numeric DEFAULT 0,
+    profit numeric DEFAULT 0,
+    trade_count integer DEFAULT 0,
+    wins integer DEFAULT 0,
+    best_trade numeric,
+    best_trade_symbol text,
+    best_trade_type text,
+    worst_trade numeric,
+    worst_trade_symbol text,
+    worst_trade_type text,
+    updated_at timestamptz DEFAULT timezone('utc'::text, now()) NOT NULL,
+    PRIMARY KEY (participant_id, period_type, period_start)
+);
+
+CREATE INDEX IF NOT EXISTS idx_period_stats_period
+    ON public.period_stats (period_type, period_start);
+
+ALTER TABLE public.period_stats ENABLE ROW LEVEL SECURITY;
+CREATE POLICY "Allow public read access on period_stats"
+    ON public.period_stats FOR SELECT USING (true);
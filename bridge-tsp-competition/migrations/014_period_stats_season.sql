@@ -0,0 +1,8 @@
+-- Migration: Season-to-date rollup rows in period_stats
+-- period_type 'season' has period_start = the bridge's HISTORY_START_DATE
+--
+-- Run this in Supabase SQL Editor
+
+ALTER TABLE public.period_stats DROP CONSTRAINT IF EXISTS period_stats_period_type_check;
+ALTER TABLE public.period_stats ADD CONSTRAINT period_stats_period_type_check
+    CHECK (period_type IN ('day', 'week', 'month', 'season'));
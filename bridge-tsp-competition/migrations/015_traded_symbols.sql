@@ -0,0 +1,12 @@
+-- Migration: Distinct symbols traded or held by participants
+-- Drives which symbols market_data_service syncs candles for (normalized in the bridge)
+--
+-- Run this in Supabase SQL Editor
+
+CREATE INDEX IF NOT EXISTS idx_trades_symbol ON public.trades (symbol);
+
+CREATE OR REPLACE VIEW public.traded_symbols
+WITH (security_invoker = true) AS
+  SELECT DISTINCT symbol FROM public.trades
+  UNION
+  SELECT DISTINCT symbol FROM public.open_positions;
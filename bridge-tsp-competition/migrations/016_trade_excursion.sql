@@ -0,0 +1,11 @@
+-- Migration: Maximum adverse / favorable excursion per closed trade
+-- Filled by the bridge (trade_excursion.py) from M1 candles; NULL until the
+-- trade's bars are available
+--
+-- Run this in Supabase SQL Editor
+
+ALTER TABLE public.trades
+  ADD COLUMN IF NOT EXISTS mae_points NUMERIC,
+  ADD COLUMN IF NOT EXISTS mfe_points NUMERIC,
+  ADD COLUMN IF NOT EXISTS mae_usd NUMERIC,
+  ADD COLUMN IF NOT EXISTS mfe_usd NUMERIC;
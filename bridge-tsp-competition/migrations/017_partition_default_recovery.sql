@@ -0,0 +1,86 @@
+-- Migration: ensure_time_partitions moves rows out of the DEFAULT partition
+-- Rows written while no partition covered their time (e.g. the bridge was stopped
+-- longer than PARTITION_PRECREATE_DAYS) land in <parent>_default. A range
+-- partition cannot then be created over them, so the old function failed on every
+-- call from that point on and DEFAULT kept growing without ever being dropped.
+--
+-- The range loop now starts at the oldest DEFAULT row. For a range DEFAULT holds
+-- rows in, the partition is created standalone, the rows are moved into it and it
+-- is attached; drop_time_partitions then removes it once it is past retention.
+-- Ranges before p_from are only created when DEFAULT has rows in them.
+--
+-- Run this in Supabase SQL Editor
+
+CREATE OR REPLACE FUNCTION public.ensure_time_partitions(
+  p_parent text,
+  p_interval interval,
+  p_from timestamptz,
+  p_to timestamptz
+) RETURNS integer
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+  v_origin constant timestamptz := timestamptz '2000-01-03 00:00:00+00';
+  v_first timestamptz := date_bin(p_interval, p_from, v_origin);
+  v_default regclass;
+  v_key text;
+  v_oldest timestamptz;
+  v_start timestamptz;
+  v_end timestamptz;
+  v_name text;
+  v_in_default boolean;
+  v_moved bigint;
+  v_created integer := 0;
+BEGIN
+  SELECT nullif(pt.partdefid, 0)::regclass, a.attname
+    INTO v_default, v_key
+  FROM pg_partitioned_table pt
+  JOIN pg_attribute a ON a.attrelid = pt.partrelid AND a.attnum = pt.partattrs[0]
+  WHERE pt.partrelid = ('public.' || quote_ident(p_parent))::regclass;
+
+  IF v_default IS NOT NULL THEN
+    EXECUTE format('SELECT min(%I) FROM %s', v_key, v_default) INTO v_oldest;
+  END IF;
+
+  v_start := date_bin(p_interval, least(p_from, coalesce(v_oldest, p_from)), v_origin);
+  WHILE v_start < p_to LOOP
+    v_end := v_start + p_interval;
+    v_name := p_parent || '_' || to_char(v_start AT TIME ZONE 'UTC', 'YYYYMMDD');
+    v_in_default := false;
+    IF v_oldest IS NOT NULL AND v_start >= date_bin(p_interval, v_oldest, v_origin) THEN
+      EXECUTE format('SELECT EXISTS (SELECT 1 FROM %s WHERE %I >= %L AND %I < %L)',
+                     v_default, v_key, v_start, v_key, v_end)
+        INTO v_in_default;
+    END IF;
+
+    IF to_regclass('public.' || quote_ident(v_name)) IS NOT NULL OR (v_start < v_first AND NOT v_in_default) THEN
+      NULL;
+    ELSIF NOT v_in_default THEN
+      EXECUTE format(
+        'CREATE TABLE public.%I PARTITION OF public.%I FOR VALUES FROM (%L) TO (%L)',
+        v_name, p_parent, v_start, v_end
+      );
+      v_created := v_created + 1;
+    ELSE
+      -- A range cannot be attached while DEFAULT holds rows in it: move them first
+      EXECUTE format('CREATE TABLE public.%I (LIKE public.%I INCLUDING DEFAULTS)', v_name, p_parent);
+      EXECUTE format(
+        'WITH moved AS (DELETE FROM %s WHERE %I >= %L AND %I < %L RETURNING *) INSERT INTO public.%I SELECT * FROM moved',
+        v_default, v_key, v_start, v_key, v_end, v_name
+      );
+      GET DIAGNOSTICS v_moved = ROW_COUNT;
+      EXECUTE format(
+        'ALTER TABLE public.%I ATTACH PARTITION public.%I FOR VALUES FROM (%L) TO (%L)',
+        p_parent, v_name, v_start, v_end
+      );
+      RAISE NOTICE 'ensure_time_partitions: moved % row(s) from % into %', v_moved, v_default, v_name;
+      v_created := v_created + 1;
+    END IF;
+    v_start := v_end;
+  END LOOP;
+  RETURN v_created;
+END $$;
+
+REVOKE ALL ON FUNCTION public.ensure_time_partitions(text, interval, timestamptz, timestamptz) FROM PUBLIC, anon, authenticated;
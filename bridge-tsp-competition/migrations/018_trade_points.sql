@@ -0,0 +1,10 @@
+-- Migration: Points per closed trade
+-- Written by the bridge with the same partial-close weighting as the daily_stats
+-- points total (trade_stats.position_points), so the historical replay
+-- (replay_engine.py) sums exactly what the live sync summed. NULL for trades
+-- synced before this column existed; the replay keeps stored points for those.
+--
+-- Run this in Supabase SQL Editor
+
+ALTER TABLE public.trades
+  ADD COLUMN IF NOT EXISTS points NUMERIC;
@@ -0,0 +1,126 @@
+"""
+Period Rollups - per participant per day, ISO week, month and season to date
+
+Maintained by the bridge on every sync from the closed trades it already has in
+memory, so reports read one row per participant instead of rebuilding periods
+from daily_stats/trades. Periods follow Thailand time (trade close time).
+
+Only rows whose values changed since the last write are upserted.
+"""
+
+import os
+from datetime import date, datetime, timedelta, timezone
+from core import get_supabase_client, iter_rows
+from tz_config import THAILAND_TZ
+
+PERIOD_TYPES = ('day', 'week', 'month', 'season')
+# Season rollup covers everything the bridge syncs (same start as main.HISTORY_START_DATE)
+SEASON_START = date.fromisoformat(os.getenv("HISTORY_START_DATE", "2026-01-01"))
+
+# (participant_id, period_type, period_start) -> row last written, to skip unchanged periods
+_written = {}
+
+
+def period_start(period_type: str, day):
+    """First date of the day / ISO week (Monday) / month / season containing `day`"""
+    if period_type == 'season':
+        return SEASON_START
+    if period_type == 'week':
+        return day - timedelta(days=day.weekday())
+    if period_type == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def build_period_rows(participant_id: str, closed_trades: list) -> list:
+    """
+    Aggregate closed trades into period_stats rows.
+
+    Args:
+        closed_trades: dicts with close_time (aware datetime), profit, points, symbol, type
+    """
+    periods = {}
+    for trade in closed_trades:
+        day = trade['close_time'].astimezone(THAILAND_TZ).date()
+        profit = trade['profit']
+
+        for period_type in PERIOD_TYPES:
+            key = (period_type, period_start(period_type, day).isoformat())
+            row = periods.get(key)
+            if row is None:
+                row = periods[key] = {
+                    "participant_id": participant_id,
+                    "period_type": period_type,
+                    "period_start": key[1],
+                    "points": 0.0,
+                    "profit": 0.0,
+                    "trade_count": 0,
+                    "wins": 0,
+                    "best_trade": profit,
+                    "best_trade_symbol": trade['symbol'],
+                    "best_trade_type": trade['type'],
+                    "worst_trade": profit,
+                    "worst_trade_symbol": trade['symbol'],
+                    "worst_trade_type": trade['type'],
+                }
+
+            row['points'] += trade['points']
+            row['profit'] += profit
+            row['trade_count'] += 1
+            if profit > 0:
+                row['wins'] += 1
+            if profit > row['best_trade']:
+                row.update(best_trade=profit, best_trade_symbol=trade['symbol'], best_trade_type=trade['type'])
+            if profit < row['worst_trade']:
+                row.update(worst_trade=profit, worst_trade_symbol=trade['symbol'], worst_trade_type=trade['type'])
+
+    rows = list(periods.values())
+    for row in rows:
+        row['points'] = round(row['points'], 2)
+        row['profit'] = round(row['profit'], 2)
+        row['best_trade'] = round(float(row['best_trade']), 2)
+        row['worst_trade'] = round(float(row['worst_trade']), 2)
+    return rows
+
+
+def update_period_stats(participant_id: str, closed_trades: list) -> int:
+    """Upsert the participant's period rows that changed since the last sync. Returns rows written."""
+    supabase = get_supabase_client()
+    try:
+        changed = []
+        for row in build_period_rows(participant_id, closed_trades):
+            key = (participant_id, row['period_type'], row['period_start'])
+            if _written.get(key) != row:
+                changed.append(row)
+
+        if changed:
+            updated_at = datetime.now(timezone.utc).isoformat()
+            supabase.table('period_stats').upsert(
+                [{**row, 'updated_at': updated_at} for row in changed],
+                on_conflict='participant_id,period_type,period_start'
+            ).execute()
+            for row in changed:
+                _written[(participant_id, row['period_type'], row['period_start'])] = row
+            print(f"📅 Updated {len(changed)} period rollup(s)")
+        return len(changed)
+
+    except Exception as e:
+        print(f"❌ Error updating period stats: {e}")
+        return 0
+
+
+def fetch_period_stats(period_type: str, start) -> dict:
+    """All participants' rows for one period (one query, one row per participant)"""
+    rows = iter_rows('period_stats', '*',
+                     where=lambda q: q.eq('period_type', period_type).eq('period_start', start.isoformat()),
+                     keys=('participant_id',))
+    return {row['participant_id']: row for row in rows}
+
+
+def current_rows(period_type: str, start) -> dict:
+    """participant_id -> rollup row for one period as last written by this process (no query)"""
+    start = start.isoformat()
+    return {
+        pid: row for (pid, ptype, pstart), row in _written.items()
+        if ptype == period_type and pstart == start
+    }
@@ -0,0 +1,245 @@
+"""
+Historical Replay - rebuild daily_stats for a date range from the trades table
+
+Streams each participant's trades in close-time order through the same TradeStats
+aggregation the live sync uses (trade_stats), taking a snapshot at the end of every
+Thailand day, so a formula change can be applied to history without a one-off
+backfill script.
+
+Columns that need account state the trades table does not have are kept from the
+existing daily_stats row (balance, equity, floating_pl, peak_equity, equity-based
+max_drawdown, equity_growth_percent, risk ratios, total_lots with open positions).
+Days without a row get them from the closed-trade curve: balance = start balance +
+cumulative profit, equity = balance, closed-trade drawdown, zero risk ratios.
+
+favorite_pair is counted over every position opened by the end of the day, closed
+later or still open (open_positions), in open-time order, the same symbol list the
+live sync passes to TradeStats.stats.
+
+Points come from trades.points, written by the live sync with its partial-close
+weighting (trade_stats.position_points). Trades synced before that column existed
+have no points: stored rows then keep their points value, and only days without a
+stored row count those trades as 0.
+
+Participants run in a process pool; each finished participant is recorded in the
+'replay_stats' checkpoint for its date range so a re-run resumes. Rows are written
+with chunked bulk upserts.
+
+Usage:
+    python replay_engine.py                                # season start .. today
+    python replay_engine.py --start 2026-03-01 --end 2026-03-31 --dry-run
+    python replay_engine.py --participant <uuid> --workers 1
+"""
+
+import os
+import argparse
+from itertools import chain
+from datetime import date, datetime, timedelta, timezone
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from core import get_supabase_client, save_checkpoint, load_checkpoint, iter_rows
+from trade_stats import TradeStats, closed_trade_drawdown
+from tz_config import THAILAND_TZ, thai_day_end
+
+CHECKPOINT_NAME = 'replay_stats'
+UPSERT_CHUNK_ROWS = 500
+SEASON_START = os.getenv("HISTORY_START_DATE", "2026-01-01")
+
+# Risk ratios come from equity snapshots; replayed days without a stored row get zeros
+RISK_COLUMNS = ('sharpe_ratio', 'sortino_ratio', 'calmar_ratio', 'recovery_factor', 'ulcer_index')
+
+
+def _epoch(iso: str) -> float:
+    dt = datetime.fromisoformat(iso.replace('Z', '+00:00'))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def stream_trades(participant_id: str):
+    """Trade records (trade_stats format) in close-time order; 'points' is None if not stored"""
+    rows = iter_rows('trades', 'symbol, type, lot_size, open_time, close_time, profit, points',
+                     where=lambda q: q.eq('participant_id', participant_id).filter('close_time', 'not.is', 'null'),
+                     keys=('close_time', 'position_id'))
+    for row in rows:
+        yield {
+            'profit': row['profit'] or 0,
+            'points': float(row['points']) if row.get('points') is not None else None,
+            'type': row['type'],
+            'symbol': row['symbol'],
+            'open_time': _epoch(row['open_time']) if row.get('open_time') else 0,
+            'close_time': _epoch(row['close_time']),
+            'lot': row['lot_size'] or 0,
+        }
+
+
+def opened_positions(participant_id: str) -> list:
+    """(open time, symbol) of every position, closed or still open, in open-time order"""
+    positions = {}
+    for table in ('trades', 'open_positions'):
+        for row in iter_rows(table, 'position_id, symbol, open_time',
+                             where=lambda q: q.eq('participant_id', participant_id),
+                             keys=('position_id',)):
+            if row.get('symbol'):
+                opened = _epoch(row['open_time']) if row.get('open_time') else 0
+                positions.setdefault(row['position_id'], (opened, row['symbol']))
+    return [(opened, symbol) for opened, _, symbol in sorted((o, pid, sym) for pid, (o, sym) in positions.items())]
+
+
+def replay_days(trades, days: list, opened: list = ()):
+    """
+    Yield (day, snapshot) at the end of each Thailand day in `days` (sorted),
+    consuming `trades` (close-time order) once. `opened` (opened_positions) gives
+    favorite_pair the live sync's symbol list. A snapshot holds the trade_stats
+    columns plus what the account columns are derived from.
+    """
+    stats = TradeStats()
+    points_complete = True
+    pending = next(trades, None)
+    symbols = []
+    for day in days:
+        end = thai_day_end(day)
+        while len(symbols) < len(opened) and opened[len(symbols)][0] < end:
+            symbols.append(opened[len(symbols)][1])
+        while pending is not None and pending['close_time'] < end:
+            if pending['points'] is None:
+                points_complete = False
+                pending = {**pending, 'points': 0}
+            stats.add(pending)
+            pending = next(trades, None)
+        yield day, {
+            'columns': stats.stats(symbols),
+            'total_profit': stats.total_profit,
+            'peak_profit': stats.peak_profit,
+            'max_drawdown_val': stats.max_drawdown_val,
+            'total_lots': round(stats.total_lots, 2),
+            'points_complete': points_complete,
+        }
+
+
+def replay_participant(participant_id: str, start: str, end: str, dry_run: bool) -> dict:
+    """Rebuild one participant's daily_stats rows for start..end (inclusive). Runs in a worker process."""
+    existing = {row['date']: row for row in iter_rows(
+        'daily_stats', '*',
+        where=lambda q: q.eq('participant_id', participant_id).gte('date', start).lte('date', end),
+        keys=('date',),
+    )}
+
+    trades = stream_trades(participant_id)
+    first_trade = next(trades, None)
+    if first_trade is None and not existing:
+        return {'rows': 0, 'changed': 0, 'note': 'no trades or stats'}
+
+    # Days from the first activity (trade close or stored row), at the earliest `start`, to `end`
+    activity = [date.fromisoformat(d) for d in existing]
+    if first_trade is not None:
+        activity.append(datetime.fromtimestamp(first_trade['close_time'], tz=THAILAND_TZ).date())
+    first_day = max(date.fromisoformat(start), min(activity))
+    last_day = date.fromisoformat(end)
+    days = [first_day + timedelta(days=i) for i in range((last_day - first_day).days + 1)]
+
+    all_trades = chain([first_trade], trades) if first_trade is not None else iter(())
+    opened = opened_positions(participant_id)
+    snapshots = [(day.isoformat(), snapshot) for day, snapshot in replay_days(all_trades, days, opened)]
+
+    # Start balance from the latest stored row: its balance minus the profit closed by then
+    start_balance = None
+    for day_str, snapshot in reversed(snapshots):
+        row = existing.get(day_str)
+        if row and row.get('balance') is not None:
+            start_balance = float(row['balance']) - snapshot['total_profit']
+            break
+    if start_balance is None:
+        return {'rows': 0, 'changed': 0, 'note': 'no stored balance to anchor the replay'}
+
+    rows = []
+    peak_balance = start_balance
+    prev_equity = None
+    for day_str, snapshot in snapshots:
+        row = existing.get(day_str)
+        if row is not None:
+            new_row = {**row, **snapshot['columns']}
+            if not snapshot['points_complete']:
+                new_row['points'] = row.get('points')
+        else:
+            balance = round(start_balance + snapshot['total_profit'], 2)
+            drawdown = closed_trade_drawdown(snapshot['total_profit'], snapshot['peak_profit'],
+                                             snapshot['max_drawdown_val'], balance)
+            new_row = {
+                "participant_id": participant_id,
+                "date": day_str,
+                "balance": balance,
+                "equity": balance,
+                **snapshot['columns'],
+                "max_drawdown": round(drawdown, 2),
+                "floating_pl": 0,
+                "total_lots": snapshot['total_lots'],
+                "equity_growth_percent": round((balance - prev_equity) / prev_equity * 100, 2) if prev_equity else 0,
+                "peak_equity": max(peak_balance, balance),
+                **dict.fromkeys(RISK_COLUMNS, 0.0),
+            }
+        if new_row.get('balance') is not None:
+            peak_balance = max(peak_balance, float(new_row['balance']))
+        if new_row.get('equity') is not None:
+            prev_equity = float(new_row['equity'])
+        if new_row != row:
+            rows.append(new_row)
+
+    if not dry_run:
+        supabase = get_supabase_client()
+        for i in range(0, len(rows), UPSERT_CHUNK_ROWS):
+            supabase.table('daily_stats').upsert(rows[i:i + UPSERT_CHUNK_ROWS], on_conflict='participant_id,date').execute()
+
+    return {'rows': len(snapshots), 'changed': len(rows), 'note': ''}
+
+
+def replay(start: str, end: str, participant: str = None, workers: int = 4, dry_run: bool = False, fresh: bool = False):
+    where = (lambda q: q.eq('id', participant)) if participant else None
+    participants = list(iter_rows('participants', 'id, nickname', where=where))
+    if not participants:
+        print("No participants found")
+        return
+
+    span = f"{start}..{end}"
+    state = load_checkpoint(CHECKPOINT_NAME) or {}
+    done = set(state.get('done', [])) if not fresh and state.get('range') == span else set()
+    pending = [p for p in participants if p['id'] not in done]
+    if done:
+        print(f"Resuming {span}: {len(participants) - len(pending)} participants already done")
+
+    failed = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(replay_participant, p['id'], start, end, dry_run): p for p in pending}
+        for future in as_completed(futures):
+            p = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"❌ {p['nickname']}: {e}")
+                continue
+            verb = "would change" if dry_run else "wrote"
+            note = f" ({result['note']})" if result['note'] else ""
+            print(f"✅ {p['nickname']}: {result['rows']} days, {verb} {result['changed']}{note}")
+            if not dry_run:
+                done.add(p['id'])
+                save_checkpoint(CHECKPOINT_NAME, {'range': span, 'done': sorted(done)})
+
+    if failed:
+        print(f"Replay incomplete: {failed} participants failed, re-run to retry them")
+        return
+    if not dry_run:
+        save_checkpoint(CHECKPOINT_NAME, {'range': None, 'done': []})
+    print("Replay complete")
+
+
+if __name__ == '__main__':
+    today = datetime.now(THAILAND_TZ).date().isoformat()
+    parser = argparse.ArgumentParser(description="Rebuild daily_stats from the trades table")
+    parser.add_argument('--start', default=SEASON_START, help='first day (Thailand date, default season start)')
+    parser.add_argument('--end', default=today, help='last day (default today)')
+    parser.add_argument('--participant', help='only this participant id')
+    parser.add_argument('--workers', type=int, default=4, help='participants processed in parallel')
+    parser.add_argument('--dry-run', action='store_true', help='compute and count changes without writing')
+    parser.add_argument('--fresh', action='store_true', help='ignore the checkpoint')
+    args = parser.parse_args()
+    replay(args.start, args.end, args.participant, args.workers, args.dry_run, args.fresh)
@@ -0,0 +1,258 @@
+"""
+Report Engine for TSP Competition
+Generates daily / weekly / monthly / season-to-date competition reports and sends via Telegram
+
+All reports render from the same precomputed aggregates: standings (latest_daily_stats),
+participant names and the period_stats rollups, loaded once per check for every report
+that is due. A report is assembled from fragments (header, standings, top mover, trades,
+summary), each rendered from the slice of the aggregates it shows.
+
+The period last sent per report type is checkpointed, so a restart during the report
+hour does not send the same report twice.
+
+Usage (preview without sending):
+    python report_engine.py week
+"""
+import os
+import re
+import html
+import calendar
+from datetime import datetime, timedelta
+from core import send_telegram_message, save_checkpoint, load_checkpoint, iter_rows
+from period_stats import fetch_period_stats, period_start
+from tz_config import THAILAND_TZ
+
+# Run weekly report on Sunday at 20:00 ICT
+REPORT_DAY = int(os.getenv("WEEKLY_REPORT_DAY", "6"))  # 0=Mon, 6=Sun
+REPORT_HOUR = int(os.getenv("WEEKLY_REPORT_HOUR", "20"))
+# Monthly and season-to-date reports on the last day of the month at REPORT_HOUR;
+# daily report is off unless an hour is set
+MONTHLY_REPORT_ENABLED = os.getenv("MONTHLY_REPORT_ENABLED", "true").lower() == "true"
+SEASON_REPORT_ENABLED = os.getenv("SEASON_REPORT_ENABLED", "true").lower() == "true"
+DAILY_REPORT_HOUR = int(os.getenv("DAILY_REPORT_HOUR", "-1"))
+
+REPORT_TYPES = ('day', 'week', 'month', 'season')
+PERIOD_TITLES = {
+    'day': ("Daily", "Today", "of the Day"),
+    'week': ("Weekly", "This Week", "of the Week"),
+    'month': ("Monthly", "This Month", "of the Month"),
+    'season': ("Season", "This Season", "of the Season"),
+}
+SCHEDULE_CHECKPOINT = 'report_schedule'
+
+_schedule = {}          # report type -> slot (ISO date) of the last report sent
+_schedule_loaded = False
+
+
+def _period_end(period_type: str, start, today):
+    if period_type == 'week':
+        return start + timedelta(days=6)
+    if period_type == 'month':
+        return start.replace(day=calendar.monthrange(start.year, start.month)[1])
+    if period_type == 'season':
+        return today
+    return start
+
+
+def _slot(report_type: str, today):
+    """Schedule slot a report run belongs to (season report is sent once per month)"""
+    if report_type == 'season':
+        return period_start('month', today)
+    return period_start(report_type, today)
+
+
+def _is_due(report_type: str, now) -> bool:
+    """Check if it's time to send the report and it has not been sent for this slot yet"""
+    if report_type == 'day':
+        due = DAILY_REPORT_HOUR >= 0 and now.hour == DAILY_REPORT_HOUR
+    elif report_type == 'week':
+        due = now.weekday() == REPORT_DAY and now.hour == REPORT_HOUR
+    else:
+        enabled = MONTHLY_REPORT_ENABLED if report_type == 'month' else SEASON_REPORT_ENABLED
+        last_day = _period_end('month', period_start('month', now.date()), now.date())
+        due = enabled and now.hour == REPORT_HOUR and now.date() == last_day
+
+    return due and _schedule.get(report_type) != _slot(report_type, now.date()).isoformat()
+
+
+def _load_schedule():
+    global _schedule_loaded
+    if not _schedule_loaded:
+        _schedule.update(load_checkpoint(SCHEDULE_CHECKPOINT) or {})
+        _schedule_loaded = True
+
+
+def load_aggregates(periods: list) -> dict:
+    """
+    Shared inputs for all reports: standings, names and the rollup rows of each
+    (period_type, period_start) requested. O(participants) reads per period.
+    """
+    latest = iter_rows('latest_daily_stats',
+                       "participant_id, points, profit, total_trades, win_rate, max_drawdown, trading_style, date",
+                       keys=('participant_id',))
+
+    return {
+        'latest': {row['participant_id']: row for row in latest},
+        'names': {p['id']: p['nickname'] for p in iter_rows('participants', "id, nickname")},
+        'periods': {(ptype, start): fetch_period_stats(ptype, start) for ptype, start in periods},
+    }
+
+
+def _to_text(fragment_html: str) -> str:
+    return html.unescape(re.sub(r'<[^>]+>', '', fragment_html))
+
+
+def _render_header(inputs) -> str:
+    title, start, end = inputs
+    dates = start if start == end else f"{start} - {end}"
+    return f"<b>📊 {title} Competition Report</b>\n📅 {dates}\n"
+
+
+def _render_standings(inputs) -> str:
+    lines = ["<b>🏆 Current Standings</b>"]
+    medals = ['🥇', '🥈', '🥉']
+    for i, (name, points, profit, point_diff) in enumerate(inputs):
+        medal = medals[i] if i < 3 else f" {i+1}."
+        diff_str = f" (+{point_diff})" if point_diff > 0 else f" ({point_diff})" if point_diff < 0 else ""
+        lines.append(f"{medal} <b>{html.escape(name)}</b> - {points} pts{diff_str} | ${profit:.2f}")
+    lines.append("")
+    return "\n".join(lines)
+
+
+def _render_top_mover(inputs) -> str:
+    of_label, mover = inputs
+    if not mover:
+        return ""
+    name, points = mover
+    return f"<b>🚀 Top Mover {of_label}</b>\n  {html.escape(name)} (+{points} points)\n"
+
+
+def _render_trades(inputs) -> str:
+    of_label, best, worst = inputs
+    lines = []
+    if best:
+        name, trade_type, symbol, profit = best
+        lines.append(f"<b>💰 Best Trade {of_label}</b>")
+        lines.append(f"  {html.escape(name)}: {trade_type} {symbol} +${profit:.2f}")
+    if worst:
+        name, trade_type, symbol, profit = worst
+        lines.append(f"\n<b>📉 Biggest Loss {of_label}</b>")
+        lines.append(f"  {html.escape(name)}: {trade_type} {symbol} ${profit:.2f}")
+    if lines:
+        lines.append("")
+    return "\n".join(lines)
+
+
+def _render_summary(inputs) -> str:
+    title, current_label, total_trades, total_wins, active, field = inputs
+    lines = [f"<b>📈 {title} Summary</b>"]
+    lines.append(f"  Total Trades: {total_trades}")
+    lines.append(f"  Active Traders {current_label}: {active} / {field}")
+    if total_trades:
+        lines.append(f"  Win Rate {current_label}: {total_wins / total_trades * 100:.1f}%")
+    lines.append("")
+    lines.append("─" * 20)
+    lines.append("🤖 <i>Auto-generated by TSP Competition AI</i>")
+    return "\n".join(lines)
+
+
+def render_report(period_type: str, start, aggregates: dict, today=None) -> tuple:
+    """Assemble the (html, text) report for one period from shared aggregates"""
+    today = today or datetime.now(THAILAND_TZ).date()
+    title, current_label, of_label = PERIOD_TITLES[period_type]
+    names = aggregates['names']
+    latest = aggregates['latest']
+    period = aggregates['periods'].get((period_type, start), {})
+    name_of = lambda pid: names.get(pid, 'Unknown')
+
+    ranked = sorted(latest.items(), key=lambda x: x[1].get('points', 0), reverse=True)
+    standings = [
+        (name_of(pid), stats.get('points', 0), float(stats.get('profit') or 0),
+         round(float(period.get(pid, {}).get('points') or 0), 2))
+        for pid, stats in ranked[:10]
+    ]
+
+    mover = None
+    if period:
+        top = max(period.values(), key=lambda r: float(r.get('points') or 0))
+        if float(top.get('points') or 0) > 0:
+            mover = (name_of(top['participant_id']), round(float(top['points']), 2))
+
+    rows = [r for r in period.values() if r.get('trade_count')]
+    best = worst = None
+    if rows:
+        b = max(rows, key=lambda r: float(r['best_trade']))
+        w = min(rows, key=lambda r: float(r['worst_trade']))
+        if float(b['best_trade']) > 0:
+            best = (name_of(b['participant_id']), b['best_trade_type'], b['best_trade_symbol'], float(b['best_trade']))
+        if float(w['worst_trade']) < 0:
+            worst = (name_of(w['participant_id']), w['worst_trade_type'], w['worst_trade_symbol'], float(w['worst_trade']))
+
+    summary = (
+        title, current_label,
+        sum(int(r.get('trade_count') or 0) for r in period.values()),
+        sum(int(r.get('wins') or 0) for r in period.values()),
+        len(rows), len(latest),
+    )
+
+    end = _period_end(period_type, start, today)
+    fragments = [f for f in (
+        _render_header((title, start.isoformat(), end.isoformat())),
+        _render_standings(standings),
+        _render_top_mover((of_label, mover)),
+        _render_trades((of_label, best, worst)),
+        _render_summary(summary),
+    ) if f]
+    return "\n".join(fragments), "\n".join(_to_text(f) for f in fragments)
+
+
+def generate_and_send_report(period_type: str, start=None, aggregates: dict = None) -> bool:
+    """Generate the report for a period (default: the current one) and send via Telegram"""
+    today = datetime.now(THAILAND_TZ).date()
+    if start is None:
+        start = period_start(period_type, today)
+    title = PERIOD_TITLES[period_type][0]
+
+    try:
+        if aggregates is None:
+            aggregates = load_aggregates([(period_type, start)])
+        message, _ = render_report(period_type, start, aggregates, today)
+        send_telegram_message(message, parse_mode="HTML")
+        print(f"[{title} Report] Sent successfully for period starting {start.isoformat()}")
+        return True
+
+    except Exception as e:
+        print(f"[{title} Report] Error: {e}")
+        send_telegram_message(f"⚠️ {title} Report Error:\n{e}")
+        return False
+
+
+def check_reports():
+    """Call this from main loop - only generates reports at their scheduled time"""
+    _load_schedule()
+    now = datetime.now(THAILAND_TZ)
+    today = now.date()
+
+    due = [rt for rt in REPORT_TYPES if _is_due(rt, now)]
+    if not due:
+        return
+
+    periods = [(rt, period_start(rt, today)) for rt in due]
+    try:
+        aggregates = load_aggregates(periods)
+    except Exception as e:
+        print(f"[Reports] Error loading aggregates: {e}")
+        return
+
+    for report_type, start in periods:
+        if generate_and_send_report(report_type, start, aggregates):
+            _schedule[report_type] = _slot(report_type, today).isoformat()
+            save_checkpoint(SCHEDULE_CHECKPOINT, _schedule)
+
+
+if __name__ == '__main__':
+    import sys
+    report_type = sys.argv[1] if len(sys.argv) > 1 else 'week'
+    today = datetime.now(THAILAND_TZ).date()
+    start = period_start(report_type, today)
+    print(render_report(report_type, start, load_aggregates([(report_type, start)]), today)[1])
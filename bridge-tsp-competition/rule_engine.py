@@ -0,0 +1,191 @@
+"""
+Declarative rule evaluation over a participant x metric table.
+
+Rules are plain dicts loaded from a JSON config, e.g.
+
+    {"name": "drawdown", "metric": "max_drawdown", "op": ">=", "value": 10,
+     "trigger": "enter", "rearm": 8, "cooldown_minutes": 60}
+
+and are compiled into parallel NumPy arrays (metric index, operator, threshold,
+trigger, ...). Every rule is then evaluated for every participant with the same
+handful of N x R array operations, so adding a rule adds a column, not a loop
+or a query.
+
+Triggers:
+- level:    condition holds now
+- rise:     condition holds and the metric increased since the previous cycle
+- enter:    condition holds and the rule is armed; re-arms once the metric
+            is back past `rearm` (or value * `rearm_ratio`; defaults to `value`)
+- multiple: metric crossed a multiple of `value` since the previous cycle
+"""
+
+import os
+import json
+import numpy as np
+
+OPS = ('>=', '>', '<=', '<', '==')
+TRIGGERS = ('level', 'rise', 'enter', 'multiple')
+
+
+def resolve_value(value):
+    """Thresholds may be literals or {"env": NAME, "default": x} to allow env overrides"""
+    if isinstance(value, dict):
+        return float(os.getenv(value['env'], value.get('default', 0)))
+    return float(value)
+
+
+def load_rules(path: str) -> list:
+    """Load the 'rules' list from a JSON config file"""
+    with open(path, encoding='utf-8') as f:
+        return json.load(f).get('rules', [])
+
+
+def compile_rules(rules: list, scope: str = 'participant') -> dict:
+    """Compile rules of one scope into parallel arrays for vectorized evaluation"""
+    rules = [r for r in rules if r.get('scope', 'participant') == scope]
+    metrics = []
+    for rule in rules:
+        if rule['metric'] not in metrics:
+            metrics.append(rule['metric'])
+
+    value = np.array([resolve_value(r['value']) for r in rules], dtype=float)
+    rearm = np.array([
+        resolve_value(r['rearm']) if 'rearm' in r
+        else resolve_value(r['value']) * float(r['rearm_ratio']) if 'rearm_ratio' in r
+        else np.nan
+        for r in rules
+    ], dtype=float)
+
+    return {
+        'rules': rules,
+        'names': [r['name'] for r in rules],
+        'metrics': metrics,
+        'metric_idx': np.array([metrics.index(r['metric']) for r in rules], dtype=np.int64),
+        'op': np.array([OPS.index(r.get('op', '>=')) for r in rules], dtype=np.int64),
+        'trigger': np.array([TRIGGERS.index(r.get('trigger', 'level')) for r in rules], dtype=np.int64),
+        'value': value,
+        'rearm': np.where(np.isnan(rearm), value, rearm),
+        'cooldown': np.array([float(r.get('cooldown_minutes', 0)) * 60 for r in rules], dtype=float),
+    }
+
+
+def build_table(rows: dict, metrics: list):
+    """participant_id -> stats dict  =>  (participant ids, N x K float matrix; missing values are 0)"""
+    pids = list(rows)
+    table = np.array(
+        [[float(rows[pid].get(m) or 0) for m in metrics] for pid in pids],
+        dtype=float,
+    ).reshape(len(pids), len(metrics))
+    return pids, table
+
+
+def compare(values: np.ndarray, op: np.ndarray, threshold: np.ndarray) -> np.ndarray:
+    """Element-wise `values <op> threshold` with a per-column operator code"""
+    return np.select(
+        [op == 0, op == 1, op == 2, op == 3, op == 4],
+        [values >= threshold, values > threshold, values <= threshold, values < threshold, values == threshold],
+        default=False,
+    )
+
+
+def evaluate(compiled: dict, current: np.ndarray, previous: np.ndarray,
+             armed: np.ndarray = None, last_fired: np.ndarray = None, now: float = 0.0):
+    """
+    Evaluate all rules for all participants in one pass.
+
+    Args:
+        current, previous: N x K metric tables (same row order, same metric columns)
+        armed, last_fired: N x R rule state (defaults: armed, never fired)
+
+    Returns:
+        (fired N x R bool, armed N x R bool, last_fired N x R float, current values N x R)
+    """
+    n, r = current.shape[0], len(compiled['rules'])
+    if armed is None:
+        armed = np.ones((n, r), dtype=bool)
+    if last_fired is None:
+        last_fired = np.full((n, r), -np.inf)
+
+    idx = compiled['metric_idx']
+    cur = current[:, idx]
+    prev = previous[:, idx]
+    value, op, trigger = compiled['value'], compiled['op'], compiled['trigger']
+
+    cond = compare(cur, op, value)
+    step = np.where(value != 0, value, 1.0)
+    cur_multiple = np.floor(cur / step)
+    crossed = (cur_multiple > np.floor(prev / step)) & (cur_multiple > 0)
+
+    fired = np.select(
+        [trigger == 0, trigger == 1, trigger == 2, trigger == 3],
+        [cond, cond & (cur > prev), cond & armed, crossed],
+        default=False,
+    )
+    fired &= (now - last_fired) >= compiled['cooldown']
+
+    # Hysteresis: 'enter' rules disarm when they fire and re-arm once past `rearm`
+    upward = op <= 1
+    recovered = np.where(upward, cur < compiled['rearm'], cur > compiled['rearm'])
+    armed = np.where(trigger == 2, np.where(fired, False, armed | recovered), True)
+    last_fired = np.where(fired, now, last_fired)
+
+    return fired, armed, last_fired, cur
+
+
+def export_table(pids: list, metrics: list, table: np.ndarray) -> dict:
+    """JSON-friendly metric table for checkpoints"""
+    return {'pids': list(pids), 'metrics': list(metrics), 'values': table.tolist()}
+
+
+def align_table(saved: dict, pids: list, metrics: list) -> np.ndarray:
+    """Re-index a saved metric table onto the current participant/metric order (missing -> 0)"""
+    table = np.zeros((len(pids), len(metrics)))
+    if not saved or not saved.get('pids') or not saved.get('metrics'):
+        return table
+
+    old_rows = {pid: i for i, pid in enumerate(saved['pids'])}
+    old_cols = {m: j for j, m in enumerate(saved['metrics'])}
+    rows = np.array([old_rows.get(pid, -1) for pid in pids], dtype=np.int64)
+    cols = np.array([old_cols.get(m, -1) for m in metrics], dtype=np.int64)
+    if not len(rows) or not len(cols):
+        return table
+
+    values = np.array(saved['values'], dtype=float).reshape(len(old_rows), len(old_cols))
+    known = (rows[:, None] >= 0) & (cols[None, :] >= 0)
+    return np.where(known, values[rows[:, None], cols[None, :]], table)
+
+
+def align_state(state: dict, pids: list, names: list):
+    """
+    Re-index persisted rule state ({'pids', 'rules', 'armed', 'last_fired'}) onto the
+    current participant/rule order. Unknown pairs start armed and never fired.
+    """
+    armed = np.ones((len(pids), len(names)), dtype=bool)
+    last_fired = np.full((len(pids), len(names)), -np.inf)
+    if not state or not state.get('pids') or not state.get('rules'):
+        return armed, last_fired
+
+    old_rows = {pid: i for i, pid in enumerate(state['pids'])}
+    old_cols = {name: j for j, name in enumerate(state['rules'])}
+    rows = np.array([old_rows.get(pid, -1) for pid in pids], dtype=np.int64)
+    cols = np.array([old_cols.get(name, -1) for name in names], dtype=np.int64)
+    if not len(rows) or not len(cols):
+        return armed, last_fired
+
+    old_armed = np.array(state['armed'], dtype=bool).reshape(len(old_rows), len(old_cols))
+    old_fired = np.array(state['last_fired'], dtype=float).reshape(len(old_rows), len(old_cols))
+    old_fired = np.nan_to_num(old_fired, nan=-np.inf)
+    known = (rows[:, None] >= 0) & (cols[None, :] >= 0)
+    armed = np.where(known, old_armed[rows[:, None], cols[None, :]], armed)
+    last_fired = np.where(known, old_fired[rows[:, None], cols[None, :]], last_fired)
+    return armed, last_fired
+
+
+def export_state(pids: list, names: list, armed: np.ndarray, last_fired: np.ndarray) -> dict:
+    """JSON-friendly rule state for checkpoints (never-fired stored as null)"""
+    return {
+        'pids': list(pids),
+        'rules': list(names),
+        'armed': armed.tolist(),
+        'last_fired': [[None if not np.isfinite(t) else float(t) for t in row] for row in last_fired],
+    }
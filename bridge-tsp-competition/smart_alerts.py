@@ -1,60 +1,112 @@
 """
 Smart Alerts Engine for TSP Competition
-Detects notable events and sends Telegram notifications
+Detects notable events and hands them to the alert pipeline for Telegram delivery
 """
 import os
+import time
+import numpy as np
 from datetime import datetime, timezone
-from core import get_supabase_client, send_telegram_message, send_telegram_to_participant
-from tz_config import THAILAND_TZ
+import rule_engine
+from alert_pipeline import dispatch
+from core import get_supabase_client, save_checkpoint, load_checkpoint, iter_rows, filter_literal
 
-# In-memory state to track changes between sync cycles
+# State to track changes between sync cycles (checkpointed to disk after every cycle)
 _previous_state = {
     'rankings': {},        # participant_id -> rank
     'trade_counts': {},    # participant_id -> total_trades
-    'streaks': {},         # participant_id -> current_consecutive_wins
-    'drawdown_alerted': {},# participant_id -> True (to avoid spamming)
-    'initialized': False
+    'metrics': {},         # participant x metric table from the last cycle (rule inputs)
+    'rule_state': {},      # participant x rule armed flags / last fired times (hysteresis, cooldowns)
+    'trade_watermark': {}, # participant_id -> [close_time ISO, position_id] of last alerted trade
+    'watermark_default': None,  # close_time ISO used for participants without a watermark
+    'initialized': False,
+    'saved_at': None
 }
+_state_loaded = False
 
-# Configurable thresholds
-STREAK_THRESHOLD = int(os.getenv("ALERT_STREAK_THRESHOLD", "3"))         # Alert on X consecutive wins
-BIG_TRADE_PROFIT = float(os.getenv("ALERT_BIG_TRADE_PROFIT", "50"))      # $ profit threshold
-BIG_TRADE_LOSS = float(os.getenv("ALERT_BIG_TRADE_LOSS", "-50"))         # $ loss threshold
-DRAWDOWN_WARNING = float(os.getenv("ALERT_DRAWDOWN_PERCENT", "10"))      # % drawdown warning
-MILESTONE_INTERVAL = int(os.getenv("ALERT_MILESTONE_INTERVAL", "50"))    # Every N trades
+# Alert rules (streaks, drawdown, milestones, big trades) are declared in this file
+ALERT_RULES_FILE = os.getenv("ALERT_RULES_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "alert_rules.json"))
+STATE_MAX_AGE_HOURS = float(os.getenv("ALERT_STATE_MAX_AGE_HOURS", "24"))  # Re-initialize if checkpoint is older
 
+STATE_CHECKPOINT = 'smart_alerts'
 
-def check_alerts():
-    """Main alert check - call this after each sync cycle"""
+_rules_cache = {'mtime': None, 'participant': None, 'trade': None}
+
+
+def _load_alert_rules():
+    """Compile alert rules, reloading only when the config file changes"""
+    try:
+        mtime = os.path.getmtime(ALERT_RULES_FILE)
+        if mtime != _rules_cache['mtime']:
+            rules = rule_engine.load_rules(ALERT_RULES_FILE)
+            _rules_cache['participant'] = rule_engine.compile_rules(rules, 'participant')
+            _rules_cache['trade'] = rule_engine.compile_rules(rules, 'trade')
+            _rules_cache['mtime'] = mtime
+            print(f"[Smart Alerts] Loaded {len(rules)} alert rules from {ALERT_RULES_FILE}")
+    except Exception as e:
+        print(f"[Smart Alerts] Error loading alert rules: {e}")
+    return _rules_cache['participant'], _rules_cache['trade']
+
+
+def _restore_state():
+    """Load the last checkpoint once per process so a restart continues without a blind cycle"""
+    global _state_loaded
+    _state_loaded = True
+
+    saved = load_checkpoint(STATE_CHECKPOINT)
+    if not saved or not saved.get('initialized') or not saved.get('saved_at'):
+        return
+
+    age = datetime.now(timezone.utc) - datetime.fromisoformat(saved['saved_at'])
+    if age.total_seconds() > STATE_MAX_AGE_HOURS * 3600:
+        print(f"[Smart Alerts] Checkpoint is {age} old - re-initializing")
+        return
+
+    for key in _previous_state:
+        if key in saved:
+            _previous_state[key] = saved[key]
+    print(f"[Smart Alerts] Restored state for {len(_previous_state['rankings'])} participants (saved {age} ago)")
+
+
+def check_alerts(cycle_stats: dict = None, badge_events: list = None):
+    """
+    Main alert check - call this after each sync cycle.
+
+    Args:
+        cycle_stats: participant_id -> stats_data written by sync_participant this
+                     cycle. Only participants missing from it are read from Supabase.
+        badge_events: badges newly awarded this cycle (achievements.flush_achievements)
+    """
     supabase = get_supabase_client()
     alerts = []
 
-    try:
-        # Fetch current leaderboard (latest daily_stats per participant)
-        stats_res = supabase.table('daily_stats') \
-            .select("participant_id, points, profit, total_trades, max_drawdown, max_consecutive_wins, win_rate, date") \
-            .order('date', desc=True) \
-            .execute()
+    if not _state_loaded:
+        _restore_state()
 
+    try:
         # Fetch participant names
-        participants_res = supabase.table('participants').select("id, nickname").execute()
-        names = {p['id']: p['nickname'] for p in participants_res.data}
-
-        # Get latest stats per participant (first occurrence since sorted desc by date)
-        latest_stats = {}
-        for row in stats_res.data:
-            pid = row['participant_id']
-            if pid not in latest_stats:
-                latest_stats[pid] = row
+        names = {p['id']: p['nickname'] for p in iter_rows('participants', "id, nickname")}
+
+        # Current leaderboard: this cycle's in-memory stats, topped up from the
+        # latest daily_stats row of participants that were not synced
+        latest_stats = dict(cycle_stats or {})
+        missing = [pid for pid in names if pid not in latest_stats]
+        if missing:
+            # All columns, so rules can reference any daily_stats metric
+            where = (lambda q: q.in_('participant_id', missing)) if cycle_stats else None
+            for row in iter_rows('latest_daily_stats', "*", where=where, keys=('participant_id',)):
+                latest_stats[row['participant_id']] = row
 
         # Build current rankings by points (desc)
         ranked = sorted(latest_stats.items(), key=lambda x: x[1].get('points', 0), reverse=True)
         current_rankings = {pid: rank + 1 for rank, (pid, _) in enumerate(ranked)}
 
+        participant_rules, trade_rules = _load_alert_rules()
+
         # --- DETECT EVENTS ---
 
         if not _previous_state['initialized']:
             # First run - just save state, don't alert
+            _previous_state['watermark_default'] = datetime.now(timezone.utc).isoformat()
             _save_state(current_rankings, latest_stats)
             print("[Smart Alerts] Initialized - tracking state from next cycle")
             return
@@ -62,33 +114,92 @@ def check_alerts():
         # 1. Rank Changes
         alerts.extend(_check_rank_changes(current_rankings, names))
 
-        # 2. Win Streaks
-        alerts.extend(_check_win_streaks(latest_stats, names))
+        # 2. Participant rules (streaks, drawdown, milestones, ...) in one vectorized pass
+        if participant_rules:
+            alerts.extend(_evaluate_participant_rules(participant_rules, latest_stats, current_rankings, names))
 
-        # 3. New Big Trades
-        alerts.extend(_check_new_trades(supabase, latest_stats, names))
+        # 3. Trade rules (big wins/losses) over all trades closed since the watermarks
+        new_trades = _fetch_new_trades(supabase, latest_stats)
+        if trade_rules and new_trades:
+            alerts.extend(_evaluate_trade_rules(trade_rules, new_trades, names))
 
-        # 4. Drawdown Warnings
-        alerts.extend(_check_drawdown(latest_stats, names))
-
-        # 5. Trade Milestones
-        alerts.extend(_check_milestones(latest_stats, names))
+        # 4. Newly awarded badges
+        alerts.extend(_badge_alerts(badge_events or [], names))
 
         # Save current state for next cycle
         _save_state(current_rankings, latest_stats)
 
-        # Send alerts
-        if alerts:
-            _send_alerts(alerts)
+        # Dedupe, coalesce and send due digests (also flushes alerts held from earlier cycles)
+        dispatch(alerts)
 
     except Exception as e:
         print(f"[Smart Alerts] Error: {e}")
 
 
+class _Fenwick:
+    """Binary indexed tree over ranks 1..n: counts and k-th smallest lookup in O(log n)"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.tree = [0] * (size + 1)
+        self.top = 1 << size.bit_length()
+
+    def add(self, i: int):
+        while i <= self.size:
+            self.tree[i] += 1
+            i += i & -i
+
+    def prefix(self, i: int) -> int:
+        total = 0
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def kth(self, k: int) -> int:
+        """Smallest rank r with prefix(r) >= k"""
+        pos = 0
+        step = self.top
+        while step:
+            nxt = pos + step
+            if nxt <= self.size and self.tree[nxt] < k:
+                pos = nxt
+                k -= self.tree[nxt]
+            step >>= 1
+        return pos + 1
+
+
+def _find_overtakes(prev_rankings, current_rankings) -> dict:
+    """
+    For every participant who moved up, list who they overtook: others that were
+    ranked above them before (smaller old rank) and are below them now (larger
+    new rank). Sweeps participants in previous-rank order while a Fenwick tree
+    holds the new ranks seen so far, so each query is O(log n) plus output size.
+
+    Returns:
+        participant_id -> [overtaken participant_ids, ordered by new rank]
+    """
+    common = [pid for pid in current_rankings if prev_rankings.get(pid) is not None]
+    by_new_rank = {current_rankings[pid]: pid for pid in common}
+    tree = _Fenwick(max(by_new_rank, default=0))
+
+    overtakes = {}
+    for pid in sorted(common, key=lambda p: prev_rankings[p]):
+        new_rank = current_rankings[pid]
+        if new_rank < prev_rankings[pid]:
+            below = tree.prefix(new_rank)
+            seen = tree.prefix(tree.size)
+            overtakes[pid] = [by_new_rank[tree.kth(k)] for k in range(below + 1, seen + 1)]
+        tree.add(new_rank)
+
+    return overtakes
+
+
 def _check_rank_changes(current_rankings, names):
     """Detect when a trader overtakes another in rankings"""
     alerts = []
     prev = _previous_state['rankings']
+    overtakes = _find_overtakes(prev, current_rankings)
 
     for pid, new_rank in current_rankings.items():
         old_rank = prev.get(pid)
@@ -99,15 +210,9 @@ def _check_rank_changes(current_rankings, names):
 
         # Moved up (smaller rank = better)
         if new_rank < old_rank:
-            # Find who they overtook
-            overtaken = []
-            overtaken_pids = []
-            for other_pid, other_new_rank in current_rankings.items():
-                other_old_rank = prev.get(other_pid)
-                if other_pid != pid and other_old_rank is not None:
-                    if other_old_rank < old_rank and other_new_rank > new_rank:
-                        overtaken.append(names.get(other_pid, 'Unknown'))
-                        overtaken_pids.append(other_pid)
+            # Who they overtook
+            overtaken_pids = overtakes.get(pid, [])
+            overtaken = [names.get(other_pid, 'Unknown') for other_pid in overtaken_pids]
 
             if overtaken:
                 alerts.append({
@@ -138,126 +243,150 @@ def _check_rank_changes(current_rankings, names):
     return alerts
 
 
-def _check_win_streaks(latest_stats, names):
-    """Detect notable win streaks"""
-    alerts = []
-    prev_streaks = _previous_state['streaks']
+class _FormatFields(dict):
+    """Message fields; unknown placeholders render as 0 instead of raising"""
 
-    for pid, stats in latest_stats.items():
-        current_streak = stats.get('max_consecutive_wins', 0)
-        prev_streak = prev_streaks.get(pid, 0)
-        name = names.get(pid, 'Unknown')
+    def __missing__(self, key):
+        return 0
 
-        if current_streak >= STREAK_THRESHOLD and current_streak > prev_streak:
-            alerts.append({
-                'type': 'streak',
-                'icon': '🎯',
-                'participant_id': pid,
-                'message': f"<b>{name}</b> ชนะรวด {current_streak} ไม้ติดต่อกัน!"
-            })
 
-    return alerts
+def _rule_alert(rule, pid, fields):
+    return {
+        'type': rule['name'],
+        'icon': rule.get('icon', '🔔'),
+        'participant_id': pid,
+        'personal_only': rule.get('personal_only', False),
+        'collapse': rule.get('collapse', True),
+        'message': rule['message'].format_map(_FormatFields(fields)),
+    }
 
 
-def _check_new_trades(supabase, latest_stats, names):
-    """Detect big profit/loss trades closed since last check"""
+def _evaluate_participant_rules(compiled, latest_stats, current_rankings, names):
+    """Evaluate every participant rule against the participant x metric table in one pass"""
     alerts = []
-    prev_counts = _previous_state['trade_counts']
+    rows = {pid: {**stats, 'rank': current_rankings.get(pid, 0)} for pid, stats in latest_stats.items()}
+    pids, current = rule_engine.build_table(rows, compiled['metrics'])
+    previous = rule_engine.align_table(_previous_state['metrics'], pids, compiled['metrics'])
+    armed, last_fired = rule_engine.align_state(_previous_state['rule_state'], pids, compiled['names'])
+
+    fired, armed, last_fired, values = rule_engine.evaluate(
+        compiled, current, previous, armed, last_fired, now=time.time()
+    )
+    _previous_state['rule_state'] = rule_engine.export_state(pids, compiled['names'], armed, last_fired)
+
+    value = compiled['value']
+    for i, j in zip(*np.nonzero(fired)):
+        rule = compiled['rules'][j]
+        pid = pids[i]
+        step = value[j] if value[j] else 1
+        fields = {
+            **rows[pid],
+            'name': names.get(pid, 'Unknown'),
+            'value': values[i, j],
+            'milestone': (values[i, j] // step) * step,
+        }
+        alerts.append(_rule_alert(rule, pid, fields))
 
-    for pid, stats in latest_stats.items():
-        current_count = stats.get('total_trades', 0)
-        prev_count = prev_counts.get(pid, 0)
-        name = names.get(pid, 'Unknown')
+    return alerts
 
-        if current_count > prev_count:
-            # New trades closed - fetch the latest ones
-            try:
-                new_trades_res = supabase.table('trades') \
-                    .select("symbol, type, lot_size, profit, open_time, close_time") \
-                    .eq('participant_id', pid) \
-                    .order('close_time', desc=True) \
-                    .limit(current_count - prev_count) \
-                    .execute()
-
-                for trade in new_trades_res.data:
-                    profit = trade['profit']
-                    symbol = trade['symbol']
-                    lot = trade['lot_size']
-                    trade_type = trade['type']
-
-                    if profit >= BIG_TRADE_PROFIT:
-                        alerts.append({
-                            'type': 'big_win',
-                            'icon': '💰',
-                            'participant_id': pid,
-                            'message': f"<b>{name}</b> ปิด {trade_type} {symbol} ({lot} lot) กำไร <b>+${profit:.2f}</b>"
-                        })
-                    elif profit <= BIG_TRADE_LOSS:
-                        alerts.append({
-                            'type': 'big_loss',
-                            'icon': '📉',
-                            'participant_id': pid,
-                            'message': f"<b>{name}</b> ปิด {trade_type} {symbol} ({lot} lot) ขาดทุน <b>${profit:.2f}</b>"
-                        })
-
-            except Exception as e:
-                print(f"[Smart Alerts] Error fetching trades for {name}: {e}")
+
+def _evaluate_trade_rules(compiled, trades, names):
+    """Evaluate every trade rule against the new trades x metric table in one pass"""
+    alerts = []
+    table = np.array(
+        [[float(t.get(m) or 0) for m in compiled['metrics']] for t in trades],
+        dtype=float,
+    ).reshape(len(trades), len(compiled['metrics']))
+
+    fired, _, _, _ = rule_engine.evaluate(compiled, table, table)
+    for i, j in zip(*np.nonzero(fired)):
+        trade = trades[i]
+        pid = trade['participant_id']
+        fields = {**trade, 'name': names.get(pid, 'Unknown')}
+        alerts.append(_rule_alert(compiled['rules'][j], pid, fields))
 
     return alerts
 
 
-def _check_drawdown(latest_stats, names):
-    """Alert when drawdown exceeds threshold"""
-    alerts = []
-    prev_alerted = _previous_state['drawdown_alerted']
+def _badge_alerts(badge_events, names):
+    """One alert per newly awarded badge (events never collapse)"""
+    return [{
+        'type': 'achievement',
+        'icon': event['emoji'],
+        'participant_id': event['participant_id'],
+        'collapse': False,
+        'message': f"<b>{names.get(event['participant_id'], 'Unknown')}</b> ปลดล็อกเหรียญ "
+                   f"<b>{event['badge_label']}</b> — {event['description']}",
+    } for event in badge_events]
 
-    for pid, stats in latest_stats.items():
-        dd = stats.get('max_drawdown', 0)
-        name = names.get(pid, 'Unknown')
 
-        if dd >= DRAWDOWN_WARNING and not prev_alerted.get(pid, False):
-            alerts.append({
-                'type': 'drawdown',
-                'icon': '⚠️',
-                'participant_id': pid,
-                'message': f"<b>{name}</b> มี Max Drawdown ถึง {dd:.1f}% แล้ว!"
-            })
-            _previous_state['drawdown_alerted'][pid] = True
+def _parse_time(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
 
-        elif dd < DRAWDOWN_WARNING * 0.8:
-            # Reset alert when DD recovers below 80% of threshold
-            _previous_state['drawdown_alerted'][pid] = False
 
-    return alerts
+def _trade_key(trade) -> tuple:
+    """Ordering key for the trade watermark: (close_time, position_id)"""
+    return (_parse_time(trade['close_time']), int(trade.get('position_id') or 0))
 
 
-def _check_milestones(latest_stats, names):
-    """Detect trade count milestones"""
-    alerts = []
+def _fetch_new_trades(supabase, latest_stats):
+    """Trades closed since each participant's own watermark (one bulk query for all participants)"""
     prev_counts = _previous_state['trade_counts']
+    watermarks = _previous_state['trade_watermark']
+    default_mark = [_previous_state['watermark_default'], 0]
+
+    grown = [
+        pid for pid, stats in latest_stats.items()
+        if stats.get('total_trades', 0) > prev_counts.get(pid, 0)
+    ]
+    if not grown:
+        return []
+
+    marks = {pid: watermarks.get(pid) or default_mark for pid in grown}
+
+    # Each participant is read from its own watermark, so one idle or first-time
+    # trader does not pull everyone else's history back into the query.
+    # Participants sharing a watermark share a clause.
+    by_since = {}
+    for pid, mark in marks.items():
+        by_since.setdefault(mark[0], []).append(pid)
+    since_filter = '(' + ','.join(
+        f"and(participant_id.in.({','.join(filter_literal(p) for p in pids)}),"
+        f"close_time.gte.{filter_literal(since)})"
+        for since, pids in by_since.items()
+    ) + ')'
+
+    def where(query):
+        # postgrest-py 0.13 has no or_() builder method; the query param is the same thing
+        query.params = query.params.add('or', since_filter)
+        return query.in_('participant_id', grown)
 
-    for pid, stats in latest_stats.items():
-        current = stats.get('total_trades', 0)
-        prev = prev_counts.get(pid, 0)
-        name = names.get(pid, 'Unknown')
-
-        if current == 0:
-            continue
+    try:
+        fetched = list(iter_rows(
+            'trades', "participant_id, position_id, symbol, type, lot_size, profit, open_time, close_time",
+            where=where,
+            keys=('close_time', 'participant_id', 'position_id'),
+        ))
+    except Exception as e:
+        print(f"[Smart Alerts] Error fetching new trades: {e}")
+        return []
 
-        # Check if crossed a milestone boundary
-        current_milestone = (current // MILESTONE_INTERVAL) * MILESTONE_INTERVAL
-        prev_milestone = (prev // MILESTONE_INTERVAL) * MILESTONE_INTERVAL
+    # Group by participant, keeping only trades past that participant's watermark
+    new_by_pid = {}
+    for trade in fetched:
+        pid = trade['participant_id']
+        mark = marks[pid]
+        if _trade_key(trade) > (_parse_time(mark[0]), int(mark[1])):
+            new_by_pid.setdefault(pid, []).append(trade)
 
-        if current_milestone > prev_milestone and current_milestone > 0:
-            win_rate = stats.get('win_rate', 0)
-            alerts.append({
-                'type': 'milestone',
-                'icon': '🏆',
-                'participant_id': pid,
-                'message': f"<b>{name}</b> ครบ {current_milestone} เทรดแล้ว! (Win Rate: {win_rate:.1f}%)"
-            })
+    new_trades = []
+    for pid, trades in new_by_pid.items():
+        trades.sort(key=_trade_key)
+        new_trades.extend(trades)
+        last = trades[-1]
+        watermarks[pid] = [last['close_time'], int(last.get('position_id') or 0)]
 
-    return alerts
+    return new_trades
 
 
 def _save_state(current_rankings, latest_stats):
@@ -267,54 +396,11 @@ def _save_state(current_rankings, latest_stats):
         pid: stats.get('total_trades', 0)
         for pid, stats in latest_stats.items()
     }
-    _previous_state['streaks'] = {
-        pid: stats.get('max_consecutive_wins', 0)
-        for pid, stats in latest_stats.items()
-    }
+    participant_rules = _rules_cache['participant']
+    if participant_rules:
+        rows = {pid: {**stats, 'rank': current_rankings.get(pid, 0)} for pid, stats in latest_stats.items()}
+        pids, table = rule_engine.build_table(rows, participant_rules['metrics'])
+        _previous_state['metrics'] = rule_engine.export_table(pids, participant_rules['metrics'], table)
     _previous_state['initialized'] = True
-
-
-def _send_alerts(alerts):
-    """Bundle and send alerts via Telegram (broadcast + personal)"""
-    time_str = datetime.now(THAILAND_TZ).strftime('%H:%M ICT')
-    header = "🔔 <b>Smart Alert</b>\n"
-    separator = "─" * 20
-
-    # 1. Broadcast public alerts to group chat
-    public_alerts = [a for a in alerts if not a.get('personal_only')]
-    if public_alerts:
-        lines = [header]
-        for alert in public_alerts:
-            lines.append(f"{alert['icon']} {alert['message']}")
-        lines.append(f"\n{separator}")
-        lines.append(f"⏰ {time_str}")
-        message = "\n".join(lines)
-
-        if len(message) > 4000:
-            chunks = [public_alerts[i:i+5] for i in range(0, len(public_alerts), 5)]
-            for chunk in chunks:
-                chunk_lines = [header]
-                for alert in chunk:
-                    chunk_lines.append(f"{alert['icon']} {alert['message']}")
-                send_telegram_message("\n".join(chunk_lines), parse_mode="HTML")
-        else:
-            send_telegram_message(message, parse_mode="HTML")
-
-    # 2. Send personal notifications to each participant
-    personal_map = {}  # participant_id -> [alerts]
-    for alert in alerts:
-        pid = alert.get('participant_id')
-        if pid:
-            if pid not in personal_map:
-                personal_map[pid] = []
-            personal_map[pid].append(alert)
-
-    for pid, participant_alerts in personal_map.items():
-        lines = ["🔔 <b>แจ้งเตือนส่วนตัว</b>\n"]
-        for alert in participant_alerts:
-            lines.append(f"{alert['icon']} {alert['message']}")
-        lines.append(f"\n⏰ {time_str}")
-        personal_msg = "\n".join(lines)
-        send_telegram_to_participant(pid, personal_msg)
-
-    print(f"[Smart Alerts] Sent {len(alerts)} alert(s) ({len(personal_map)} personal)")
+    _previous_state['saved_at'] = datetime.now(timezone.utc).isoformat()
+    save_checkpoint(STATE_CHECKPOINT, _previous_state)
@@ -0,0 +1,226 @@
+"""
+Trade Excursions - maximum adverse / favorable excursion (MAE / MFE) per closed trade
+
+Computed against the M1 bars in the local candle store (candle_store): for every
+trade the bar range [bar containing open_time, bar containing close_time] is found
+with np.searchsorted, and the lowest low / highest high of all ranges are answered
+together per symbol by a vectorized sparse-table range min/max query. Excursions
+are measured from the open price and clipped at zero:
+
+    BUY:  MAE = open - lowest low     MFE = highest high - open
+    SELL: MAE = highest high - open   MFE = open - lowest low
+
+and stored on the trades rows in points (symbol point) and account currency
+(tick value per tick size x lot size). M1 bars include the parts of the open and
+close minutes outside the trade, so very short trades can slightly overstate both.
+
+Incremental: values already stored on the trades table are loaded once per
+participant and reused; only trades without them are computed. Trades whose bars
+are not (yet) in the store stay NULL and are retried on the next sync.
+
+Trades opened before the oldest stored M1 bar (e.g. closed before the store was
+deployed) first have the missing M1 range fetched from MT5 into the store
+(market_data_service.seed_store). Only trades older than the broker's own M1
+history stay NULL; they are not retried while the bridge runs.
+"""
+
+import numpy as np
+from core import iter_rows
+import candle_store
+from market_data_service import normalize_symbol, seed_store, MT5_SERVER_OFFSET_SECONDS
+
+EXCURSION_COLUMNS = ('mae_points', 'mfe_points', 'mae_usd', 'mfe_usd')
+M1_SECONDS = 60
+
+# participant_id -> {position_id: {column: value}}, loaded from the trades table once
+_known = {}
+# broker symbol -> oldest M1 time (UTC) already requested from MT5 for the store this run
+_seeded_from = {}
+
+
+def compute_excursions(times, highs, lows, open_times, close_times, open_prices, is_buy):
+    """
+    Price excursions for many trades on one symbol.
+
+    Args:
+        times, highs, lows: M1 bars (UTC epoch seconds, sorted)
+        open_times, close_times: trade times (UTC epoch seconds)
+        open_prices: trade open prices
+        is_buy: bool per trade
+
+    Returns:
+        (adverse, favorable, valid): price distances >= 0, and a mask of trades whose
+        whole bar range is covered by `times` (other entries are meaningless)
+    """
+    open_times = np.asarray(open_times, dtype=np.int64)
+    close_times = np.asarray(close_times, dtype=np.int64)
+    open_prices = np.asarray(open_prices, dtype=np.float64)
+    is_buy = np.asarray(is_buy, dtype=bool)
+    count = len(open_times)
+    adverse = np.zeros(count)
+    favorable = np.zeros(count)
+    if count == 0 or len(times) == 0:
+        return adverse, favorable, np.zeros(count, dtype=bool)
+
+    open_bars = open_times // M1_SECONDS * M1_SECONDS
+    close_bars = np.maximum(close_times, open_times) // M1_SECONDS * M1_SECONDS
+    lo = np.searchsorted(times, open_bars, side='left')
+    hi = np.searchsorted(times, close_bars, side='right')
+    valid = (open_bars >= times[0]) & (close_bars <= times[-1]) & (hi > lo)
+    if not valid.any():
+        return adverse, favorable, valid
+
+    # Only the bars some trade covers take part in the query
+    lo, hi = lo[valid], hi[valid]
+    first, last = int(lo.min()), int(hi.max())
+    lowest = _range_reduce(np.minimum, lows[first:last], lo - first, hi - first)
+    highest = _range_reduce(np.maximum, highs[first:last], lo - first, hi - first)
+
+    price = open_prices[valid]
+    buy = is_buy[valid]
+    adverse[valid] = np.where(buy, price - lowest, highest - price)
+    favorable[valid] = np.where(buy, highest - price, price - lowest)
+    np.maximum(adverse, 0, out=adverse)
+    np.maximum(favorable, 0, out=favorable)
+    return adverse, favorable, valid
+
+
+def _range_reduce(op, values, lo, hi):
+    """
+    op (np.minimum / np.maximum) over values[lo:hi] for many non-empty ranges.
+
+    Sparse-table query built one level at a time: level k holds op over windows of
+    2**k values (op of two shifted level k-1 arrays), and a range of
+    length L is answered at level floor(log2(L)) from its two overlapping windows.
+    Only the current level is kept, so memory stays O(len(values)) and the work is
+    O(len(values) * log(longest range)) regardless of how many ranges overlap.
+    """
+    lo = np.asarray(lo, dtype=np.int64)
+    hi = np.asarray(hi, dtype=np.int64)
+    result = np.empty(len(lo))
+    levels = np.floor(np.log2(hi - lo)).astype(np.int64)
+
+    table = np.asarray(values, dtype=np.float64)
+    for level in range(int(levels.max()) + 1):
+        if level:
+            half = 1 << (level - 1)
+            table = op(table[:-half], table[half:])
+        at_level = np.flatnonzero(levels == level)
+        if len(at_level):
+            width = 1 << level
+            result[at_level] = op(table[lo[at_level]], table[hi[at_level] - width])
+    return result
+
+
+def _load_known(participant_id: str) -> dict:
+    """Excursions already stored for a participant's trades (read once, then kept in memory)"""
+    if participant_id not in _known:
+        rows = iter_rows('trades', 'position_id, ' + ', '.join(EXCURSION_COLUMNS),
+                         where=lambda q: q.eq('participant_id', participant_id).not_.is_('mae_points', 'null'),
+                         keys=('position_id',))
+        _known[participant_id] = {
+            int(row['position_id']): {column: row[column] for column in EXCURSION_COLUMNS} for row in rows
+        }
+    return _known[participant_id]
+
+
+def _symbol_excursions(symbol: str, trades: list, sym_info) -> dict:
+    """position_id -> excursion columns for one broker symbol's trades (covered trades only)"""
+    bars = candle_store.read(normalize_symbol(symbol), 'M1')
+    adverse, favorable, valid = compute_excursions(
+        bars['time'], bars['high'], bars['low'],
+        [pos['open_time'] - MT5_SERVER_OFFSET_SECONDS for _, pos in trades],
+        [pos['close_time'] - MT5_SERVER_OFFSET_SECONDS for _, pos in trades],
+        [pos['open_price'] for _, pos in trades],
+        [pos['type'] == 'BUY' for _, pos in trades],
+    )
+    lots = np.array([pos['original_lot'] for _, pos in trades], dtype=np.float64)
+    usd_per_price = lots * (sym_info.trade_tick_value / sym_info.trade_tick_size)
+
+    mae_points = np.round(adverse / sym_info.point, 1).tolist()
+    mfe_points = np.round(favorable / sym_info.point, 1).tolist()
+    mae_usd = np.round(adverse * usd_per_price, 2).tolist()
+    mfe_usd = np.round(favorable * usd_per_price, 2).tolist()
+
+    return {
+        trades[i][0]: {
+            'mae_points': mae_points[i],
+            'mfe_points': mfe_points[i],
+            'mae_usd': mae_usd[i],
+            'mfe_usd': mfe_usd[i],
+        }
+        for i in np.flatnonzero(valid)
+    }
+
+
+def add_excursions(participant_id: str, trades_data: list, positions: dict, symbol_cache: dict) -> int:
+    """
+    Set the MAE/MFE columns on trades rows (in place) before they are upserted.
+
+    Args:
+        trades_data: trades rows from sync_participant (with position_id)
+        positions: position_id -> grouped position (MT5 server timestamps)
+        symbol_cache: broker symbol -> mt5.symbol_info
+
+    Returns:
+        Number of trades computed this call
+    """
+    try:
+        known = _load_known(participant_id)
+    except Exception as e:
+        # Leave the columns out: writing NULLs could erase values we failed to read
+        print(f"[Excursion] Error loading stored excursions: {e}")
+        return 0
+
+    by_symbol = {}
+    for row in trades_data:
+        pid = row['position_id']
+        if pid not in known:
+            pos = positions[pid]
+            by_symbol.setdefault(pos['symbol'], []).append((pid, pos))
+
+    # Trades opened before the oldest stored M1 bar: fetch the missing range from MT5
+    # once, then settle those the broker has no M1 history for as NULL
+    empty = dict.fromkeys(EXCURSION_COLUMNS)
+    for symbol in list(by_symbol):
+        trades = by_symbol[symbol]
+        open_bars = [(pos['open_time'] - MT5_SERVER_OFFSET_SECONDS) // M1_SECONDS * M1_SECONDS for _, pos in trades]
+        first = candle_store.first_time(normalize_symbol(symbol), 'M1')
+        if first is None or min(open_bars) >= first:
+            continue
+        oldest = min(open_bars)
+        if oldest < _seeded_from.get(symbol, first):
+            try:
+                seeded = seed_store(symbol, normalize_symbol(symbol), 'M1', since=oldest)
+                if seeded:
+                    print(f"[Excursion] Fetched {seeded} older {symbol} M1 bar(s) from MT5")
+                _seeded_from[symbol] = oldest
+            except Exception as e:
+                print(f"[Excursion] Error fetching older {symbol} M1 bars: {e}")
+                continue
+            first = candle_store.first_time(normalize_symbol(symbol), 'M1')
+        for (pid, _), open_bar in zip(trades, open_bars):
+            if open_bar < first:
+                known[pid] = empty
+        by_symbol[symbol] = [(pid, pos) for (pid, pos), open_bar in zip(trades, open_bars) if open_bar >= first]
+
+    computed = 0
+    for symbol, trades in by_symbol.items():
+        sym_info = symbol_cache.get(symbol)
+        if not sym_info or sym_info.point <= 0 or sym_info.trade_tick_size <= 0:
+            continue
+        try:
+            result = _symbol_excursions(symbol, trades, sym_info)
+        except Exception as e:
+            print(f"[Excursion] Error computing {symbol}: {e}")
+            continue
+        known.update(result)
+        computed += len(result)
+
+    # Every row carries the columns so the bulk upsert has one shape
+    for row in trades_data:
+        row.update(known.get(row['position_id'], empty))
+
+    if computed:
+        print(f"[Excursion] Computed MAE/MFE for {computed} trades")
+    return computed
@@ -0,0 +1,238 @@
+"""
+Trade Statistics - the trade-derived daily_stats columns
+
+Shared by the live sync (main.sync_participant) and the historical replay
+(replay_engine), so a formula change applies to both. Trades are fed in close-time
+order; stats() can be called at any point (e.g. at each day end during a replay)
+and reflects the trades added so far.
+
+Trade records:
+    {'profit', 'points', 'type' ('BUY'/'SELL'), 'symbol',
+     'open_time', 'close_time' (UTC epoch seconds, 0 = unknown), 'lot'}
+"""
+
+from collections import Counter
+from datetime import datetime, timezone
+
+# Session windows by UTC open hour (overlapping, as traded)
+SESSIONS = {
+    'asian': (0, 8),
+    'london': (7, 16),
+    'newyork': (12, 21),
+}
+
+
+def format_duration(seconds):
+    m, s = divmod(seconds, 60)
+    h, m = divmod(m, 60)
+    d, h = divmod(h, 24)
+    if d > 0: return f"{int(d)}d {int(h)}h"
+    if h > 0: return f"{int(h)}h {int(m)}m"
+    return f"{int(m)}m {int(s)}s"
+
+
+def position_points(pos: dict, point: float) -> float:
+    """Points of a grouped MT5 position, each partial close weighted by its share of the lot"""
+    points = 0
+    for partial in pos['partials']:
+        if pos['type'] == 'BUY':
+            p_diff = partial['close_price'] - pos['open_price']
+        else:
+            p_diff = pos['open_price'] - partial['close_price']
+        points += (p_diff / point) * (partial['lot'] / pos['original_lot'])
+    return points
+
+
+def closed_trade_drawdown(total_profit: float, peak_profit: float, max_drawdown_val: float, balance: float) -> float:
+    """Max drawdown % of the closed-trade profit curve, relative to the peak balance"""
+    start_balance = balance - total_profit
+    peak_balance = start_balance + peak_profit
+    return (max_drawdown_val / peak_balance * 100) if peak_balance > 0 else 0
+
+
+class TradeStats:
+    """Running aggregate over closed trades added in close-time order"""
+
+    def __init__(self):
+        self.total_trades = 0
+        self.total_profit = 0
+        self.total_points = 0
+        self.total_lots = 0
+        self.gross_profit = 0
+        self.gross_loss = 0
+        self.wins = 0
+        self.losses = 0
+        self.best_trade = -float('inf')
+        self.worst_trade = float('inf')
+        self.buy_trades = 0
+        self.buy_wins = 0
+        self.sell_trades = 0
+        self.sell_wins = 0
+        # Closed-trade profit curve
+        self.peak_profit = -float('inf')
+        self.current_profit_curve = 0
+        self.max_drawdown_val = 0
+        # Streaks
+        self.current_consecutive_wins = 0
+        self.current_consecutive_losses = 0
+        self.max_consecutive_wins = 0
+        self.max_consecutive_losses = 0
+        # Holding time
+        self.total_duration = 0
+        self.duration_count = 0
+        self.win_duration = 0
+        self.win_duration_count = 0
+        self.loss_duration = 0
+        self.loss_duration_count = 0
+        self.session_stats = {name: {'profit': 0, 'wins': 0, 'total': 0} for name in SESSIONS}
+        self.symbols = Counter()
+
+    def add(self, trade: dict):
+        profit = trade['profit']
+        self.total_trades += 1
+        self.total_profit += profit
+        self.total_points += trade.get('points', 0)
+        self.total_lots += trade.get('lot', 0) or 0
+        if trade.get('symbol'):
+            self.symbols[trade['symbol']] += 1
+
+        if profit > 0:
+            self.wins += 1
+            self.gross_profit += profit
+        elif profit < 0:
+            self.losses += 1
+            self.gross_loss += abs(profit)
+
+        if profit > self.best_trade:
+            self.best_trade = profit
+        if profit < self.worst_trade:
+            self.worst_trade = profit
+
+        # Long/Short stats
+        if trade['type'] == 'BUY':
+            self.buy_trades += 1
+            if profit > 0:
+                self.buy_wins += 1
+        elif trade['type'] == 'SELL':
+            self.sell_trades += 1
+            if profit > 0:
+                self.sell_wins += 1
+
+        # DD Calculation (ordered by close_time)
+        self.current_profit_curve += profit
+        if self.current_profit_curve > self.peak_profit:
+            self.peak_profit = self.current_profit_curve
+        dd = self.peak_profit - self.current_profit_curve
+        if dd > self.max_drawdown_val:
+            self.max_drawdown_val = dd
+
+        # Consecutive wins/losses
+        if profit > 0:
+            self.current_consecutive_wins += 1
+            self.current_consecutive_losses = 0
+            if self.current_consecutive_wins > self.max_consecutive_wins:
+                self.max_consecutive_wins = self.current_consecutive_wins
+        elif profit < 0:
+            self.current_consecutive_losses += 1
+            self.current_consecutive_wins = 0
+            if self.current_consecutive_losses > self.max_consecutive_losses:
+                self.max_consecutive_losses = self.current_consecutive_losses
+
+        open_time, close_time = trade.get('open_time') or 0, trade.get('close_time') or 0
+
+        # Session stats
+        if open_time > 0:
+            open_hour = datetime.fromtimestamp(open_time, tz=timezone.utc).hour
+            for name, (start_hour, end_hour) in SESSIONS.items():
+                if start_hour <= open_hour < end_hour:
+                    session = self.session_stats[name]
+                    session['profit'] += profit
+                    session['total'] += 1
+                    if profit > 0:
+                        session['wins'] += 1
+
+        # Holding time
+        if open_time > 0 and close_time > 0:
+            duration = close_time - open_time
+            if duration >= 0:
+                self.total_duration += duration
+                self.duration_count += 1
+                if profit > 0:
+                    self.win_duration += duration
+                    self.win_duration_count += 1
+                elif profit < 0:
+                    self.loss_duration += duration
+                    self.loss_duration_count += 1
+
+    def closed_trade_drawdown(self, balance: float) -> float:
+        return closed_trade_drawdown(self.total_profit, self.peak_profit, self.max_drawdown_val, balance)
+
+    def stats(self, symbols: list = None) -> dict:
+        """
+        Trade-derived daily_stats columns.
+
+        Args:
+            symbols: symbols for favorite_pair (default: symbols of the trades added).
+                     The live sync passes every position's symbol, open ones included.
+        """
+        total_trades = self.total_trades
+        win_rate = (self.wins / total_trades * 100) if total_trades > 0 else 0
+        win_rate_buy = (self.buy_wins / self.buy_trades * 100) if self.buy_trades > 0 else 0
+        win_rate_sell = (self.sell_wins / self.sell_trades * 100) if self.sell_trades > 0 else 0
+
+        gross_profit, gross_loss = self.gross_profit, self.gross_loss
+        profit_factor = (gross_profit / gross_loss) if gross_loss > 0 else (gross_profit if gross_profit > 0 else 0)
+
+        # Avg Win / Loss
+        avg_win = (gross_profit / self.wins) if self.wins > 0 else 0
+        avg_loss = -(gross_loss / self.losses) if self.losses > 0 else 0
+
+        # RR Ratio
+        rr_ratio = abs(avg_win / avg_loss) if avg_loss != 0 else 0
+
+        avg_holding_seconds = (self.total_duration / self.duration_count) if self.duration_count > 0 else 0
+        avg_win_holding_seconds = (self.win_duration / self.win_duration_count) if self.win_duration_count > 0 else 0
+        avg_loss_holding_seconds = (self.loss_duration / self.loss_duration_count) if self.loss_duration_count > 0 else 0
+
+        # Trading Style
+        avg_holding_minutes = avg_holding_seconds / 60
+        if self.duration_count == 0:
+            trading_style = "Unknown"
+        elif avg_holding_minutes < 30:
+            trading_style = "Scalping"
+        elif avg_holding_minutes < 1440:
+            trading_style = "Intraday"
+        else:
+            trading_style = "Swing"
+
+        # Favorite Pair
+        favorite_pair = "-"
+        counts = Counter(symbols) if symbols is not None else self.symbols
+        if counts:
+            favorite_pair = counts.most_common(1)[0][0]
+
+        sessions = self.session_stats
+        return {
+            "profit": self.total_profit,
+            "points": int(self.total_points),
+            "win_rate": win_rate,
+            "total_trades": total_trades,
+            "profit_factor": round(profit_factor, 2),
+            "rr_ratio": round(rr_ratio, 2),
+            "avg_win": round(avg_win, 2),
+            "avg_loss": round(avg_loss, 2),
+            "trading_style": trading_style,
+            "favorite_pair": favorite_pair,
+            "avg_holding_time": format_duration(avg_holding_seconds),
+            "best_trade": float(self.best_trade) if self.best_trade != -float('inf') else 0,
+            "worst_trade": float(self.worst_trade) if self.worst_trade != float('inf') else 0,
+            "win_rate_buy": round(win_rate_buy, 2),
+            "win_rate_sell": round(win_rate_sell, 2),
+            "avg_holding_time_win": format_duration(avg_win_holding_seconds),
+            "avg_holding_time_loss": format_duration(avg_loss_holding_seconds),
+            "max_consecutive_wins": self.max_consecutive_wins,
+            "max_consecutive_losses": self.max_consecutive_losses,
+            **{f"session_{name}_profit": round(sessions[name]['profit'], 2) for name in SESSIONS},
+            **{f"session_{name}_win_rate": round((sessions[name]['wins'] / sessions[name]['total'] * 100), 2)
+               if sessions[name]['total'] > 0 else 0 for name in SESSIONS},
+        }
@@ -1,3 +1,11 @@
-from datetime import timezone, timedelta
+from datetime import date, datetime, timezone, timedelta
 
 THAILAND_TZ = timezone(timedelta(hours=7))
+
+
+def thai_day_end(day) -> float:
+    """UTC epoch of the end of a Thailand calendar day (next Thai midnight); day is a date or 'YYYY-MM-DD'"""
+    if isinstance(day, str):
+        day = date.fromisoformat(day)
+    next_day = day + timedelta(days=1)
+    return datetime(next_day.year, next_day.month, next_day.day, tzinfo=THAILAND_TZ).timestamp()